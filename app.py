@@ -1,10 +1,18 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for, session, send_from_directory
+from flask import Flask, render_template, jsonify, request, redirect, url_for, session, send_from_directory, Response, make_response, g
 from flask_cors import CORS
 import os
 import sys
-from datetime import datetime
+import json
+import itertools
+import re
+import secrets
+from functools import wraps
+from datetime import datetime, timezone, timedelta
 # Importar la base de datos unificada
-from database import PortfolioDatabase
+from database import PortfolioDatabase, decode_cursor
+from password_hasher import PasswordHasher, HasherBusy, DEFAULT_ITERATIONS
+from cart_store import create_cart_store
+from background import PeriodicTask
 
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
@@ -18,8 +26,73 @@ app = Flask(__name__, template_folder='.')
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'tu_clave_secreta_aqui')
 CORS(app)
 
-# Inicializar la base de datos
-db = PortfolioDatabase()
+# Hash de contraseñas en un pool de procesos acotado (factor de trabajo configurable)
+password_hasher = PasswordHasher(
+    workers=int(os.environ.get('PASSWORD_HASH_WORKERS', 2)),
+    max_pending=int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 32)),
+    iterations=int(os.environ.get('PASSWORD_HASH_ITERATIONS', DEFAULT_ITERATIONS))
+)
+
+# Inicializar la base de datos (pool y perfil de almacenamiento configurables por entorno)
+db = PortfolioDatabase(
+    pool_size=int(os.environ.get('DB_POOL_SIZE', 8)),
+    pool_max_uses=int(os.environ.get('DB_POOL_MAX_USES', 1000)),
+    storage_profile=os.environ.get('DB_STORAGE_PROFILE', 'default'),
+    catalog_cache_ttl=float(os.environ.get('CATALOG_CACHE_TTL', 30)),
+    catalog_cache_entries=int(os.environ.get('CATALOG_CACHE_ENTRIES', 256)),
+    password_hasher=password_hasher
+)
+
+# Carritos del e-commerce en el servidor: 'sqlite' (tabla cart_items) o 'memory' (LRU del proceso)
+cart_store = create_cart_store(
+    os.environ.get('CART_STORE', 'sqlite'), db,
+    max_carts=int(os.environ.get('CART_STORE_MAX_CARTS', 10000))
+)
+
+# Tamaño de página para listados con paginación keyset
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def conditional_get(*tables):
+    """GET condicional (ETag / Last-Modified) para listados de solo lectura.
+
+    El ETag se forma con los contadores de cambios de las tablas indicadas,
+    de modo que un If-None-Match vigente se responde con 304 sin ejecutar la
+    vista (ni consultas ni serialización). Sin tablas, el ETag es el hash del
+    cuerpo generado (contenido estático).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not tables:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200:
+                    response.add_etag()
+                    response.headers['Cache-Control'] = 'no-cache'
+                return response.make_conditional(request)
+
+            try:
+                versions = db.get_table_versions(tables)
+            except Exception:
+                versions = {}
+            if len(versions) != len(tables):
+                return view(*args, **kwargs)
+            etag = '-'.join(f"{table}.{versions[table][0]}" for table in tables)
+            last_modified = datetime.fromtimestamp(max(v[1] for v in versions.values()), timezone.utc)
+
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
 
 @app.route('/')
 def index():
@@ -29,6 +102,7 @@ def index():
 # ==================== RUTAS DEL EMPLOYEE MANAGER ====================
 
 @app.route('/api/employees', methods=['GET'])
+@conditional_get('employees')
 def get_employees():
     """Obtener todos los empleados"""
     try:
@@ -179,6 +253,13 @@ def delete_employee(employee_id):
 
 # ==================== RUTAS DE AUTENTICACIÓN ====================
 
+def _hasher_busy_response(error):
+    """429 cuando el servicio de hash de contraseñas está saturado"""
+    response = jsonify({'success': False, 'error': str(error)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
 @app.route('/api/auth/login', methods=['POST'])
 def login():
     """Iniciar sesión"""
@@ -214,6 +295,8 @@ def login():
                 'success': False,
                 'error': 'Credenciales inválidas'
             }), 401
+    except HasherBusy as e:
+        return _hasher_busy_response(e)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -282,6 +365,8 @@ def register():
             return jsonify({'success': True, 'data': {'id': user_id}}), 201
         else:
             return jsonify({'success': False, 'error': 'No se pudo crear la cuenta'}), 500
+    except HasherBusy as e:
+        return _hasher_busy_response(e)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -304,6 +389,8 @@ def reset_password():
             return jsonify({'success': False, 'error': 'No se pudo actualizar la contraseña'}), 500
         # En un sistema real, se enviaría por correo. Aquí devolvemos la temporal para el entorno demo.
         return jsonify({'success': True, 'message': 'Se generó una contraseña temporal', 'data': {'temporary_password': temp}})
+    except HasherBusy as e:
+        return _hasher_busy_response(e)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -311,6 +398,7 @@ def reset_password():
 # ==================== RUTAS PARA PERSONAL FINANCE TRACKER ====================
 
 @app.route('/api/finance/categories', methods=['GET'])
+@conditional_get('categories')
 def get_categories():
     """Obtener todas las categorías"""
     try:
@@ -412,19 +500,59 @@ def add_transaction():
 
 @app.route('/api/finance/transactions/<int:user_id>', methods=['GET'])
 def get_user_transactions(user_id):
-    """Obtener transacciones de un usuario con filtros opcionales"""
+    """Obtener transacciones de un usuario con filtros opcionales.
+
+    - Sin limit/after: lista completa (comportamiento original).
+    - limit/after: paginación keyset; la respuesta incluye next_cursor.
+    - format=ndjson: una transacción por línea, en streaming desde el cursor.
+    """
     try:
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         category_id = request.args.get('category_id')
-        
+        category_id = int(category_id) if category_id else None
+        after = request.args.get('after')
+        limit = request.args.get('limit')
+
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                return jsonify({'success': False, 'error': 'limit debe ser entero'}), 400
+            if limit <= 0 or limit > MAX_PAGE_SIZE:
+                return jsonify({'success': False, 'error': f'limit debe estar entre 1 y {MAX_PAGE_SIZE}'}), 400
+
+        if request.args.get('format') == 'ndjson':
+            try:
+                after_values = decode_cursor(after, 3) if after else None
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+            rows = db.iter_transactions_by_user(user_id, start_date, end_date, category_id, after=after_values)
+            if limit:
+                rows = itertools.islice(rows, limit)
+            lines = (json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+            return Response(lines, mimetype='application/x-ndjson')
+
+        if limit is not None or after:
+            try:
+                transactions, next_cursor = db.get_transactions_page(
+                    user_id, limit or DEFAULT_PAGE_SIZE, after, start_date, end_date, category_id
+                )
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+            return jsonify({
+                'success': True,
+                'data': transactions,
+                'next_cursor': next_cursor
+            })
+
         transactions = db.get_transactions_by_user(
             user_id=user_id,
             start_date=start_date,
             end_date=end_date,
-            category_id=int(category_id) if category_id else None
+            category_id=category_id
         )
-        
+
         return jsonify({
             'success': True,
             'data': transactions
@@ -523,10 +651,18 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'database': {
+            'pool': db.pool_stats(),
+            'catalog_cache': db.catalog_cache.stats()
+        },
+        'password_hasher': password_hasher.stats(),
+        'credential_cache': db.credentials.stats(),
+        'reservation_sweeper': reservation_sweeper.stats()
     })
 
 @app.route('/api/projects', methods=['GET'])
+@conditional_get()
 def get_projects():
     """Obtener lista de proyectos disponibles"""
     projects = [
@@ -654,17 +790,22 @@ def _require_admin():
     return False, 'Debe iniciar sesión como administrador'
 
 @app.route('/api/ecommerce/products', methods=['GET'])
+@conditional_get('products')
 def ecommerce_list_products():
-    """Listar productos con filtros opcionales: q, category y id"""
+    """Listar productos con filtros opcionales: q, category, id y limit.
+    q es una búsqueda de texto completo ordenada por relevancia."""
     try:
         q = request.args.get('q')
         category = request.args.get('category')
         product_id = request.args.get('id', type=int)
+        limit = request.args.get('limit', type=int)
+        if limit is not None:
+            limit = max(1, min(limit, MAX_PAGE_SIZE))
         if product_id:
             product = db.get_product_by_id(product_id)
             products = [product] if product else []
         else:
-            products = db.get_products(q, category)
+            products = db.get_products(q, category, limit=limit)
         return jsonify({'success': True, 'data': products})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -740,15 +881,108 @@ def ecommerce_delete_product(product_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# Operaciones masivas de productos (solo admin): cuerpo JSON (array u objeto
+# con 'items') o NDJSON (un objeto por línea, Content-Type application/x-ndjson)
+MAX_BULK_ITEMS = 50000
+
+def _read_bulk_items():
+    """Lee los items de una petición masiva; ValueError si el cuerpo no es válido"""
+    if request.mimetype in ('application/x-ndjson', 'application/ndjson'):
+        items = []
+        for line_number, line in enumerate(request.get_data(as_text=True).splitlines(), start=1):
+            if line.strip():
+                try:
+                    items.append(json.loads(line))
+                except ValueError:
+                    raise ValueError(f'Línea {line_number}: JSON inválido')
+    else:
+        data = request.get_json(silent=True)
+        items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        raise ValueError('Se esperaba una lista de elementos no vacía')
+    if len(items) > MAX_BULK_ITEMS:
+        raise ValueError(f'Máximo {MAX_BULK_ITEMS} elementos por petición')
+    return items
+
+def _bulk_response(results):
+    if results is None:
+        return jsonify({'success': False, 'error': 'No se pudo completar la operación'}), 500
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return jsonify({'success': True, 'data': {'results': results, 'summary': summary}})
+
+def _bulk_products_endpoint(operation):
+    ok, err = _require_admin()
+    if not ok:
+        return jsonify({'success': False, 'error': err}), 401
+    try:
+        items = _read_bulk_items()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return _bulk_response(operation(items))
+
+@app.route('/api/ecommerce/admin/products/bulk', methods=['POST'])
+def ecommerce_bulk_upsert_products():
+    """Crear (sin id) o actualizar (con id) varios productos en una transacción"""
+    try:
+        return _bulk_products_endpoint(db.bulk_upsert_products)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/ecommerce/admin/products/bulk/adjust', methods=['POST'])
+def ecommerce_bulk_adjust_products():
+    """Ajustar precio/stock (stock_delta relativo) de varios productos"""
+    try:
+        return _bulk_products_endpoint(db.bulk_adjust_products)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/ecommerce/admin/products/bulk/delete', methods=['POST'])
+def ecommerce_bulk_delete_products():
+    """Eliminar varios productos: lista de ids u objetos {id}"""
+    try:
+        return _bulk_products_endpoint(db.bulk_delete_products)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # Órdenes (solo admin)
 @app.route('/api/ecommerce/admin/orders', methods=['GET'])
 def ecommerce_list_orders():
+    """Listar pedidos. Con limit/after (o cualquier filtro: status, email,
+    start_date, end_date, expand=items) devuelve una página keyset con
+    next_cursor; sin parámetros, la lista completa (compatibilidad)."""
     try:
         ok, err = _require_admin()
         if not ok:
             return jsonify({'success': False, 'error': err}), 401
-        orders = db.get_orders()
-        return jsonify({'success': True, 'data': orders})
+
+        page_params = ('limit', 'after', 'status', 'email', 'start_date', 'end_date', 'expand')
+        if not any(p in request.args for p in page_params):
+            orders = db.get_orders()
+            return jsonify({'success': True, 'data': orders})
+
+        limit = request.args.get('limit', DEFAULT_PAGE_SIZE)
+        try:
+            limit = int(limit)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'limit debe ser entero'}), 400
+        if limit <= 0 or limit > MAX_PAGE_SIZE:
+            return jsonify({'success': False, 'error': f'limit debe estar entre 1 y {MAX_PAGE_SIZE}'}), 400
+
+        try:
+            orders, next_cursor = db.get_orders_page(
+                limit=limit,
+                after=request.args.get('after'),
+                status=request.args.get('status'),
+                customer_email=request.args.get('email'),
+                start_date=request.args.get('start_date'),
+                end_date=request.args.get('end_date'),
+                expand_items=request.args.get('expand') == 'items'
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        return jsonify({'success': True, 'data': orders, 'next_cursor': next_cursor})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -765,24 +999,181 @@ def ecommerce_get_order(order_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-# -------- Carrito en sesión --------
-def _get_cart():
-    cart = session.get('cart')
-    if not cart:
-        cart = {}
-        session['cart'] = cart
-    return cart
+# -------- Analítica de ventas (solo admin) --------
+# Se calcula sobre product_sales_daily (agregados diarios por producto)
+ANALYTICS_DEFAULT_DAYS = 30
+
+
+def _analytics_range():
+    """Rango start_date/end_date (YYYY-MM-DD, inclusivo) de la petición.
+    Por defecto, los últimos ANALYTICS_DEFAULT_DAYS días (UTC, como created_at).
+    Devuelve (start_date, end_date, error)."""
+    dates = {}
+    for name in ('start_date', 'end_date'):
+        value = request.args.get(name)
+        if value:
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                return None, None, f'{name} debe tener formato YYYY-MM-DD'
+        dates[name] = value
+    end_date = dates['end_date'] or datetime.now(timezone.utc).date().isoformat()
+    start_date = dates['start_date']
+    if not start_date:
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
+        start_date = (end - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1)).isoformat()
+    if start_date > end_date:
+        return None, None, 'start_date no puede ser posterior a end_date'
+    return start_date, end_date, None
+
+
+def _int_arg(name, default, minimum, maximum):
+    """Entero acotado de la query string; devuelve (valor, error)"""
+    try:
+        value = int(request.args.get(name, default))
+    except ValueError:
+        return None, f'{name} debe ser entero'
+    if value < minimum or value > maximum:
+        return None, f'{name} debe estar entre {minimum} y {maximum}'
+    return value, None
+
+
+@app.route('/api/ecommerce/admin/analytics/top-sellers', methods=['GET'])
+def ecommerce_analytics_top_sellers():
+    """Productos más vendidos: start_date, end_date, limit y by=quantity|revenue"""
+    try:
+        ok, err = _require_admin()
+        if not ok:
+            return jsonify({'success': False, 'error': err}), 401
+        start_date, end_date, err = _analytics_range()
+        if err:
+            return jsonify({'success': False, 'error': err}), 400
+        limit, err = _int_arg('limit', 10, 1, 100)
+        if err:
+            return jsonify({'success': False, 'error': err}), 400
+        order_by = request.args.get('by', 'quantity')
+        if order_by not in ('quantity', 'revenue'):
+            return jsonify({'success': False, 'error': 'by debe ser quantity o revenue'}), 400
+        data = db.get_top_sellers(start_date, end_date, limit=limit, order_by=order_by)
+        return jsonify({'success': True, 'data': data, 'start_date': start_date, 'end_date': end_date})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/ecommerce/admin/analytics/revenue-by-day', methods=['GET'])
+def ecommerce_analytics_revenue_by_day():
+    try:
+        ok, err = _require_admin()
+        if not ok:
+            return jsonify({'success': False, 'error': err}), 401
+        start_date, end_date, err = _analytics_range()
+        if err:
+            return jsonify({'success': False, 'error': err}), 400
+        data = db.get_revenue_by_day(start_date, end_date)
+        return jsonify({'success': True, 'data': data, 'start_date': start_date, 'end_date': end_date})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/ecommerce/admin/analytics/revenue-by-category', methods=['GET'])
+def ecommerce_analytics_revenue_by_category():
+    try:
+        ok, err = _require_admin()
+        if not ok:
+            return jsonify({'success': False, 'error': err}), 401
+        start_date, end_date, err = _analytics_range()
+        if err:
+            return jsonify({'success': False, 'error': err}), 400
+        data = db.get_revenue_by_category(start_date, end_date)
+        return jsonify({'success': True, 'data': data, 'start_date': start_date, 'end_date': end_date})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/ecommerce/admin/analytics/low-stock', methods=['GET'])
+def ecommerce_analytics_low_stock():
+    """Alertas de stock bajo: threshold, days (ventana de ventas) y limit"""
+    try:
+        ok, err = _require_admin()
+        if not ok:
+            return jsonify({'success': False, 'error': err}), 401
+        threshold, err = _int_arg('threshold', 5, 0, 1000000)
+        if not err:
+            days, err = _int_arg('days', ANALYTICS_DEFAULT_DAYS, 1, 365)
+        if not err:
+            limit, err = _int_arg('limit', 50, 1, MAX_PAGE_SIZE)
+        if err:
+            return jsonify({'success': False, 'error': err}), 400
+        data = db.get_low_stock_products(threshold=threshold, days=days, limit=limit)
+        return jsonify({'success': True, 'data': data})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# -------- Carrito en el servidor --------
+# El navegador solo guarda un identificador opaco en la cookie cart_id; las
+# líneas del carrito están en cart_store y cada cambio toca una sola línea.
+CART_COOKIE = 'cart_id'
+CART_COOKIE_MAX_AGE = 30 * 24 * 3600
+CART_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+# Reservas de stock: cada línea del carrito retiene su stock durante
+# STOCK_RESERVATION_TTL segundos desde la última actividad del carrito. Un
+# hilo en segundo plano libera las reservas caducadas y purga los carritos
+# abandonados.
+STOCK_RESERVATION_TTL = int(os.environ.get('STOCK_RESERVATION_TTL', 900))
+
+def _sweep_reservations():
+    return {
+        'reservations_released': db.sweep_expired_reservations(),
+        'cart_lines_purged': cart_store.purge_idle(CART_COOKIE_MAX_AGE)
+    }
+
+# El hilo se arranca con la primera petición de cada proceso (no al importar:
+# un servidor que hace fork de workers tras cargar la aplicación no lo hereda)
+reservation_sweeper = PeriodicTask('reservation-sweeper',
+                                   float(os.environ.get('RESERVATION_SWEEP_INTERVAL', 30)),
+                                   _sweep_reservations)
+
+@app.before_request
+def _start_reservation_sweeper():
+    reservation_sweeper.ensure_started()
+
+def _cart_id(create=False):
+    """Identificador del carrito de la petición; None si no hay y create=False.
+    Un carrito nuevo se envía en la cookie al terminar la petición."""
+    cart_id = g.get('cart_id') or request.cookies.get(CART_COOKIE)
+    if cart_id and not CART_ID_PATTERN.match(cart_id):
+        cart_id = None
+    # Carritos antiguos guardados en la cookie de sesión: se pasan al almacén
+    # reservando su stock como cualquier alta (sin stock, la línea se descarta)
+    legacy_cart = session.pop('cart', None) if 'cart' in session else None
+    if not cart_id and (create or legacy_cart):
+        cart_id = secrets.token_urlsafe(16)
+        g.new_cart_id = cart_id
+    if legacy_cart:
+        for pid_str, qty in legacy_cart.items():
+            if int(qty) > 0:
+                cart_store.add(cart_id, int(pid_str), int(qty), STOCK_RESERVATION_TTL)
+    g.cart_id = cart_id
+    return cart_id
+
+@app.after_request
+def _set_cart_cookie(response):
+    cart_id = g.pop('new_cart_id', None)
+    if cart_id:
+        response.set_cookie(CART_COOKIE, cart_id, max_age=CART_COOKIE_MAX_AGE,
+                            httponly=True, samesite='Lax')
+    return response
 
 @app.route('/api/ecommerce/cart', methods=['GET'])
 def ecommerce_get_cart():
     try:
-        cart = _get_cart()
+        cart_id = _cart_id()
+        cart = cart_store.get(cart_id) if cart_id else {}
         # Construir items con detalles de producto
         items = []
         subtotal = 0.0
-        for pid_str, qty in cart.items():
-            pid = int(pid_str)
-            product = db.get_product_by_id(pid)
+        # Una sola consulta para todos los productos del carrito
+        products = db.get_products_by_ids(cart)
+        for pid, qty in cart.items():
+            product = products.get(pid)
             if product:
                 line_total = float(product['price']) * int(qty)
                 subtotal += line_total
@@ -810,11 +1201,10 @@ def ecommerce_cart_add():
         product = db.get_product_by_id(pid)
         if not product:
             return jsonify({'success': False, 'error': 'Producto no encontrado'}), 404
-        if qty > int(product['stock']):
+        cart_id = _cart_id(create=True)
+        # Suma a la línea y reserva del total en una sola operación atómica
+        if cart_store.add(cart_id, pid, qty, STOCK_RESERVATION_TTL) is None:
             return jsonify({'success': False, 'error': 'Stock insuficiente'}), 400
-        cart = _get_cart()
-        cart[str(pid)] = cart.get(str(pid), 0) + qty
-        session['cart'] = cart
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -825,17 +1215,18 @@ def ecommerce_cart_update():
         data = request.get_json()
         pid = int(data.get('product_id'))
         qty = int(data.get('quantity', 1))
-        cart = _get_cart()
         if qty <= 0:
-            cart.pop(str(pid), None)
+            cart_id = _cart_id()
+            if cart_id:
+                cart_store.update(cart_id, pid, 0, STOCK_RESERVATION_TTL)
         else:
             product = db.get_product_by_id(pid)
             if not product:
                 return jsonify({'success': False, 'error': 'Producto no encontrado'}), 404
-            if qty > int(product['stock']):
+            cart_id = _cart_id(create=True)
+            # Cantidad de la línea y reserva en una sola operación atómica
+            if cart_store.update(cart_id, pid, qty, STOCK_RESERVATION_TTL) is None:
                 return jsonify({'success': False, 'error': 'Stock insuficiente'}), 400
-            cart[str(pid)] = qty
-        session['cart'] = cart
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -845,9 +1236,9 @@ def ecommerce_cart_remove():
     try:
         data = request.get_json()
         pid = int(data.get('product_id'))
-        cart = _get_cart()
-        cart.pop(str(pid), None)
-        session['cart'] = cart
+        cart_id = _cart_id()
+        if cart_id:
+            cart_store.update(cart_id, pid, 0, STOCK_RESERVATION_TTL)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -858,16 +1249,18 @@ def ecommerce_checkout():
         data = request.get_json() or {}
         customer_name = data.get('customer_name')
         customer_email = data.get('customer_email')
-        cart = _get_cart()
+        cart_id = _cart_id()
+        cart = cart_store.get(cart_id) if cart_id else {}
         if not cart:
             return jsonify({'success': False, 'error': 'Carrito vacío'}), 400
 
-        items = [{'product_id': int(pid), 'quantity': int(qty)} for pid, qty in cart.items()]
-        order_id, total = db.create_order(items, customer_name, customer_email)
+        items = [{'product_id': pid, 'quantity': qty} for pid, qty in cart.items()]
+        # Las reservas del carrito se convierten en el descuento de stock del pedido
+        order_id, total = db.create_order(items, customer_name, customer_email, cart_id=cart_id)
         if not order_id:
             return jsonify({'success': False, 'error': 'No se pudo crear el pedido'}), 400
         # Vaciar carrito
-        session['cart'] = {}
+        cart_store.clear(cart_id)
         return jsonify({'success': True, 'data': {'order_id': order_id, 'total': round(total, 2)}})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
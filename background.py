@@ -0,0 +1,85 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """Ejecuta func() cada interval segundos en un hilo demonio.
+
+    Un error en una ejecución se registra y no detiene las siguientes.
+    stats() expone el número de ejecuciones, la duración y el resultado de
+    la última.
+
+    El hilo pertenece al proceso que lo arranca: ensure_started() lo arranca
+    en el primer uso de cada proceso, también en los hijos de un fork, que
+    no heredan el hilo del padre.
+    """
+
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {'runs': 0, 'errors': 0, 'last_run': None, 'last_ms': 0.0, 'last_result': None}
+
+    def _check_fork(self):
+        # Tras un fork el hijo hereda el estado pero no el hilo
+        if self._pid != os.getpid():
+            self._lock = threading.Lock()
+            self._reset()
+
+    def start(self):
+        self._check_fork()
+        with self._lock:
+            if self._thread is not None or self.interval <= 0:
+                return
+            self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+            self._thread.start()
+
+    def ensure_started(self):
+        """Arranca el hilo si aún no corre en este proceso (llamada barata en cada petición)"""
+        if self._thread is None or self._pid != os.getpid():
+            self.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def run_once(self):
+        start = time.perf_counter()
+        try:
+            result = self.func()
+            error = False
+        except Exception:
+            logger.exception("Error en la tarea periódica %s", self.name)
+            result, error = None, True
+        with self._lock:
+            self._stats['runs'] += 1
+            self._stats['errors'] += int(error)
+            self._stats['last_run'] = int(time.time())
+            self._stats['last_ms'] = round((time.perf_counter() - start) * 1000, 2)
+            self._stats['last_result'] = result
+        return result
+
+    def stats(self):
+        self._check_fork()
+        with self._lock:
+            data = dict(self._stats)
+        data['interval'] = self.interval
+        data['running'] = self._thread is not None and self._thread.is_alive()
+        return data
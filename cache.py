@@ -0,0 +1,108 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def estimate_size(value):
+    """Estimación aproximada (bytes) de la memoria ocupada por un valor"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += estimate_size(k) + estimate_size(v)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += estimate_size(item)
+    return size
+
+
+class TTLCache:
+    """Caché LRU en memoria con caducidad (TTL) y límite de memoria.
+
+    - Expulsa la entrada menos usada cuando se supera max_entries o max_bytes.
+    - Cada entrada caduca a los ttl segundos (ttl=0 desactiva la caché).
+    - clear() incrementa una generación: un valor calculado antes de una
+      invalidación no se guarda después (evita reintroducir datos obsoletos).
+    """
+
+    def __init__(self, max_entries=256, ttl=30.0, max_bytes=8 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.generation = 0
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, key, default=None):
+        if not self.enabled:
+            return default
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return default
+            if entry[0] <= time.monotonic():
+                self._remove(key)
+                self._stats['misses'] += 1
+                return default
+            self._data.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[2]
+
+    def set(self, key, value, generation=None, ttl=None):
+        """Guarda un valor; si generation no coincide con la actual se ignora.
+        ttl (segundos) acorta la caducidad de esta entrada; nunca la alarga."""
+        if not self.enabled:
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + ttl, size, value)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+
+    def pop(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self.generation += 1
+            self._stats['invalidations'] += 1
+
+    def _remove(self, key):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['entries'] = len(self._data)
+            data['bytes'] = self._bytes
+        data['max_entries'] = self.max_entries
+        data['max_bytes'] = self.max_bytes
+        data['ttl'] = self.ttl
+        return data
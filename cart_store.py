@@ -0,0 +1,160 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryCartStore:
+    """Carritos en memoria del proceso, con expulsión LRU.
+
+    Adecuado para un solo proceso (desarrollo o demo): los carritos se
+    pierden al reiniciar y no se comparten entre workers.
+    """
+
+    def __init__(self, db, max_carts=10000):
+        self.db = db
+        self.max_carts = max_carts
+        self._carts = OrderedDict()  # cart_id -> {product_id: cantidad}
+        self._lock = threading.Lock()
+
+    def _cart(self, cart_id, create=False):
+        cart = self._carts.get(cart_id)
+        if cart is None and create:
+            cart = self._carts[cart_id] = {}
+            while len(self._carts) > self.max_carts:
+                self._carts.popitem(last=False)
+        if cart is not None:
+            self._carts.move_to_end(cart_id)
+        return cart
+
+    def get(self, cart_id):
+        with self._lock:
+            return dict(self._cart(cart_id) or {})
+
+    def add(self, cart_id, product_id, quantity, ttl):
+        """Suma quantity a la línea del producto reservando el stock de la
+        cantidad resultante. Devuelve la nueva cantidad o None si no hay stock."""
+        return self._reserve_line(cart_id, product_id, quantity, ttl, increment=True)
+
+    def update(self, cart_id, product_id, quantity, ttl):
+        """Fija la cantidad de la línea y su reserva; quantity <= 0 elimina la
+        línea y libera la reserva. Devuelve la cantidad o None si no hay stock."""
+        return self._reserve_line(cart_id, product_id, quantity, ttl, increment=False)
+
+    def _reserve_line(self, cart_id, product_id, quantity, ttl, increment):
+        # El lock del almacén se mantiene durante la reserva: dos cambios
+        # simultáneos de la misma línea no dejan carrito y reserva desfasados
+        with self._lock:
+            if increment:
+                quantity += (self._cart(cart_id) or {}).get(product_id, 0)
+            quantity = max(quantity, 0)
+
+            def run():
+                with self.db.transaction() as conn:
+                    return self.db.apply_reservation(conn.cursor(), cart_id, product_id, quantity, ttl)
+
+            if not self.db.run_with_retry(run):
+                return None
+            if quantity:
+                self._cart(cart_id, create=True)[product_id] = quantity
+            else:
+                cart = self._cart(cart_id)
+                if cart is not None:
+                    cart.pop(product_id, None)
+            return quantity
+
+    def clear(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+
+    def purge_idle(self, max_age):
+        # La expulsión LRU ya acota la memoria
+        return 0
+
+
+class SQLiteCartStore:
+    """Carritos en la tabla cart_items (una fila por carrito y producto).
+
+    Cada operación es una sola sentencia sobre una fila (UPSERT/DELETE por
+    clave primaria), sin leer ni reescribir el carrito completo.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def get(self, cart_id):
+        with self.db.connection(readonly=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT product_id, quantity FROM cart_items WHERE cart_id = ?', (cart_id,))
+            return dict(cursor.fetchall())
+
+    def add(self, cart_id, product_id, quantity, ttl):
+        """Suma quantity a la línea del producto reservando el stock de la
+        cantidad resultante. Devuelve la nueva cantidad o None si no hay stock."""
+        return self._reserve_line(cart_id, product_id, quantity, ttl, increment=True)
+
+    def update(self, cart_id, product_id, quantity, ttl):
+        """Fija la cantidad de la línea y su reserva; quantity <= 0 elimina la
+        línea y libera la reserva. Devuelve la cantidad o None si no hay stock."""
+        return self._reserve_line(cart_id, product_id, quantity, ttl, increment=False)
+
+    def _reserve_line(self, cart_id, product_id, quantity, ttl, increment):
+        # Lectura de la línea, reserva y escritura en la misma transacción
+        # inmediata: dos cambios simultáneos no pierden unidades ni dejan la
+        # cantidad del carrito distinta de la reservada
+        def run():
+            with self.db.transaction() as conn:
+                cursor = conn.cursor()
+                new_quantity = quantity
+                if increment:
+                    cursor.execute('SELECT quantity FROM cart_items WHERE cart_id = ? AND product_id = ?',
+                                   (cart_id, product_id))
+                    row = cursor.fetchone()
+                    new_quantity += row[0] if row else 0
+                new_quantity = max(new_quantity, 0)
+                if not self.db.apply_reservation(cursor, cart_id, product_id, new_quantity, ttl):
+                    return None
+                if new_quantity:
+                    cursor.execute('''
+                        INSERT INTO cart_items (cart_id, product_id, quantity, updated_at)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT (cart_id, product_id) DO UPDATE SET
+                            quantity = excluded.quantity,
+                            updated_at = excluded.updated_at
+                    ''', (cart_id, product_id, new_quantity, int(time.time())))
+                else:
+                    cursor.execute('DELETE FROM cart_items WHERE cart_id = ? AND product_id = ?',
+                                   (cart_id, product_id))
+                return new_quantity
+        return self.db.run_with_retry(run)
+
+    def clear(self, cart_id):
+        self._execute('DELETE FROM cart_items WHERE cart_id = ?', (cart_id,))
+
+    def purge_idle(self, max_age):
+        """Borra los carritos sin cambios en max_age segundos; devuelve las filas borradas"""
+        cutoff = int(time.time() - max_age)
+        return self._execute('''
+            DELETE FROM cart_items WHERE cart_id IN (
+                SELECT cart_id FROM cart_items WHERE updated_at < ?
+                EXCEPT
+                SELECT cart_id FROM cart_items WHERE updated_at >= ?
+            )
+        ''', (cutoff, cutoff))
+
+    def _execute(self, sql, params):
+        def run():
+            with self.db.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(sql, params)
+                conn.commit()
+                return cursor.rowcount
+        return self.db.run_with_retry(run)
+
+
+def create_cart_store(kind, db, max_carts=10000):
+    """Crea el almacén de carritos: 'sqlite' (por defecto) o 'memory'"""
+    if kind == 'memory':
+        return MemoryCartStore(db, max_carts=max_carts)
+    if kind == 'sqlite':
+        return SQLiteCartStore(db)
+    raise ValueError(f"Almacén de carritos desconocido: {kind}")
@@ -0,0 +1,110 @@
+import hashlib
+import hmac
+import os
+import re
+
+from cache import TTLCache
+from password_hasher import PasswordHasher, HasherBusy
+
+# Hash heredado del backend de Employee Manager: sha256(password) en hexadecimal, sin sal
+LEGACY_SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def detect_scheme(stored_hash):
+    """Esquema de un hash almacenado: 'pbkdf2', 'scrypt', 'sha256' (heredado) o 'unknown'"""
+    if not isinstance(stored_hash, str):
+        return 'unknown'
+    if stored_hash.startswith('pbkdf2:'):
+        return 'pbkdf2'
+    if stored_hash.startswith('scrypt:'):
+        return 'scrypt'
+    if LEGACY_SHA256_PATTERN.match(stored_hash):
+        return 'sha256'
+    return 'unknown'
+
+
+def pbkdf2_iterations(stored_hash):
+    """Iteraciones de un hash pbkdf2:<algoritmo>:<iteraciones>$sal$hash (0 si no constan)"""
+    method = stored_hash.split('$', 1)[0]
+    parts = method.split(':')
+    try:
+        return int(parts[2]) if len(parts) > 2 else 0
+    except ValueError:
+        return 0
+
+
+class CredentialService:
+    """Verificación de contraseñas común a la aplicación principal y a Employee Manager.
+
+    - Detecta el esquema del hash almacenado (PBKDF2/scrypt de werkzeug o el
+      sha256 sin sal heredado) y lo verifica.
+    - Tras un login correcto con un hash débil (sha256 heredado o PBKDF2 con
+      menos iteraciones que las configuradas) calcula uno nuevo y se lo pasa
+      a on_upgrade para que el llamador lo guarde: la migración de hashes es
+      gradual, usuario a usuario.
+    - Recuerda durante cache_ttl segundos las verificaciones correctas
+      recientes por (usuario, hash almacenado) junto con un HMAC de la
+      contraseña con una clave aleatoria del proceso; un login repetido con
+      la misma contraseña no vuelve a ejecutar el KDF. Cambiar la contraseña
+      cambia el hash almacenado y deja la entrada sin efecto.
+    """
+
+    def __init__(self, hasher=None, cache_ttl=60.0, cache_entries=1024):
+        self.hasher = hasher or PasswordHasher(workers=0)
+        self.cache = TTLCache(max_entries=cache_entries, ttl=cache_ttl, max_bytes=1024 * 1024)
+        self._key = os.urandom(32)
+
+    def hash(self, password):
+        """Hash nuevo con el esquema y factor de trabajo actuales"""
+        return self.hasher.hash(password)
+
+    def needs_upgrade(self, stored_hash):
+        scheme = detect_scheme(stored_hash)
+        if scheme == 'sha256':
+            return True
+        if scheme == 'pbkdf2':
+            return pbkdf2_iterations(stored_hash) < self.hasher.iterations
+        return False
+
+    def _digest(self, password):
+        return hmac.new(self._key, password.encode('utf-8'), hashlib.sha256).digest()
+
+    def verify(self, user_key, stored_hash, password, on_upgrade=None):
+        """True si la contraseña corresponde al hash almacenado del usuario.
+
+        on_upgrade(nuevo_hash) se llama tras una verificación correcta si el
+        hash debe actualizarse. Lanza HasherBusy si hay que ejecutar el KDF y
+        el servicio de hash está saturado.
+        """
+        if not stored_hash or password is None:
+            return False
+        digest = self._digest(password)
+        cache_key = (user_key, stored_hash)
+        cached = self.cache.get(cache_key)
+        if cached is not None and hmac.compare_digest(cached, digest):
+            return True
+
+        scheme = detect_scheme(stored_hash)
+        if scheme == 'sha256':
+            legacy = hashlib.sha256(password.encode('utf-8')).hexdigest()
+            ok = hmac.compare_digest(legacy, stored_hash)
+        elif scheme in ('pbkdf2', 'scrypt'):
+            ok = self.hasher.verify(stored_hash, password)
+        else:
+            ok = False
+        if not ok:
+            return False
+
+        if on_upgrade is not None and self.needs_upgrade(stored_hash):
+            try:
+                new_hash = self.hasher.hash(password)
+            except HasherBusy:
+                # El login es válido; la actualización se hará en otro login
+                new_hash = None
+            if new_hash and on_upgrade(new_hash):
+                cache_key = (user_key, new_hash)
+        self.cache.set(cache_key, digest)
+        return True
+
+    def stats(self):
+        return self.cache.stats()
@@ -1,297 +1,496 @@
 import sqlite3
 import os
+import logging
+import json
+import time
+import base64
+import random
+import re
+from contextlib import contextmanager
+from functools import partial
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from urllib.request import pathname2url
+from db_pool import ConnectionPool
+from cache import TTLCache
+from query_builder import UpdateBuilder
+from password_hasher import PasswordHasher
+from credentials import CredentialService
+from migrations import (migrate, current_version, table_exists, LATEST_VERSION, ROLLUPS_REBUILD_SQL,
+                        SALES_DAILY_REBUILD_SQL)
+
+logger = logging.getLogger(__name__)
+
+# Perfiles de almacenamiento: PRAGMAs aplicados a la base de datos y a cada
+# conexión nueva. Se puede pasar el nombre de un perfil o un dict que
+# sobrescriba valores del perfil 'default'.
+STORAGE_PROFILES = {
+    'default': {
+        'journal_mode': 'WAL',       # lectores y escritor no se bloquean entre sí
+        'synchronous': 'NORMAL',     # seguro con WAL, evita un fsync por commit
+        'cache_size': -16000,        # ~16 MB de caché de páginas (negativo = KiB)
+        'mmap_size': 268435456,      # 256 MB mapeados en memoria
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,        # ms esperando un lock antes de fallar
+        'read_pool_size': 8,         # conexiones de solo lectura (0 = sin separar)
+    },
+    # Comportamiento clásico de SQLite (journal de rollback, fsync completo)
+    'legacy': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000,
+        'read_pool_size': 0,
+    },
+}
+
+def resolve_storage_profile(profile):
+    """Devuelve el dict de PRAGMAs para un nombre de perfil o dict parcial"""
+    if profile is None:
+        profile = 'default'
+    if isinstance(profile, str):
+        if profile not in STORAGE_PROFILES:
+            raise ValueError(f"Perfil de almacenamiento desconocido: {profile}")
+        return dict(STORAGE_PROFILES[profile])
+    resolved = dict(STORAGE_PROFILES['default'])
+    resolved.update(profile)
+    return resolved
+
+def encode_cursor(values):
+    """Codifica la posición de una paginación keyset como token opaco"""
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token, size):
+    """Decodifica un token de encode_cursor; ValueError si no es válido"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError) as e:
+        raise ValueError('Cursor inválido') from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Cursor inválido')
+    return values
+
+def build_fts_query(search):
+    """Convierte el texto del buscador en una consulta MATCH de FTS5.
+
+    Cada palabra se entrecomilla (los operadores de FTS5 escritos por el
+    usuario no se interpretan) y se busca por prefijo: "cami pyt" encuentra
+    "Camiseta Python". Devuelve None si no hay palabras.
+    """
+    words = re.findall(r'\w+', search or '')
+    if not words:
+        return None
+    return ' '.join(f'"{w}"*' for w in words)
+
+
+# Máximo de parámetros por consulta IN (...) (límite histórico de SQLite: 999)
+MAX_SQL_PARAMS = 900
+
+# Sentencias preparadas que guarda cada conexión del pool (sqlite3 usa 128 por defecto)
+STATEMENT_CACHE_SIZE = 256
+
+# Duración (segundos) de una reserva de stock de un carrito sin actividad
+DEFAULT_RESERVATION_TTL = 900
+
+# UPDATE dinámicos: SQL generado una vez por combinación de campos
+PRODUCT_UPDATE = UpdateBuilder('products', ['name', 'description', 'price', 'stock', 'image_url', 'category'],
+                               touch_updated_at=True)
+EMPLOYEE_UPDATE = UpdateBuilder('employees', ['employee_id', 'first_name', 'last_name', 'email', 'phone',
+                                              'department', 'position', 'salary', 'hire_date', 'status'])
+TRANSACTION_UPDATE = UpdateBuilder('transactions', ['amount', 'type', 'category_id', 'description', 'transaction_date'],
+                                   key=('id', 'user_id'))
 
 class PortfolioDatabase:
-    def __init__(self, db_path="portfolio.db"):
+    def __init__(self, db_path="portfolio.db", pool_size=8, pool_max_uses=1000, storage_profile='default',
+                 catalog_cache_ttl=30.0, catalog_cache_entries=256, catalog_cache_max_bytes=8 * 1024 * 1024,
+                 password_hasher=None):
         self.db_path = db_path
+        # Hash de contraseñas; por defecto en el propio hilo (la aplicación web
+        # pasa uno con pool de procesos)
+        self.password_hasher = password_hasher or PasswordHasher(workers=0)
+        self.credentials = CredentialService(self.password_hasher)
+        self.storage = resolve_storage_profile(storage_profile)
+        # Caché del catálogo (get_products / get_product_by_id), invalidada por
+        # las escrituras de productos y pedidos de este proceso; el TTL acota
+        # lo que puede tardar en verse un cambio hecho por otro proceso.
+        self.catalog_cache = TTLCache(max_entries=catalog_cache_entries, ttl=catalog_cache_ttl,
+                                      max_bytes=catalog_cache_max_bytes)
+        self.pool = ConnectionPool(db_path, max_size=pool_size, max_uses=pool_max_uses,
+                                   on_connect=self._configure_connection,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+        self.fts_enabled = False
         self.init_database()
+        self.read_pool = self._create_read_pool(pool_max_uses)
+
+    def _configure_connection(self, conn, readonly=False):
+        """Aplica los PRAGMAs por conexión del perfil de almacenamiento"""
+        storage = self.storage
+        conn.execute(f"PRAGMA busy_timeout = {int(storage['busy_timeout'])}")
+        conn.execute(f"PRAGMA synchronous = {storage['synchronous']}")
+        conn.execute(f"PRAGMA cache_size = {int(storage['cache_size'])}")
+        conn.execute(f"PRAGMA mmap_size = {int(storage['mmap_size'])}")
+        conn.execute(f"PRAGMA temp_store = {storage['temp_store']}")
+        if readonly:
+            conn.execute("PRAGMA query_only = 1")
+
+    def _create_read_pool(self, max_uses):
+        """Pool de conexiones de solo lectura (mode=ro).
+
+        Si el perfil no las habilita o la base de datos está en memoria, las
+        lecturas usan el pool de escritura.
+        """
+        size = int(self.storage.get('read_pool_size') or 0)
+        if size <= 0 or self.db_path == ':memory:' or self.db_path.startswith('file:'):
+            return self.pool
+        uri = f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+        return ConnectionPool(uri, max_size=size, max_uses=max_uses, uri=True,
+                              on_connect=lambda conn: self._configure_connection(conn, readonly=True),
+                              cached_statements=STATEMENT_CACHE_SIZE)
     
     def get_connection(self):
-        """Obtiene una conexión a la base de datos"""
-        return sqlite3.connect(self.db_path)
-    
-    def init_database(self):
-        """Inicializa las tablas de la base de datos para Employee Manager, Personal Finance Tracker y Mini E-commerce"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Tabla para el sistema de autenticación
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username VARCHAR(50) UNIQUE NOT NULL,
-                email VARCHAR(100) UNIQUE NOT NULL,
-                password_hash VARCHAR(255) NOT NULL,
-                first_name VARCHAR(50),
-                last_name VARCHAR(50),
-                role VARCHAR(20) DEFAULT 'user',
-                is_active BOOLEAN DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Tabla para el sistema de empleados (Employee Manager)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS employees (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_id VARCHAR(20) UNIQUE NOT NULL,
-                first_name VARCHAR(50) NOT NULL,
-                last_name VARCHAR(50) NOT NULL,
-                email VARCHAR(100) UNIQUE NOT NULL,
-                phone VARCHAR(20),
-                department VARCHAR(50),
-                position VARCHAR(100),
-                salary DECIMAL(10,2),
-                hire_date DATE,
-                status VARCHAR(20) DEFAULT 'active',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Tabla para categorías de transacciones (Personal Finance Tracker)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS categories (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name VARCHAR(50) NOT NULL,
-                type VARCHAR(20) NOT NULL CHECK (type IN ('income', 'expense')),
-                color VARCHAR(7) DEFAULT '#007bff',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        # Índice único para evitar duplicación de categorías por nombre y tipo
-        cursor.execute('''
-            CREATE UNIQUE INDEX IF NOT EXISTS idx_categories_name_type
-            ON categories (name, type)
-        ''')
-        
-        # Tabla para transacciones (Personal Finance Tracker)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                amount DECIMAL(10,2) NOT NULL CHECK (amount > 0),
-                type VARCHAR(20) NOT NULL CHECK (type IN ('income', 'expense')),
-                category_id INTEGER NOT NULL,
-                description TEXT,
-                transaction_date DATE NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-                FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE RESTRICT
-            )
-        ''')
+        """Obtiene una conexión del pool (conn.close() la devuelve al pool)"""
+        return self.pool.get()
 
-        # ==================== TABLAS PARA MINI E-COMMERCE ====================
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                description TEXT,
-                price DECIMAL(10,2) NOT NULL CHECK (price >= 0),
-                stock INTEGER NOT NULL DEFAULT 0 CHECK (stock >= 0),
-                image_url TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_products_name ON products(name)
-        ''')
+    def connection(self, readonly=False):
+        """Context manager con una conexión del pool.
 
-        # Migración: añadir columna 'category' si no existe
-        try:
-            cursor.execute("PRAGMA table_info(products)")
-            cols = [row[1] for row in cursor.fetchall()]
-            if 'category' not in cols:
-                cursor.execute("ALTER TABLE products ADD COLUMN category TEXT")
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_products_category ON products(category)")
-        except sqlite3.Error:
-            pass
+        Dentro del mismo hilo las llamadas anidadas comparten la conexión, por
+        lo que un método puede invocar a otro sin abrir una nueva. Con
+        readonly=True se usa una conexión de solo lectura, salvo que el hilo ya
+        tenga una de escritura (así ve sus propios cambios sin confirmar).
+        """
+        if readonly and self.read_pool is not self.pool and self.pool.current() is None:
+            return self.read_pool.connection()
+        return self.pool.connection()
 
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                customer_name TEXT,
-                customer_email TEXT,
-                total DECIMAL(10,2) NOT NULL DEFAULT 0,
-                status TEXT DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+    @contextmanager
+    def transaction(self, immediate=True):
+        """Transacción explícita sobre la conexión de escritura del hilo.
 
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS order_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                order_id INTEGER NOT NULL,
-                product_id INTEGER NOT NULL,
-                quantity INTEGER NOT NULL CHECK (quantity > 0),
-                unit_price DECIMAL(10,2) NOT NULL,
-                FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
-                FOREIGN KEY (product_id) REFERENCES products(id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
-        print("Base de datos inicializada correctamente para Employee Manager, Personal Finance Tracker y Mini E-commerce.")
+        Con immediate=True toma el lock de escritura al empezar (BEGIN
+        IMMEDIATE), así dos escritores no validan a la vez sobre los mismos
+        datos. Confirma al salir y revierte si hay una excepción. Si ya hay
+        una transacción abierta en el hilo, se une a ella.
+        """
+        with self.connection() as conn:
+            if conn.in_transaction:
+                yield conn
+                return
+            conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    @contextmanager
+    def read_transaction(self):
+        """Conexión de lectura dentro de una transacción (BEGIN diferido): todas
+        las consultas ven la misma instantánea de la base de datos. Si el hilo
+        ya tiene una transacción abierta, se usa esa."""
+        with self.connection(readonly=True) as conn:
+            if conn.in_transaction:
+                yield conn
+                return
+            conn.execute('BEGIN')
+            try:
+                yield conn
+            finally:
+                conn.rollback()
+
+    @staticmethod
+    def _catalog_version(cursor):
+        """Contador de cambios de products (lo mantienen triggers, en todos los procesos)"""
+        cursor.execute("SELECT version FROM table_versions WHERE table_name = 'products'")
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def run_with_retry(self, func, attempts=5, base_delay=0.05):
+        """Ejecuta func() reintentando con espera exponencial si SQLite
+        responde 'database is locked/busy' (SQLITE_BUSY)."""
+        for attempt in range(attempts):
+            try:
+                return func()
+            except sqlite3.OperationalError as e:
+                message = str(e).lower()
+                if attempt == attempts - 1 or ('locked' not in message and 'busy' not in message):
+                    raise
+                time.sleep(base_delay * (2 ** attempt) * (1 + random.random()))
+
+    def invalidate_catalog_cache(self):
+        """Vacía la caché del catálogo tras modificar productos o stock"""
+        self.catalog_cache.clear()
+
+    def get_table_versions(self, tables):
+        """Versión y fecha (epoch) del último cambio de cada tabla.
+        Devuelve {tabla: (version, updated_at)}; es una lectura por clave primaria."""
+        if not tables:
+            return {}
+        placeholders = ','.join('?' * len(tables))
+        with self.connection(readonly=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT table_name, version, updated_at FROM table_versions
+                WHERE table_name IN ({placeholders})
+            ''', tuple(tables))
+            return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+    def pool_stats(self):
+        """Estadísticas de los pools de conexiones (hits, waits, open...)"""
+        stats = {'write': self.pool.stats()}
+        if self.read_pool is not self.pool:
+            stats['read'] = self.read_pool.stats()
+        return stats
+    
+    def init_database(self):
+        """Prepara el esquema con las migraciones versionadas (ver migrations.py).
+        Si ya está al día solo se lee la versión registrada en schema_version."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+
+            # El modo de journal es persistente en el archivo: basta con fijarlo aquí
+            if self.db_path != ':memory:':
+                cursor.execute(f"PRAGMA journal_mode = {self.storage['journal_mode']}").fetchall()
+
+            applied = migrate(conn)
+            if applied:
+                logger.info("Esquema actualizado a la versión %s", applied[-1])
+            self.fts_enabled = table_exists(cursor, 'products_fts')
     
     def insert_sample_data(self):
         """Insertar datos de ejemplo"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+            with self.connection() as conn:
+                cursor = conn.cursor()
             
-            # Insertar usuario administrador por defecto con contraseña hasheada
-            admin_hash = generate_password_hash('admin123')
-            cursor.execute('''
-                INSERT OR IGNORE INTO users (username, email, password_hash, role)
-                VALUES (?, ?, ?, ?)
-            ''', ('admin', 'admin@portfolio.com', admin_hash, 'admin'))
-            # Actualizar hash si el admin existe con contraseña plana
-            cursor.execute('SELECT id, password_hash FROM users WHERE username = ?', ('admin',))
-            admin_row = cursor.fetchone()
-            if admin_row:
-                current_hash = admin_row[1]
-                if not (isinstance(current_hash, str) and current_hash.startswith('pbkdf2:sha256:')):
-                    cursor.execute('UPDATE users SET password_hash = ? WHERE id = ?', (admin_hash, admin_row[0]))
-            
-            # Insertar empleados de ejemplo para Employee Manager
-            sample_employees = [
-                ('EMP001', 'Juan', 'Pérez', 'juan.perez@empresa.com', '123456789', 'IT', 'Desarrollador', 50000, '2023-01-15'),
-                ('EMP002', 'María', 'García', 'maria.garcia@empresa.com', '987654321', 'Diseño', 'Diseñadora', 45000, '2023-02-01'),
-                ('EMP003', 'Carlos', 'López', 'carlos.lopez@empresa.com', '555666777', 'Administración', 'Gerente', 70000, '2022-12-01')
-            ]
+                # Insertar usuario administrador por defecto con contraseña hasheada
+                # (un admin con hash heredado se actualiza en su primer login)
+                cursor.execute('SELECT 1 FROM users WHERE username = ?', ('admin',))
+                if cursor.fetchone() is None:
+                    cursor.execute('''
+                        INSERT OR IGNORE INTO users (username, email, password_hash, role)
+                        VALUES (?, ?, ?, ?)
+                    ''', ('admin', 'admin@portfolio.com', self.credentials.hash('admin123'), 'admin'))
             
-            cursor.executemany('''
-                INSERT OR IGNORE INTO employees (employee_id, first_name, last_name, email, phone, department, position, salary, hire_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', sample_employees)
-            
-            # Insertar categorías de ejemplo para Personal Finance Tracker
-            sample_categories = [
-                ('Salario', 'income', '#28a745'),
-                ('Freelance', 'income', '#17a2b8'),
-                ('Inversiones', 'income', '#6f42c1'),
-                ('Alimentación', 'expense', '#dc3545'),
-                ('Transporte', 'expense', '#fd7e14'),
-                ('Vivienda', 'expense', '#6c757d'),
-                ('Entretenimiento', 'expense', '#e83e8c'),
-                ('Salud', 'expense', '#20c997'),
-                ('Educación', 'expense', '#007bff'),
-                ('Compras', 'expense', '#ffc107')
-            ]
+                # Insertar empleados de ejemplo para Employee Manager
+                sample_employees = [
+                    ('EMP001', 'Juan', 'Pérez', 'juan.perez@empresa.com', '123456789', 'IT', 'Desarrollador', 50000, '2023-01-15'),
+                    ('EMP002', 'María', 'García', 'maria.garcia@empresa.com', '987654321', 'Diseño', 'Diseñadora', 45000, '2023-02-01'),
+                    ('EMP003', 'Carlos', 'López', 'carlos.lopez@empresa.com', '555666777', 'Administración', 'Gerente', 70000, '2022-12-01')
+                ]
             
-            cursor.executemany('''
-                INSERT OR IGNORE INTO categories (name, type, color)
-                VALUES (?, ?, ?)
-            ''', sample_categories)
-
-            # Insertar productos de ejemplo para Mini E-commerce
-            sample_products = [
-                ('Camiseta Python', 'Camiseta con logo de Python', 19.99, 50, 'https://via.placeholder.com/200x200.png?text=Python+Tee'),
-                ('Taza Flask', 'Taza para programadores Flask', 12.50, 40, 'https://via.placeholder.com/200x200.png?text=Flask+Mug'),
-                ('Sticker SQL', 'Pack de stickers SQL', 4.99, 100, 'https://via.placeholder.com/200x200.png?text=SQL+Sticker'),
-                ('Sudadera Dev', 'Sudadera para desarrolladores', 34.90, 25, 'https://via.placeholder.com/200x200.png?text=Dev+Hoodie')
-            ]
-            cursor.executemany('''
-                INSERT OR IGNORE INTO products (name, description, price, stock, image_url)
-                VALUES (?, ?, ?, ?, ?)
-            ''', sample_products)
+                cursor.executemany('''
+                    INSERT OR IGNORE INTO employees (employee_id, first_name, last_name, email, phone, department, position, salary, hire_date)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', sample_employees)
             
-            conn.commit()
-            conn.close()
-            print("Datos de ejemplo insertados correctamente")
+                # Insertar categorías de ejemplo para Personal Finance Tracker
+                sample_categories = [
+                    ('Salario', 'income', '#28a745'),
+                    ('Freelance', 'income', '#17a2b8'),
+                    ('Inversiones', 'income', '#6f42c1'),
+                    ('Alimentación', 'expense', '#dc3545'),
+                    ('Transporte', 'expense', '#fd7e14'),
+                    ('Vivienda', 'expense', '#6c757d'),
+                    ('Entretenimiento', 'expense', '#e83e8c'),
+                    ('Salud', 'expense', '#20c997'),
+                    ('Educación', 'expense', '#007bff'),
+                    ('Compras', 'expense', '#ffc107')
+                ]
+            
+                cursor.executemany('''
+                    INSERT OR IGNORE INTO categories (name, type, color)
+                    VALUES (?, ?, ?)
+                ''', sample_categories)
+
+                # Insertar productos de ejemplo para Mini E-commerce
+                sample_products = [
+                    ('Camiseta Python', 'Camiseta con logo de Python', 19.99, 50, 'https://via.placeholder.com/200x200.png?text=Python+Tee'),
+                    ('Taza Flask', 'Taza para programadores Flask', 12.50, 40, 'https://via.placeholder.com/200x200.png?text=Flask+Mug'),
+                    ('Sticker SQL', 'Pack de stickers SQL', 4.99, 100, 'https://via.placeholder.com/200x200.png?text=SQL+Sticker'),
+                    ('Sudadera Dev', 'Sudadera para desarrolladores', 34.90, 25, 'https://via.placeholder.com/200x200.png?text=Dev+Hoodie')
+                ]
+                cursor.executemany('''
+                    INSERT OR IGNORE INTO products (name, description, price, stock, image_url)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', sample_products)
+            
+                conn.commit()
+                self.invalidate_catalog_cache()
+                print("Datos de ejemplo insertados correctamente")
             
         except sqlite3.Error as e:
             print(f"Error al insertar datos de ejemplo: {e}")
 
     # ==================== MÉTODOS PARA MINI E-COMMERCE ====================
 
-    def get_products(self, search=None, category=None):
-        """Obtener lista de productos, con búsqueda opcional y filtro por categoría"""
+    def get_products(self, search=None, category=None, limit=None):
+        """Obtener lista de productos, con búsqueda opcional y filtro por categoría.
+
+        Con FTS5 la búsqueda es por palabras (prefijo, sin distinguir acentos)
+        y los resultados se ordenan por relevancia (bm25, el nombre pesa más
+        que la descripción). Sin FTS5 se usa LIKE y se ordena por nombre.
+        """
+        cache_key = ('list', search or None, category or None, limit)
+        generation = self.catalog_cache.generation
+        match = build_fts_query(search) if search and self.fts_enabled else None
+        limit_sql = ' LIMIT ?' if limit else ''
+        limit_params = (int(limit),) if limit else ()
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            if search and category:
-                like = f"%{search}%"
-                cursor.execute('''
-                    SELECT id, name, description, price, stock, image_url, category, created_at, updated_at
-                    FROM products
-                    WHERE (name LIKE ? OR description LIKE ?) AND category = ?
-                    ORDER BY name
-                ''', (like, like, category))
-            elif search:
-                like = f"%{search}%"
-                cursor.execute('''
-                    SELECT id, name, description, price, stock, image_url, category, created_at, updated_at
-                    FROM products
-                    WHERE name LIKE ? OR description LIKE ?
-                    ORDER BY name
-                ''', (like, like))
-            elif category:
-                cursor.execute('''
-                    SELECT id, name, description, price, stock, image_url, category, created_at, updated_at
-                    FROM products
-                    WHERE category = ?
-                    ORDER BY name
-                ''', (category,))
-            else:
-                cursor.execute('''
-                    SELECT id, name, description, price, stock, image_url, category, created_at, updated_at
-                    FROM products
-                    ORDER BY name
-                ''')
+            with self.read_transaction() as conn:
+                cursor = conn.cursor()
+                # Una entrada de la caché solo vale si se leyó con la versión
+                # actual de products (otro proceso puede haberla cambiado)
+                version = self._catalog_version(cursor)
+                cached = self.catalog_cache.get(cache_key)
+                if cached is not None and cached[0] == version:
+                    return [dict(p) for p in cached[1]]
+                if match:
+                    cursor.execute(f'''
+                        SELECT p.id, p.name, p.description, p.price, p.stock, p.image_url, p.category,
+                               p.created_at, p.updated_at
+                        FROM products_fts
+                        JOIN products p ON p.id = products_fts.rowid
+                        WHERE products_fts MATCH ? AND (? IS NULL OR p.category = ?)
+                        ORDER BY bm25(products_fts, 10.0, 1.0), p.name
+                        {limit_sql}
+                    ''', (match, category or None, category or None) + limit_params)
+                elif search and category:
+                    like = f"%{search}%"
+                    cursor.execute(f'''
+                        SELECT id, name, description, price, stock, image_url, category, created_at, updated_at
+                        FROM products
+                        WHERE (name LIKE ? OR description LIKE ?) AND category = ?
+                        ORDER BY name{limit_sql}
+                    ''', (like, like, category) + limit_params)
+                elif search:
+                    like = f"%{search}%"
+                    cursor.execute(f'''
+                        SELECT id, name, description, price, stock, image_url, category, created_at, updated_at
+                        FROM products
+                        WHERE name LIKE ? OR description LIKE ?
+                        ORDER BY name{limit_sql}
+                    ''', (like, like) + limit_params)
+                elif category:
+                    cursor.execute(f'''
+                        SELECT id, name, description, price, stock, image_url, category, created_at, updated_at
+                        FROM products
+                        WHERE category = ?
+                        ORDER BY name{limit_sql}
+                    ''', (category,) + limit_params)
+                else:
+                    cursor.execute(f'''
+                        SELECT id, name, description, price, stock, image_url, category, created_at, updated_at
+                        FROM products
+                        ORDER BY name{limit_sql}
+                    ''', limit_params)
 
-            columns = [d[0] for d in cursor.description]
-            products = [dict(zip(columns, row)) for row in cursor.fetchall()]
-            conn.close()
-            return products
+                columns = [d[0] for d in cursor.description]
+                products = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            self.catalog_cache.set(cache_key, (version, products), generation)
+            return [dict(p) for p in products]
         except sqlite3.Error as e:
             print(f"Error al obtener productos: {e}")
             return []
 
     def get_product_by_id(self, product_id):
         """Obtener producto por ID"""
+        cache_key = ('id', int(product_id))
+        generation = self.catalog_cache.generation
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, name, description, price, stock, image_url, category, created_at, updated_at
-                FROM products
-                WHERE id = ?
-            ''', (product_id,))
-            row = cursor.fetchone()
-            conn.close()
-            if row:
-                columns = ['id','name','description','price','stock','image_url','category','created_at','updated_at']
-                return dict(zip(columns, row))
-            return None
+            with self.read_transaction() as conn:
+                cursor = conn.cursor()
+                version = self._catalog_version(cursor)
+                cached = self.catalog_cache.get(cache_key)
+                if cached is not None and cached[0] == version:
+                    return dict(cached[1])
+                cursor.execute('''
+                    SELECT id, name, description, price, stock, image_url, category, created_at, updated_at
+                    FROM products
+                    WHERE id = ?
+                ''', (product_id,))
+                row = cursor.fetchone()
+                if row:
+                    columns = ['id','name','description','price','stock','image_url','category','created_at','updated_at']
+                    product = dict(zip(columns, row))
+                    self.catalog_cache.set(cache_key, (version, product), generation)
+                    return dict(product)
+                return None
         except sqlite3.Error as e:
             print(f"Error al obtener producto: {e}")
             return None
 
+    def get_products_by_ids(self, product_ids, use_cache=True):
+        """Obtener varios productos en una sola consulta IN (...).
+        Devuelve un dict {id: producto}; los ids inexistentes no aparecen.
+        Con use_cache=False se lee siempre de la base de datos (checkout)."""
+        ids = sorted({int(pid) for pid in product_ids})
+        products = {}
+        generation = self.catalog_cache.generation
+        if not ids:
+            return products
+        try:
+            with self.read_transaction() as conn:
+                cursor = conn.cursor()
+                if use_cache:
+                    version = self._catalog_version(cursor)
+                    missing = []
+                    for pid in ids:
+                        cached = self.catalog_cache.get(('id', pid))
+                        if cached is not None and cached[0] == version:
+                            products[pid] = dict(cached[1])
+                        else:
+                            missing.append(pid)
+                    ids = missing
+                for pid, product in self._select_products(cursor, ids).items():
+                    products[pid] = product
+                    if use_cache:
+                        self.catalog_cache.set(('id', pid), (version, dict(product)), generation)
+                return products
+        except sqlite3.Error as e:
+            print(f"Error al obtener productos: {e}")
+            return {}
+
+    @staticmethod
+    def _select_products(cursor, ids):
+        """{id: producto} leídos con el cursor dado; los errores se propagan"""
+        products = {}
+        # Trocear para no superar el límite de parámetros de SQLite
+        for start in range(0, len(ids), MAX_SQL_PARAMS):
+            chunk = ids[start:start + MAX_SQL_PARAMS]
+            placeholders = ', '.join('?' * len(chunk))
+            cursor.execute(f'''
+                SELECT id, name, description, price, stock, image_url, category, created_at, updated_at
+                FROM products
+                WHERE id IN ({placeholders})
+            ''', chunk)
+            columns = [d[0] for d in cursor.description]
+            for row in cursor.fetchall():
+                products[row[0]] = dict(zip(columns, row))
+        return products
+
     def create_product(self, name, description, price, stock, image_url=None, category=None):
         """Crear nuevo producto"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            if category is not None and category != '':
-                cursor.execute('''
-                    INSERT INTO products (name, description, price, stock, image_url, category)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (name, description, price, stock, image_url, category))
-            else:
-                cursor.execute('''
-                    INSERT INTO products (name, description, price, stock, image_url)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (name, description, price, stock, image_url))
-            product_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                if category is not None and category != '':
+                    cursor.execute('''
+                        INSERT INTO products (name, description, price, stock, image_url, category)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', (name, description, price, stock, image_url, category))
+                else:
+                    cursor.execute('''
+                        INSERT INTO products (name, description, price, stock, image_url)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', (name, description, price, stock, image_url))
+                product_id = cursor.lastrowid
+                conn.commit()
+            self.invalidate_catalog_cache()
             return product_id
         except sqlite3.Error as e:
             print(f"Error al crear producto: {e}")
@@ -300,80 +499,273 @@ class PortfolioDatabase:
     def update_product(self, product_id, name=None, description=None, price=None, stock=None, image_url=None, category=None):
         """Actualizar producto"""
         try:
-            fields = []
-            values = []
-            if name is not None:
-                fields.append("name = ?")
-                values.append(name)
-            if description is not None:
-                fields.append("description = ?")
-                values.append(description)
-            if price is not None:
-                fields.append("price = ?")
-                values.append(price)
-            if stock is not None:
-                fields.append("stock = ?")
-                values.append(stock)
-            if image_url is not None:
-                fields.append("image_url = ?")
-                values.append(image_url)
-            if category is not None:
-                fields.append("category = ?")
-                values.append(category)
-            values.append(product_id)
-
-            if not fields:
+            fields = {'name': name, 'description': description, 'price': price,
+                      'stock': stock, 'image_url': image_url, 'category': category}
+            query, values = PRODUCT_UPDATE.build({k: v for k, v in fields.items() if v is not None}, product_id)
+            if query is None:
                 return False
 
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute(f'''UPDATE products SET {', '.join(fields)}, updated_at = CURRENT_TIMESTAMP WHERE id = ?''', values)
-            conn.commit()
-            updated = cursor.rowcount > 0
-            conn.close()
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(query, values)
+                conn.commit()
+                updated = cursor.rowcount > 0
+            self.invalidate_catalog_cache()
             return updated
         except sqlite3.Error as e:
             print(f"Error al actualizar producto: {e}")
             return False
 
+    def bulk_update_products(self, updates):
+        """Actualizar varios productos en una transacción.
+        updates: lista de dicts con 'id' y los campos a cambiar (name, price, stock...).
+        Las filas con el mismo conjunto de campos se envían juntas con executemany.
+        Devuelve {'updated': productos actualizados, 'errors': [{index, id,
+        status: 'error', error}]} con las filas rechazadas sin aplicar (falta
+        'id' o no hay campos), o None si hubo un error de base de datos."""
+        try:
+            result = self._bulk_update(PRODUCT_UPDATE, updates)
+            self.invalidate_catalog_cache()
+            return result
+        except sqlite3.Error as e:
+            print(f"Error al actualizar productos: {e}")
+            return None
+
+    @staticmethod
+    def _product_fields(item):
+        """Campos de producto de un item de una operación masiva, con tipos
+        validados. Lanza ValueError con el motivo si algún valor no es válido."""
+        fields = {}
+        for key in ('name', 'description', 'image_url', 'category'):
+            if key in item:
+                value = item[key]
+                if value is not None and not isinstance(value, str):
+                    raise ValueError(f'{key} debe ser texto')
+                fields[key] = value
+        if 'name' in fields and not fields['name']:
+            raise ValueError('name no puede estar vacío')
+        if 'price' in item:
+            try:
+                fields['price'] = float(item['price'])
+            except (TypeError, ValueError):
+                raise ValueError('price debe ser numérico')
+            if fields['price'] < 0:
+                raise ValueError('price no puede ser negativo')
+        if 'stock' in item:
+            try:
+                fields['stock'] = int(item['stock'])
+            except (TypeError, ValueError):
+                raise ValueError('stock debe ser entero')
+            if fields['stock'] < 0:
+                raise ValueError('stock no puede ser negativo')
+        return fields
+
+    def _bulk_products(self, items, apply):
+        """Ejecuta apply(cursor, item) para cada item en una única transacción.
+        apply devuelve (id, estado) o lanza ValueError (error del item, que no
+        afecta al resto). Cada item se aplica dentro de un SAVEPOINT: si SQLite
+        rechaza sus sentencias (restricción NOT NULL, tipo no admitido...) se
+        deshacen solo las de ese item, que se marca como error, y el resto se
+        confirma. Devuelve la lista de resultados por item."""
+        def run():
+            results = []
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                for index, item in enumerate(items):
+                    cursor.execute('SAVEPOINT bulk_item')
+                    try:
+                        if not isinstance(item, dict):
+                            raise ValueError('Cada elemento debe ser un objeto')
+                        product_id, status = apply(cursor, item)
+                        results.append({'index': index, 'id': product_id, 'status': status})
+                    except (ValueError, TypeError, OverflowError, sqlite3.Error) as e:
+                        cursor.execute('ROLLBACK TO bulk_item')
+                        results.append({'index': index, 'id': item.get('id') if isinstance(item, dict) else None,
+                                        'status': 'error', 'error': str(e)})
+                    cursor.execute('RELEASE bulk_item')
+            return results
+
+        try:
+            results = self.run_with_retry(run)
+        except sqlite3.Error as e:
+            print(f"Error en operación masiva de productos: {e}")
+            return None
+        self.invalidate_catalog_cache()
+        return results
+
+    def bulk_upsert_products(self, items):
+        """Crear o actualizar productos en una transacción.
+        Items con 'id' actualizan los campos indicados; sin 'id' se crean
+        (name y price requeridos). Devuelve resultados por item
+        ({index, id, status: created|updated|not_found|error}) o None si falla."""
+        def apply(cursor, item):
+            fields = self._product_fields(item)
+            if item.get('id') is not None:
+                product_id = int(item['id'])
+                query, values = PRODUCT_UPDATE.build(fields, product_id)
+                if query is None:
+                    raise ValueError('No hay campos para actualizar')
+                cursor.execute(query, values)
+                return product_id, 'updated' if cursor.rowcount else 'not_found'
+            if not fields.get('name') or 'price' not in fields:
+                raise ValueError('name y price son requeridos')
+            cursor.execute('''
+                INSERT INTO products (name, description, price, stock, image_url, category)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (fields['name'], fields.get('description'), fields['price'], fields.get('stock', 0),
+                  fields.get('image_url'), fields.get('category') or None))
+            return cursor.lastrowid, 'created'
+        return self._bulk_products(items, apply)
+
+    def bulk_adjust_products(self, items):
+        """Ajustar precio y/o stock de varios productos en una transacción.
+        Cada item: {'id', 'price'?, 'stock'?, 'stock_delta'?}. stock_delta suma
+        (o resta) al stock actual y se rechaza si lo dejaría negativo."""
+        def apply(cursor, item):
+            if item.get('id') is None:
+                raise ValueError('id es requerido')
+            product_id = int(item['id'])
+            fields = self._product_fields({k: item[k] for k in ('price', 'stock') if k in item})
+            delta = item.get('stock_delta')
+            if delta is not None:
+                try:
+                    delta = int(delta)
+                except (TypeError, ValueError):
+                    raise ValueError('stock_delta debe ser entero')
+                if 'stock' in fields:
+                    raise ValueError('Use stock o stock_delta, no ambos')
+            if not fields and delta is None:
+                raise ValueError('No hay campos para ajustar')
+            if delta is not None:
+                cursor.execute('''
+                    UPDATE products SET stock = stock + ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND stock + ? >= 0
+                ''', (delta, product_id, delta))
+                if not cursor.rowcount:
+                    cursor.execute('SELECT 1 FROM products WHERE id = ?', (product_id,))
+                    if cursor.fetchone():
+                        raise ValueError('Stock insuficiente')
+                    return product_id, 'not_found'
+            if fields:
+                query, values = PRODUCT_UPDATE.build(fields, product_id)
+                cursor.execute(query, values)
+                if not cursor.rowcount:
+                    return product_id, 'not_found'
+            return product_id, 'updated'
+        return self._bulk_products(items, apply)
+
+    def bulk_delete_products(self, product_ids):
+        """Eliminar varios productos en una transacción.
+        Devuelve resultados por id ({index, id, status: deleted|not_found|error})."""
+        def apply(cursor, item):
+            try:
+                product_id = int(item['id'])
+            except (KeyError, TypeError, ValueError):
+                raise ValueError('id debe ser entero')
+            cursor.execute('DELETE FROM products WHERE id = ?', (product_id,))
+            return product_id, 'deleted' if cursor.rowcount else 'not_found'
+        items = [pid if isinstance(pid, dict) else {'id': pid} for pid in product_ids]
+        return self._bulk_products(items, apply)
+
+    def _bulk_update(self, builder, rows):
+        rows = list(rows)
+        groups, invalid = builder.build_many(rows)
+        errors = [{'index': index, 'id': rows[index].get('id') if isinstance(rows[index], dict) else None,
+                   'status': 'error', 'error': message} for index, message in invalid]
+        updated = 0
+        if groups:
+            with self.transaction() as conn:
+                for query, params in groups:
+                    cursor = conn.executemany(query, params)
+                    updated += cursor.rowcount
+        return {'updated': updated, 'errors': errors}
+
     def delete_product(self, product_id):
         """Eliminar producto"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM products WHERE id = ?', (product_id,))
-            conn.commit()
-            deleted = cursor.rowcount > 0
-            conn.close()
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM products WHERE id = ?', (product_id,))
+                conn.commit()
+                deleted = cursor.rowcount > 0
+            self.invalidate_catalog_cache()
             return deleted
         except sqlite3.Error as e:
             print(f"Error al eliminar producto: {e}")
             return False
 
-    def create_order(self, items, customer_name=None, customer_email=None, status='paid'):
+    def create_order(self, items, customer_name=None, customer_email=None, status='paid', cart_id=None):
         """Crear pedido a partir de items del carrito.
         items: lista de dicts {product_id, quantity}
-        Valida stock y calcula total según precios actuales.
+        Valida stock y calcula total según precios actuales. El stock
+        reservado por otros carritos no se vende; con cart_id, las reservas
+        de ese carrito se convierten en el descuento de stock del pedido.
+
+        Todo ocurre en una única transacción BEGIN IMMEDIATE: lectura en bloque
+        de precios, stock y reservas, descuento de stock condicionado
+        verificando las filas afectadas, inserción de líneas con executemany y
+        actualización de los agregados diarios de ventas (product_sales_daily).
+        Si la base de datos está ocupada se reintenta.
         """
         try:
-            conn = self.get_connection()
+            # Agrupar cantidades por producto (un producto puede repetirse)
+            quantities = {}
+            for item in items:
+                pid = int(item['product_id'])
+                qty = int(item['quantity'])
+                if qty <= 0:
+                    raise ValueError(f"Cantidad inválida para producto {pid}")
+                quantities[pid] = quantities.get(pid, 0) + qty
+            if not quantities:
+                raise ValueError("El pedido no tiene productos")
+
+            order_id, total = self.run_with_retry(
+                lambda: self._checkout(quantities, customer_name, customer_email, status, cart_id)
+            )
+            # El stock cambió: invalidar el catálogo en caché
+            self.invalidate_catalog_cache()
+            return order_id, total
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Error al crear pedido: {e}")
+            return None, None
+
+    def _checkout(self, quantities, customer_name, customer_email, status, cart_id=None):
+        """Motor de checkout: se ejecuta dentro de una transacción inmediata"""
+        with self.transaction() as conn:
             cursor = conn.cursor()
 
-            # Validar stock y calcular total
+            # Validar stock y calcular total (una sola lectura de todos los productos)
+            # Lectura con el cursor de la transacción: un SQLITE_BUSY llega a run_with_retry
+            products = self._select_products(cursor, list(quantities))
+            # Unidades reservadas por otros carritos, solo reservas vigentes: una
+            # caducada no retiene stock aunque el barrido aún no la haya borrado
+            held = self._active_reservations(cursor, quantities, int(time.time()), exclude_cart=cart_id)
+            own = self._cart_reservations(cursor, cart_id) if cart_id else {}
             total = 0.0
             detailed_items = []
-            for item in items:
-                pid = int(item['product_id'])
-                qty = int(item['quantity'])
-                cursor.execute('SELECT price, stock FROM products WHERE id = ?', (pid,))
-                row = cursor.fetchone()
-                if not row:
+            for pid, qty in quantities.items():
+                product = products.get(pid)
+                if not product:
                     raise ValueError(f"Producto {pid} no existe")
-                price, stock = float(row[0]), int(row[1])
-                if qty <= 0 or qty > stock:
+                price, stock = float(product['price']), int(product['stock'])
+                held_by_others = held.get(pid, 0)
+                if qty > stock - held_by_others:
                     raise ValueError(f"Stock insuficiente para producto {pid}")
                 total += price * qty
-                detailed_items.append({'product_id': pid, 'quantity': qty, 'unit_price': price})
+                detailed_items.append((pid, qty, price, held_by_others))
+
+            # Descuento de stock condicionado: si otra escritura se adelantó,
+            # alguna fila no se actualiza y el pedido se revierte
+            cursor.executemany(
+                'UPDATE products SET stock = stock - ? WHERE id = ? AND stock - ? >= ?',
+                [(qty, pid, qty, held) for pid, qty, _, held in detailed_items]
+            )
+            if cursor.rowcount != len(detailed_items):
+                raise ValueError("Stock insuficiente para completar el pedido")
+
+            # Las reservas del carrito pasan a ser stock vendido
+            if own:
+                self._release_reservations(cursor, [(cart_id, pid, qty) for pid, qty in own.items()])
 
             # Crear pedido
             cursor.execute('''
@@ -382,97 +774,458 @@ class PortfolioDatabase:
             ''', (customer_name, customer_email, total, status))
             order_id = cursor.lastrowid
 
-            # Insertar items y actualizar stock
-            for di in detailed_items:
-                cursor.execute('''
-                    INSERT INTO order_items (order_id, product_id, quantity, unit_price)
-                    VALUES (?, ?, ?, ?)
-                ''', (order_id, di['product_id'], di['quantity'], di['unit_price']))
-                cursor.execute('UPDATE products SET stock = stock - ? WHERE id = ?', (di['quantity'], di['product_id']))
+            # Insertar items
+            cursor.executemany('''
+                INSERT INTO order_items (order_id, product_id, quantity, unit_price)
+                VALUES (?, ?, ?, ?)
+            ''', [(order_id, pid, qty, price) for pid, qty, price, _ in detailed_items])
 
-            conn.commit()
-            conn.close()
-            return order_id, total
-        except (sqlite3.Error, ValueError) as e:
-            print(f"Error al crear pedido: {e}")
-            return None, None
+            # Agregados diarios de ventas (mismo día que registra el pedido)
+            cursor.execute('SELECT date(created_at) FROM orders WHERE id = ?', (order_id,))
+            day = cursor.fetchone()[0]
+            cursor.executemany('''
+                INSERT INTO product_sales_daily (day, product_id, quantity, revenue, orders)
+                VALUES (?, ?, ?, ?, 1)
+                ON CONFLICT (day, product_id) DO UPDATE SET
+                    quantity = quantity + excluded.quantity,
+                    revenue = revenue + excluded.revenue,
+                    orders = orders + 1
+            ''', [(day, pid, qty, qty * price) for pid, qty, price, _ in detailed_items])
+
+        return order_id, total
+
+    # ==================== RESERVAS DE STOCK (stock_reservations) ====================
+
+    @staticmethod
+    def _active_reservations(cursor, product_ids, now, exclude_cart=None):
+        """{product_id: unidades con reserva vigente} para los productos
+        indicados, sin contar las del carrito exclude_cart"""
+        ids = list(product_ids)
+        placeholders = ','.join('?' * len(ids))
+        cursor.execute(f'''
+            SELECT product_id, SUM(quantity) FROM stock_reservations
+            WHERE product_id IN ({placeholders}) AND expires_at >= ? AND cart_id IS NOT ?
+            GROUP BY product_id
+        ''', ids + [now, exclude_cart])
+        return dict(cursor.fetchall())
+
+    @staticmethod
+    def _cart_reservations(cursor, cart_id):
+        """{product_id: cantidad} reservada por un carrito"""
+        cursor.execute('SELECT product_id, quantity FROM stock_reservations WHERE cart_id = ?', (cart_id,))
+        return dict(cursor.fetchall())
+
+    @staticmethod
+    def _release_reservations(cursor, rows):
+        """Borra reservas [(cart_id, product_id, cantidad)] y descuenta los totales"""
+        totals = {}
+        for _, pid, qty in rows:
+            totals[pid] = totals.get(pid, 0) + qty
+        cursor.executemany(
+            'DELETE FROM stock_reservations WHERE cart_id = ? AND product_id = ?',
+            [(cid, pid) for cid, pid, _ in rows]
+        )
+        cursor.executemany(
+            'UPDATE product_reservations SET reserved = MAX(reserved - ?, 0) WHERE product_id = ?',
+            [(qty, pid) for pid, qty in totals.items()]
+        )
+
+    def _release_expired(self, cursor, now, product_id=None, limit=-1):
+        """Libera reservas caducadas (de un producto o de todos); devuelve cuántas"""
+        query = 'SELECT cart_id, product_id, quantity FROM stock_reservations WHERE expires_at < ?'
+        params = [now]
+        if product_id is not None:
+            query += ' AND product_id = ?'
+            params.append(product_id)
+        cursor.execute(query + ' LIMIT ?', params + [limit])
+        rows = cursor.fetchall()
+        if rows:
+            self._release_reservations(cursor, rows)
+        return len(rows)
+
+    def reserve_stock(self, cart_id, product_id, quantity, ttl=DEFAULT_RESERVATION_TTL):
+        """Fija en quantity unidades la reserva de un carrito para un producto
+        (0 la libera) y renueva la caducidad de todas las reservas del carrito.
+
+        Comprobación y reserva ocurren en una transacción inmediata. Si no hay
+        stock libre se recuperan antes las reservas caducadas de ese producto.
+        Devuelve True si se reservó, False si no hay stock suficiente (la
+        reserva anterior se mantiene) y None si hubo un error de base de datos.
+        """
+        def run():
+            with self.transaction() as conn:
+                return self.apply_reservation(conn.cursor(), cart_id, product_id, quantity, ttl)
 
-    def get_order(self, order_id):
-        """Obtener pedido con sus items"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT id, customer_name, customer_email, total, status, created_at FROM orders WHERE id = ?', (order_id,))
-            order_row = cursor.fetchone()
-            if not order_row:
-                conn.close()
-                return None
+            return self.run_with_retry(run)
+        except sqlite3.Error as e:
+            print(f"Error al reservar stock: {e}")
+            return None
+
+    def apply_reservation(self, cursor, cart_id, product_id, quantity, ttl=DEFAULT_RESERVATION_TTL):
+        """Como reserve_stock, sobre el cursor de una transacción inmediata ya
+        abierta por el llamador (p. ej. para cambiar la línea del carrito en la
+        misma transacción). Devuelve True o False; los errores se propagan."""
+        now = int(time.time())
+        for attempt in range(2):
+            held = self._cart_reservations(cursor, cart_id).get(product_id, 0)
+            delta = quantity - held
+            if delta <= 0:
+                break
             cursor.execute('''
-                SELECT oi.id, oi.product_id, p.name, oi.quantity, oi.unit_price
-                FROM order_items oi
-                JOIN products p ON p.id = oi.product_id
-                WHERE oi.order_id = ?
-            ''', (order_id,))
-            items_rows = cursor.fetchall()
-            conn.close()
-            order = {
-                'id': order_row[0],
-                'customer_name': order_row[1],
-                'customer_email': order_row[2],
-                'total': float(order_row[3]),
-                'status': order_row[4],
-                'created_at': order_row[5],
-                'items': [
-                    {
-                        'id': r[0],
-                        'product_id': r[1],
-                        'product_name': r[2],
-                        'quantity': r[3],
-                        'unit_price': float(r[4])
-                    } for r in items_rows
-                ]
-            }
-            return order
+                SELECT p.stock - COALESCE(r.reserved, 0)
+                FROM products p
+                LEFT JOIN product_reservations r ON r.product_id = p.id
+                WHERE p.id = ?
+            ''', (product_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return False
+            if row[0] >= delta:
+                break
+            if attempt or not self._release_expired(cursor, now, product_id=product_id):
+                return False
+
+        if quantity > 0:
+            cursor.execute('''
+                INSERT INTO stock_reservations (cart_id, product_id, quantity, expires_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (cart_id, product_id) DO UPDATE SET
+                    quantity = excluded.quantity, expires_at = excluded.expires_at
+            ''', (cart_id, product_id, quantity, now + ttl))
+        else:
+            cursor.execute('DELETE FROM stock_reservations WHERE cart_id = ? AND product_id = ?',
+                           (cart_id, product_id))
+        if delta:
+            cursor.execute('''
+                INSERT INTO product_reservations (product_id, reserved) VALUES (?, MAX(?, 0))
+                ON CONFLICT (product_id) DO UPDATE SET reserved = MAX(reserved + ?, 0)
+            ''', (product_id, delta, delta))
+        cursor.execute('UPDATE stock_reservations SET expires_at = ? WHERE cart_id = ?',
+                       (now + ttl, cart_id))
+        return True
+
+    def release_stock(self, cart_id, product_id=None):
+        """Libera la reserva de un producto o, sin product_id, todas las del carrito"""
+        if product_id is not None:
+            return self.reserve_stock(cart_id, product_id, 0)
+
+        def run():
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                held = self._cart_reservations(cursor, cart_id)
+                self._release_reservations(cursor, [(cart_id, pid, qty) for pid, qty in held.items()])
+                return True
+
+        try:
+            return self.run_with_retry(run)
+        except sqlite3.Error as e:
+            print(f"Error al liberar reservas: {e}")
+            return None
+
+    def sweep_expired_reservations(self, batch_size=500):
+        """Libera las reservas caducadas en lotes de batch_size, cada lote en
+        su propia transacción corta. Devuelve el número de reservas liberadas."""
+        def run():
+            with self.transaction() as conn:
+                return self._release_expired(conn.cursor(), int(time.time()), limit=batch_size)
+
+        released = 0
+        try:
+            while True:
+                count = self.run_with_retry(run)
+                released += count
+                if count < batch_size:
+                    return released
+        except sqlite3.Error as e:
+            print(f"Error al liberar reservas caducadas: {e}")
+            return released
+
+    def get_order(self, order_id):
+        """Obtener pedido con sus items (una sola consulta con JOIN)"""
+        try:
+            with self.connection(readonly=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT o.id, o.customer_name, o.customer_email, o.total, o.status, o.created_at,
+                           oi.id, oi.product_id, p.name, oi.quantity, oi.unit_price
+                    FROM orders o
+                    LEFT JOIN order_items oi ON oi.order_id = o.id
+                    LEFT JOIN products p ON p.id = oi.product_id
+                    WHERE o.id = ?
+                    ORDER BY oi.id
+                ''', (order_id,))
+                rows = cursor.fetchall()
+                if not rows:
+                    return None
+                order = self._order_row_to_dict(rows[0])
+                order['items'] = [self._order_item_row_to_dict(r[6:]) for r in rows if r[6] is not None]
+                return order
         except sqlite3.Error as e:
             print(f"Error al obtener pedido: {e}")
             return None
 
+    @staticmethod
+    def _order_row_to_dict(row):
+        return {
+            'id': row[0],
+            'customer_name': row[1],
+            'customer_email': row[2],
+            'total': float(row[3]),
+            'status': row[4],
+            'created_at': row[5]
+        }
+
+    @staticmethod
+    def _order_item_row_to_dict(row):
+        return {
+            'id': row[0],
+            'product_id': row[1],
+            'product_name': row[2],
+            'quantity': row[3],
+            'unit_price': float(row[4])
+        }
+    
     def get_orders(self):
         """Listar pedidos"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT id, customer_name, customer_email, total, status, created_at FROM orders ORDER BY created_at DESC')
-            columns = [d[0] for d in cursor.description]
-            orders = [dict(zip(columns, row)) for row in cursor.fetchall()]
-            conn.close()
-            return orders
+            with self.connection(readonly=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT id, customer_name, customer_email, total, status, created_at FROM orders ORDER BY created_at DESC, id DESC')
+                columns = [d[0] for d in cursor.description]
+                orders = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                return orders
         except sqlite3.Error as e:
             print(f"Error al listar pedidos: {e}")
             return []
+
+    def get_orders_page(self, limit=50, after=None, status=None, customer_email=None,
+                        start_date=None, end_date=None, expand_items=False):
+        """Página de pedidos, del más reciente al más antiguo (keyset sobre created_at, id).
+
+        Cada pedido incluye item_count (líneas) y units (unidades). Con
+        expand_items=True se añaden las líneas de todos los pedidos de la
+        página con una sola consulta. start_date/end_date (YYYY-MM-DD) son
+        inclusivos. Devuelve (pedidos, next_cursor); ValueError si el cursor
+        no es válido.
+        """
+        query = '''
+            SELECT o.id, o.customer_name, o.customer_email, o.total, o.status, o.created_at,
+                   (SELECT COUNT(*) FROM order_items oi WHERE oi.order_id = o.id),
+                   (SELECT COALESCE(SUM(oi.quantity), 0) FROM order_items oi WHERE oi.order_id = o.id)
+            FROM orders o
+            WHERE 1 = 1
+        '''
+        params = []
+        if status:
+            query += ' AND o.status = ?'
+            params.append(status)
+        if customer_email:
+            query += ' AND o.customer_email = ?'
+            params.append(customer_email)
+        if start_date:
+            query += ' AND o.created_at >= ?'
+            params.append(start_date)
+        if end_date:
+            query += " AND o.created_at < date(?, '+1 day')"
+            params.append(end_date)
+        if after:
+            query += ' AND (o.created_at, o.id) < (?, ?)'
+            params.extend(decode_cursor(after, 2))
+        query += ' ORDER BY o.created_at DESC, o.id DESC LIMIT ?'
+        params.append(limit + 1)
+
+        try:
+            with self.connection(readonly=True) as conn:
+                cursor = conn.cursor()
+                rows = cursor.execute(query, params).fetchall()
+                has_more = len(rows) > limit
+                rows = rows[:limit]
+                orders = []
+                for row in rows:
+                    order = self._order_row_to_dict(row)
+                    order['item_count'] = row[6]
+                    order['units'] = row[7]
+                    orders.append(order)
+
+                if expand_items and orders:
+                    by_id = {order['id']: order for order in orders}
+                    for order in orders:
+                        order['items'] = []
+                    placeholders = ','.join('?' * len(by_id))
+                    cursor.execute(f'''
+                        SELECT oi.order_id, oi.id, oi.product_id, p.name, oi.quantity, oi.unit_price
+                        FROM order_items oi
+                        LEFT JOIN products p ON p.id = oi.product_id
+                        WHERE oi.order_id IN ({placeholders})
+                        ORDER BY oi.order_id, oi.id
+                    ''', list(by_id))
+                    for item in cursor.fetchall():
+                        by_id[item[0]]['items'].append(self._order_item_row_to_dict(item[1:]))
+        except sqlite3.Error as e:
+            print(f"Error al listar pedidos: {e}")
+            return [], None
+
+        next_cursor = None
+        if has_more and rows:
+            next_cursor = encode_cursor([rows[-1][5], rows[-1][0]])
+        return orders, next_cursor
     
+    # ==================== ANALÍTICA DE VENTAS (product_sales_daily) ====================
+
+    @staticmethod
+    def _sales_range(start_date=None, end_date=None):
+        """Condición y parámetros del rango de días (YYYY-MM-DD, inclusivo)"""
+        clause, params = '', []
+        if start_date:
+            clause += ' AND s.day >= ?'
+            params.append(start_date)
+        if end_date:
+            clause += ' AND s.day <= ?'
+            params.append(end_date)
+        return clause, params
+
+    def get_top_sellers(self, start_date=None, end_date=None, limit=10, order_by='quantity'):
+        """Productos más vendidos en el rango, por unidades ('quantity') o ingresos ('revenue')"""
+        order_column = 'revenue' if order_by == 'revenue' else 'quantity'
+        clause, params = self._sales_range(start_date, end_date)
+        try:
+            with self.connection(readonly=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT s.product_id, p.name, p.category,
+                           SUM(s.quantity) AS quantity, SUM(s.revenue) AS revenue, SUM(s.orders)
+                    FROM product_sales_daily s
+                    LEFT JOIN products p ON p.id = s.product_id
+                    WHERE 1 = 1 {clause}
+                    GROUP BY s.product_id
+                    ORDER BY {order_column} DESC, s.product_id
+                    LIMIT ?
+                ''', params + [limit])
+                return [{
+                    'product_id': row[0],
+                    'name': row[1],
+                    'category': row[2],
+                    'quantity': row[3],
+                    'revenue': round(row[4], 2),
+                    'orders': row[5]
+                } for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            print(f"Error al obtener productos más vendidos: {e}")
+            return []
+
+    def get_revenue_by_day(self, start_date=None, end_date=None):
+        """Ingresos y unidades vendidas por día, en orden cronológico"""
+        clause, params = self._sales_range(start_date, end_date)
+        try:
+            with self.connection(readonly=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT s.day, SUM(s.revenue), SUM(s.quantity)
+                    FROM product_sales_daily s
+                    WHERE 1 = 1 {clause}
+                    GROUP BY s.day
+                    ORDER BY s.day
+                ''', params)
+                return [{'day': row[0], 'revenue': round(row[1], 2), 'quantity': row[2]}
+                        for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            print(f"Error al obtener ingresos por día: {e}")
+            return []
+
+    def get_revenue_by_category(self, start_date=None, end_date=None):
+        """Ingresos y unidades por categoría de producto (categoría actual del producto)"""
+        clause, params = self._sales_range(start_date, end_date)
+        try:
+            with self.connection(readonly=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT COALESCE(p.category, 'Sin categoría') AS category,
+                           SUM(s.revenue) AS revenue, SUM(s.quantity)
+                    FROM product_sales_daily s
+                    LEFT JOIN products p ON p.id = s.product_id
+                    WHERE 1 = 1 {clause}
+                    GROUP BY category
+                    ORDER BY revenue DESC
+                ''', params)
+                return [{'category': row[0], 'revenue': round(row[1], 2), 'quantity': row[2]}
+                        for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            print(f"Error al obtener ingresos por categoría: {e}")
+            return []
+
+    def get_low_stock_products(self, threshold=5, days=30, limit=50):
+        """Productos con stock <= threshold, del más escaso al menos escaso.
+
+        Incluye las unidades vendidas en los últimos `days` días y, si hubo
+        ventas, los días de stock restantes al ritmo de venta medio.
+        """
+        try:
+            with self.connection(readonly=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT p.id, p.name, p.category, p.stock, COALESCE(s.sold, 0)
+                    FROM products p
+                    LEFT JOIN (
+                        SELECT product_id, SUM(quantity) AS sold
+                        FROM product_sales_daily
+                        WHERE day >= date('now', ?)
+                        GROUP BY product_id
+                    ) s ON s.product_id = p.id
+                    WHERE p.stock <= ?
+                    ORDER BY p.stock, p.id
+                    LIMIT ?
+                ''', (f'-{int(days)} days', threshold, limit))
+                products = []
+                for row in cursor.fetchall():
+                    sold = row[4]
+                    products.append({
+                        'id': row[0],
+                        'name': row[1],
+                        'category': row[2],
+                        'stock': row[3],
+                        'sold_last_days': sold,
+                        'days_of_stock': round(row[3] * days / sold, 1) if sold else None
+                    })
+                return products
+        except sqlite3.Error as e:
+            print(f"Error al obtener productos con stock bajo: {e}")
+            return []
+
+    def rebuild_product_sales_daily(self):
+        """Recalcula product_sales_daily a partir de orders y order_items.
+        Devuelve el número de filas (día, producto) generadas."""
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM product_sales_daily')
+                cursor.execute(SALES_DAILY_REBUILD_SQL)
+                return cursor.rowcount
+        except sqlite3.Error as e:
+            print(f"Error al reconstruir agregados de ventas: {e}")
+            return None
+
     # ==================== MÉTODOS PARA EMPLEADOS (EMPLOYEE MANAGER) ====================
     
     def get_all_employees(self):
         """Obtener todos los empleados"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, employee_id, first_name, last_name, email, phone, department, position, salary, hire_date, COALESCE(status, 'active') AS status, created_at
-                FROM employees
-                ORDER BY first_name, last_name
-            ''')
+            with self.connection(readonly=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, employee_id, first_name, last_name, email, phone, department, position, salary, hire_date, COALESCE(status, 'active') AS status, created_at
+                    FROM employees
+                    ORDER BY first_name, last_name
+                ''')
             
-            columns = [description[0] for description in cursor.description]
-            employees = []
+                columns = [description[0] for description in cursor.description]
+                employees = []
             
-            for row in cursor.fetchall():
-                employee = dict(zip(columns, row))
-                employees.append(employee)
+                for row in cursor.fetchall():
+                    employee = dict(zip(columns, row))
+                    employees.append(employee)
             
-            conn.close()
-            return employees
+                return employees
             
         except sqlite3.Error as e:
             print(f"Error al obtener empleados: {e}")
@@ -481,21 +1234,20 @@ class PortfolioDatabase:
     def get_employee_by_email(self, email):
         """Verificar si existe un empleado con el email dado"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, employee_id, first_name, last_name, email
-                FROM employees
-                WHERE email = ?
-            ''', (email,))
+            with self.connection(readonly=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, employee_id, first_name, last_name, email
+                    FROM employees
+                    WHERE email = ?
+                ''', (email,))
             
-            row = cursor.fetchone()
-            conn.close()
+                row = cursor.fetchone()
             
-            if row:
-                columns = [description[0] for description in cursor.description]
-                return dict(zip(columns, row))
-            return None
+                if row:
+                    columns = [description[0] for description in cursor.description]
+                    return dict(zip(columns, row))
+                return None
             
         except sqlite3.Error as e:
             print(f"Error al buscar empleado por email: {e}")
@@ -504,21 +1256,20 @@ class PortfolioDatabase:
     def get_employee_by_employee_id(self, employee_id):
         """Verificar si existe un empleado con el employee_id dado"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, employee_id, first_name, last_name, email
-                FROM employees
-                WHERE employee_id = ?
-            ''', (employee_id,))
+            with self.connection(readonly=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, employee_id, first_name, last_name, email
+                    FROM employees
+                    WHERE employee_id = ?
+                ''', (employee_id,))
             
-            row = cursor.fetchone()
-            conn.close()
+                row = cursor.fetchone()
             
-            if row:
-                columns = [description[0] for description in cursor.description]
-                return dict(zip(columns, row))
-            return None
+                if row:
+                    columns = [description[0] for description in cursor.description]
+                    return dict(zip(columns, row))
+                return None
             
         except sqlite3.Error as e:
             print(f"Error al buscar empleado por employee_id: {e}")
@@ -527,21 +1278,20 @@ class PortfolioDatabase:
     def add_employee(self, employee_id, first_name, last_name, email, phone=None, department=None, position=None, salary=0, hire_date=None, status='active'):
         """Agregar un nuevo empleado"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+            with self.connection() as conn:
+                cursor = conn.cursor()
             
-            if hire_date is None:
-                hire_date = datetime.now().strftime('%Y-%m-%d')
+                if hire_date is None:
+                    hire_date = datetime.now().strftime('%Y-%m-%d')
             
-            cursor.execute('''
-                INSERT INTO employees (employee_id, first_name, last_name, email, phone, department, position, salary, hire_date, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (employee_id, first_name, last_name, email, phone, department, position, salary, hire_date, status))
+                cursor.execute('''
+                    INSERT INTO employees (employee_id, first_name, last_name, email, phone, department, position, salary, hire_date, status)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (employee_id, first_name, last_name, email, phone, department, position, salary, hire_date, status))
             
-            conn.commit()
-            employee_db_id = cursor.lastrowid
-            conn.close()
-            return employee_db_id
+                conn.commit()
+                employee_db_id = cursor.lastrowid
+                return employee_db_id
             
         except sqlite3.Error as e:
             print(f"Error al agregar empleado: {e}")
@@ -550,54 +1300,44 @@ class PortfolioDatabase:
     def update_employee(self, employee_id, data):
         """Actualizar un empleado"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # Construir la consulta dinámicamente basada en los campos proporcionados
-            fields = []
-            values = []
-            
-            allowed_fields = ['employee_id', 'first_name', 'last_name', 'email', 'phone', 'department', 'position', 'salary', 'hire_date', 'status']
-            
-            for field in allowed_fields:
-                if field in data:
-                    fields.append(f"{field} = ?")
-                    values.append(data[field])
-            
-            if not fields:
-                conn.close()
+            # Consulta según los campos proporcionados (SQL en caché por combinación de campos)
+            query, values = EMPLOYEE_UPDATE.build(data, employee_id)
+            if query is None:
                 return False
+
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(query, values)
+                conn.commit()
+                result = cursor.rowcount > 0
             
-            values.append(employee_id)
-            
-            query = f'''
-                UPDATE employees 
-                SET {', '.join(fields)}
-                WHERE id = ?
-            '''
-            
-            cursor.execute(query, values)
-            conn.commit()
-            result = cursor.rowcount > 0
-            conn.close()
-            
-            return result
+                return result
             
         except sqlite3.Error as e:
             print(f"Error al actualizar empleado: {e}")
             return False
+
+    def bulk_update_employees(self, updates):
+        """Actualizar varios empleados en una transacción.
+        updates: lista de dicts con 'id' y los campos a cambiar.
+        Devuelve {'updated': n, 'errors': [...]} como bulk_update_products
+        (None si hubo un error de base de datos)."""
+        try:
+            return self._bulk_update(EMPLOYEE_UPDATE, updates)
+        except sqlite3.Error as e:
+            print(f"Error al actualizar empleados: {e}")
+            return None
     
     def delete_employee(self, employee_id):
         """Eliminar un empleado"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM employees WHERE id = ?', (employee_id,))
-            conn.commit()
-            result = cursor.rowcount > 0
-            conn.close()
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM employees WHERE id = ?', (employee_id,))
+                conn.commit()
+                result = cursor.rowcount > 0
             
-            return result
+                return result
             
         except sqlite3.Error as e:
             print(f"Error al eliminar empleado: {e}")
@@ -606,38 +1346,56 @@ class PortfolioDatabase:
     # ==================== MÉTODOS PARA AUTENTICACIÓN ====================
     
     def authenticate_user(self, username, password):
-        """Autenticar usuario"""
+        """Autenticar usuario.
+        La verificación del hash se hace tras devolver la conexión al pool;
+        los hashes heredados o débiles se actualizan tras un login correcto.
+        Lanza HasherBusy si el servicio de hash está saturado."""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, username, email, password_hash, role
-                FROM users
-                WHERE username = ?
-            ''', (username,))
-            row = cursor.fetchone()
-            conn.close()
-            if row and check_password_hash(row[3], password):
-                return row
-            return None
+            with self.connection(readonly=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, username, email, password_hash, role
+                    FROM users
+                    WHERE username = ?
+                ''', (username,))
+                row = cursor.fetchone()
         except sqlite3.Error as e:
             print(f"Error al autenticar usuario: {e}")
             return None
+        if row and self.credentials.verify(row[0], row[3], password,
+                                           on_upgrade=partial(self._upgrade_password_hash, row[0], row[3])):
+            return row
+        return None
+
+    def _upgrade_password_hash(self, user_id, old_hash, new_hash):
+        """Sustituye el hash de un usuario solo si no ha cambiado desde que se leyó.
+        No toca updated_at: la tabla puede haberla creado Employee Manager, sin esa columna."""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE users SET password_hash = ?
+                    WHERE id = ? AND password_hash = ?
+                ''', (new_hash, user_id, old_hash))
+                conn.commit()
+                return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            print(f"Error al actualizar hash de contraseña: {e}")
+            return False
 
     # NUEVO: Búsqueda case-insensitive para validar existencia previa
     def get_user_by_username_ci(self, username):
         """Obtener usuario por username, comparación case-insensitive y con trim"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, username, email, role
-                FROM users
-                WHERE LOWER(TRIM(username)) = LOWER(TRIM(?))
-            ''', (username,))
-            row = cursor.fetchone()
-            conn.close()
-            return row
+            with self.connection(readonly=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, username, email, role
+                    FROM users
+                    WHERE LOWER(TRIM(username)) = LOWER(TRIM(?))
+                ''', (username,))
+                row = cursor.fetchone()
+                return row
         except sqlite3.Error as e:
             print(f"Error al buscar usuario por username: {e}")
             return None
@@ -645,35 +1403,34 @@ class PortfolioDatabase:
     def get_user_by_email_ci(self, email):
         """Obtener usuario por email, comparación case-insensitive y con trim"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, username, email, role
-                FROM users
-                WHERE LOWER(TRIM(email)) = LOWER(TRIM(?))
-            ''', (email,))
-            row = cursor.fetchone()
-            conn.close()
-            return row
+            with self.connection(readonly=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, username, email, role
+                    FROM users
+                    WHERE LOWER(TRIM(email)) = LOWER(TRIM(?))
+                ''', (email,))
+                row = cursor.fetchone()
+                return row
         except sqlite3.Error as e:
             print(f"Error al buscar usuario por email: {e}")
             return None
 
     def set_user_password_by_email(self, email, new_plain_password):
         """Actualizar la contraseña (hash) de un usuario encontrado por email."""
+        # El hash se calcula antes de tomar la conexión de escritura
+        new_hash = self.credentials.hash(new_plain_password)
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            new_hash = generate_password_hash(new_plain_password)
-            cursor.execute('''
-                UPDATE users
-                SET password_hash = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE LOWER(TRIM(email)) = LOWER(TRIM(?))
-            ''', (new_hash, email))
-            conn.commit()
-            updated = cursor.rowcount > 0
-            conn.close()
-            return updated
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE users
+                    SET password_hash = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE LOWER(TRIM(email)) = LOWER(TRIM(?))
+                ''', (new_hash, email))
+                conn.commit()
+                updated = cursor.rowcount > 0
+                return updated
         except sqlite3.Error as e:
             print(f"Error al actualizar contraseña de usuario: {e}")
             return False
@@ -681,22 +1438,21 @@ class PortfolioDatabase:
     # NUEVO: Registro de usuario con hash y rol
     def create_user(self, username, email, password, role='customer'):
         """Crear usuario con contraseña hasheada y rol (admin/customer/user). Devuelve id o None"""
+        password_hash = self.credentials.hash(password)
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            role_val = role if role in ('admin', 'customer', 'user') else 'customer'
-            password_hash = generate_password_hash(password)
-            # Trim para evitar espacios accidentales
-            username_clean = (username or '').strip()
-            email_clean = (email or '').strip()
-            cursor.execute('''
-                INSERT INTO users (username, email, password_hash, role)
-                VALUES (?, ?, ?, ?)
-            ''', (username_clean, email_clean, password_hash, role_val))
-            user_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
-            return user_id
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                role_val = role if role in ('admin', 'customer', 'user') else 'customer'
+                # Trim para evitar espacios accidentales
+                username_clean = (username or '').strip()
+                email_clean = (email or '').strip()
+                cursor.execute('''
+                    INSERT INTO users (username, email, password_hash, role)
+                    VALUES (?, ?, ?, ?)
+                ''', (username_clean, email_clean, password_hash, role_val))
+                user_id = cursor.lastrowid
+                conn.commit()
+                return user_id
         except sqlite3.IntegrityError as e:
             # Violación de UNIQUE (username/email)
             print(f"Error al registrar usuario (integridad): {e}")
@@ -708,17 +1464,16 @@ class PortfolioDatabase:
     def get_user_by_id(self, user_id):
         """Obtener usuario por ID"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, username, email, role, created_at
-                FROM users
-                WHERE id = ?
-            ''', (user_id,))
+            with self.connection(readonly=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, username, email, role, created_at
+                    FROM users
+                    WHERE id = ?
+                ''', (user_id,))
             
-            result = cursor.fetchone()
-            conn.close()
-            return result
+                result = cursor.fetchone()
+                return result
         except sqlite3.Error as e:
             print(f"Error al obtener usuario: {e}")
             return None
@@ -726,26 +1481,25 @@ class PortfolioDatabase:
     def get_all_categories(self):
         """Obtener todas las categorías"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, name, type, color, created_at
-                FROM categories
-                ORDER BY type, name
-            ''')
+            with self.connection(readonly=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, name, type, color, created_at
+                    FROM categories
+                    ORDER BY type, name
+                ''')
             
-            categories = []
-            for row in cursor.fetchall():
-                categories.append({
-                    'id': row[0],
-                    'name': row[1],
-                    'type': row[2],
-                    'color': row[3],
-                    'created_at': row[4]
-                })
+                categories = []
+                for row in cursor.fetchall():
+                    categories.append({
+                        'id': row[0],
+                        'name': row[1],
+                        'type': row[2],
+                        'color': row[3],
+                        'created_at': row[4]
+                    })
             
-            conn.close()
-            return categories
+                return categories
             
         except sqlite3.Error as e:
             print(f"Error al obtener categorías: {e}")
@@ -754,170 +1508,329 @@ class PortfolioDatabase:
     def add_transaction(self, user_id, amount, transaction_type, category_id, description, transaction_date):
         """Agregar una nueva transacción"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO transactions (user_id, amount, type, category_id, description, transaction_date)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, amount, transaction_type, category_id, description, transaction_date))
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO transactions (user_id, amount, type, category_id, description, transaction_date)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (user_id, amount, transaction_type, category_id, description, transaction_date))
             
-            transaction_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
-            return transaction_id
+                transaction_id = cursor.lastrowid
+                self._apply_rollup_delta(cursor, user_id, transaction_date, transaction_type, category_id, amount, 1)
+                conn.commit()
+                return transaction_id
             
         except sqlite3.Error as e:
             print(f"Error al agregar transacción: {e}")
             return None
     
+    def _transactions_query(self, user_id, start_date=None, end_date=None, category_id=None, after=None):
+        """Construye la consulta de transacciones de un usuario.
+
+        Ordena por (transaction_date, created_at, id) descendente, que es el
+        orden del índice idx_transactions_user_keyset; after=(fecha,
+        created_at, id) continúa justo después de esa fila (paginación keyset).
+        """
+        query = '''
+            SELECT t.id, t.amount, t.type, t.category_id, t.description, t.transaction_date, t.created_at,
+                   c.name as category_name, c.color as category_color
+            FROM transactions t
+            JOIN categories c ON t.category_id = c.id
+            WHERE t.user_id = ?
+        '''
+        params = [user_id]
+    
+        if start_date:
+            query += ' AND t.transaction_date >= ?'
+            params.append(start_date)
+    
+        if end_date:
+            query += ' AND t.transaction_date <= ?'
+            params.append(end_date)
+    
+        if category_id:
+            query += ' AND t.category_id = ?'
+            params.append(category_id)
+
+        if after:
+            query += ' AND (t.transaction_date, t.created_at, t.id) < (?, ?, ?)'
+            params.extend(after)
+    
+        query += ' ORDER BY t.transaction_date DESC, t.created_at DESC, t.id DESC'
+        return query, params
+
+    @staticmethod
+    def _transaction_row_to_dict(row):
+        return {
+            'id': row[0],
+            'amount': float(row[1]),
+            'type': row[2],
+            'category_id': row[3],
+            'description': row[4],
+            'transaction_date': row[5],
+            'created_at': row[6],
+            'category_name': row[7],
+            'category_color': row[8]
+        }
+
     def get_transactions_by_user(self, user_id, start_date=None, end_date=None, category_id=None):
         """Obtener transacciones de un usuario con filtros opcionales"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            query = '''
-                SELECT t.id, t.amount, t.type, t.category_id, t.description, t.transaction_date, t.created_at,
-                       c.name as category_name, c.color as category_color
-                FROM transactions t
-                JOIN categories c ON t.category_id = c.id
-                WHERE t.user_id = ?
-            '''
-            params = [user_id]
-            
-            if start_date:
-                query += ' AND t.transaction_date >= ?'
-                params.append(start_date)
-            
-            if end_date:
-                query += ' AND t.transaction_date <= ?'
-                params.append(end_date)
-            
-            if category_id:
-                query += ' AND t.category_id = ?'
-                params.append(category_id)
-            
-            query += ' ORDER BY t.transaction_date DESC, t.created_at DESC'
-            
-            cursor.execute(query, params)
-            
-            transactions = []
-            for row in cursor.fetchall():
-                transactions.append({
-                    'id': row[0],
-                    'amount': float(row[1]),
-                    'type': row[2],
-                    'category_id': row[3],
-                    'description': row[4],
-                    'transaction_date': row[5],
-                    'created_at': row[6],
-                    'category_name': row[7],
-                    'category_color': row[8]
-                })
-            
-            conn.close()
-            return transactions
-            
+            return list(self.iter_transactions_by_user(user_id, start_date, end_date, category_id))
         except sqlite3.Error as e:
             print(f"Error al obtener transacciones: {e}")
             return []
+
+    def iter_transactions_by_user(self, user_id, start_date=None, end_date=None, category_id=None,
+                                  after=None, chunk_size=500):
+        """Generador de transacciones leídas del cursor por bloques (fetchmany).
+
+        La memoria usada es constante sea cual sea el historial. La conexión
+        se toma del pool de lectura y se devuelve al agotar o cerrar el
+        generador.
+        """
+        query, params = self._transactions_query(user_id, start_date, end_date, category_id, after)
+        # Si el hilo ya tiene una conexión de escritura se reutiliza (ve sus cambios)
+        conn = self.pool.current()
+        pool = None
+        if conn is None:
+            pool = self.read_pool
+            conn = pool.acquire()
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._transaction_row_to_dict(row)
+        finally:
+            if pool is not None:
+                pool.release(conn)
+
+    def get_transactions_page(self, user_id, limit=50, after=None, start_date=None, end_date=None, category_id=None):
+        """Página de transacciones con paginación keyset.
+
+        after es el token next_cursor devuelto por la página anterior.
+        Devuelve (transacciones, next_cursor); next_cursor es None en la última
+        página. Lanza ValueError si el cursor no es válido.
+        """
+        after_values = decode_cursor(after, 3) if after else None
+        query, params = self._transactions_query(user_id, start_date, end_date, category_id, after_values)
+        query += ' LIMIT ?'
+        params.append(limit + 1)
+        try:
+            with self.connection(readonly=True) as conn:
+                rows = conn.execute(query, params).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error al obtener transacciones: {e}")
+            return [], None
+        transactions = [self._transaction_row_to_dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = transactions[-1]
+            next_cursor = encode_cursor([last['transaction_date'], last['created_at'], last['id']])
+        return transactions, next_cursor
     
     def get_monthly_summary(self, user_id, year, month):
         """Obtener resumen mensual de ingresos y gastos"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+            with self.connection(readonly=True) as conn:
+                cursor = conn.cursor()
             
-            # Calcular totales por tipo
-            cursor.execute('''
-                SELECT type, SUM(amount) as total
-                FROM transactions
-                WHERE user_id = ? 
-                AND strftime('%Y', transaction_date) = ? 
-                AND strftime('%m', transaction_date) = ?
-                GROUP BY type
-            ''', (user_id, str(year), f"{month:02d}"))
-            
-            summary = {'income': 0, 'expense': 0, 'balance': 0}
-            for row in cursor.fetchall():
-                summary[row[0]] = float(row[1])
+                # Lectura desde los agregados materializados: O(categorías)
+                year_month = f"{int(year):04d}-{int(month):02d}"
+
+                # Calcular totales por tipo
+                cursor.execute('''
+                    SELECT type, SUM(total) as total
+                    FROM monthly_rollups
+                    WHERE user_id = ? AND year_month = ?
+                    GROUP BY type
+                ''', (user_id, year_month))
             
-            summary['balance'] = summary['income'] - summary['expense']
+                summary = {'income': 0, 'expense': 0, 'balance': 0}
+                for row in cursor.fetchall():
+                    summary[row[0]] = round(float(row[1]), 2)
             
-            # Obtener gastos por categoría
-            cursor.execute('''
-                SELECT c.name, c.color, SUM(t.amount) as total
-                FROM transactions t
-                JOIN categories c ON t.category_id = c.id
-                WHERE t.user_id = ? 
-                AND t.type = 'expense'
-                AND strftime('%Y', t.transaction_date) = ? 
-                AND strftime('%m', t.transaction_date) = ?
-                GROUP BY c.id, c.name, c.color
-                ORDER BY total DESC
-            ''', (user_id, str(year), f"{month:02d}"))
-            
-            expenses_by_category = []
-            for row in cursor.fetchall():
-                expenses_by_category.append({
-                    'category': row[0],
-                    'color': row[1],
-                    'amount': float(row[2])
-                })
+                summary['balance'] = round(summary['income'] - summary['expense'], 2)
+            
+                # Obtener gastos por categoría
+                cursor.execute('''
+                    SELECT c.name, c.color, SUM(r.total) as total
+                    FROM monthly_rollups r
+                    JOIN categories c ON r.category_id = c.id
+                    WHERE r.user_id = ? 
+                    AND r.year_month = ?
+                    AND r.type = 'expense'
+                    GROUP BY c.id, c.name, c.color
+                    ORDER BY total DESC
+                ''', (user_id, year_month))
+            
+                expenses_by_category = []
+                for row in cursor.fetchall():
+                    expenses_by_category.append({
+                        'category': row[0],
+                        'color': row[1],
+                        'amount': round(float(row[2]), 2)
+                    })
             
-            summary['expenses_by_category'] = expenses_by_category
+                summary['expenses_by_category'] = expenses_by_category
             
-            conn.close()
-            return summary
+                return summary
             
         except sqlite3.Error as e:
             print(f"Error al obtener resumen mensual: {e}")
             return {'income': 0, 'expense': 0, 'balance': 0, 'expenses_by_category': []}
 
     def update_transaction(self, transaction_id, user_id, data):
-        """Actualizar una transacción de un usuario"""
+        """Actualizar una transacción de un usuario.
+        La fila anterior se lee dentro de la misma transacción inmediata que la
+        escribe y mueve su importe en monthly_rollups: dos actualizaciones
+        simultáneas no pueden partir de la misma fila antigua."""
+        query, values = TRANSACTION_UPDATE.build(
+            {k: v for k, v in data.items() if v is not None}, transaction_id, user_id
+        )
+        if query is None:
+            return False
+
+        def run():
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT amount, type, category_id, transaction_date
+                    FROM transactions
+                    WHERE id = ? AND user_id = ?
+                ''', (transaction_id, user_id))
+                old = cursor.fetchone()
+                if not old:
+                    return False
+                cursor.execute(query, values)
+                updated = cursor.rowcount
+                # Mover el importe entre cubetas si cambió monto, tipo, categoría o fecha
+                new = tuple(
+                    data[field] if data.get(field) is not None else old[i]
+                    for i, field in enumerate(['amount', 'type', 'category_id', 'transaction_date'])
+                )
+                if updated and new != tuple(old):
+                    self._apply_rollup_delta(cursor, user_id, old[3], old[1], old[2], -float(old[0]), -1)
+                    self._apply_rollup_delta(cursor, user_id, new[3], new[1], new[2], float(new[0]), 1)
+                return updated > 0
+
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            fields = []
-            values = []
-            for field in ['amount', 'type', 'category_id', 'description', 'transaction_date']:
-                if field in data and data[field] is not None:
-                    fields.append(f"{field} = ?")
-                    values.append(data[field])
-            if not fields:
-                conn.close()
-                return False
-            values.extend([transaction_id, user_id])
-            query = f'''
-                UPDATE transactions
-                SET {', '.join(fields)}
-                WHERE id = ? AND user_id = ?
-            '''
-            cursor.execute(query, values)
-            updated = cursor.rowcount
-            conn.commit()
-            conn.close()
-            return updated > 0
+            return self.run_with_retry(run)
         except sqlite3.Error as e:
             print(f"Error al actualizar transacción: {e}")
             return False
 
     def delete_transaction(self, transaction_id, user_id):
-        """Eliminar transacción por id del usuario"""
+        """Eliminar transacción por id del usuario (lectura, borrado y ajuste de
+        monthly_rollups en una sola transacción inmediata)"""
+        def run():
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT amount, type, category_id, transaction_date
+                    FROM transactions
+                    WHERE id = ? AND user_id = ?
+                ''', (transaction_id, user_id))
+                old = cursor.fetchone()
+                if not old:
+                    return False
+                cursor.execute('DELETE FROM transactions WHERE id = ? AND user_id = ?', (transaction_id, user_id))
+                deleted = cursor.rowcount
+                if deleted:
+                    self._apply_rollup_delta(cursor, user_id, old[3], old[1], old[2], -float(old[0]), -1)
+                return deleted > 0
+
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM transactions WHERE id = ? AND user_id = ?', (transaction_id, user_id))
-            deleted = cursor.rowcount
-            conn.commit()
-            conn.close()
-            return deleted > 0
+            return self.run_with_retry(run)
         except sqlite3.Error as e:
             print(f"Error al eliminar transacción: {e}")
             return False
 
+    # ==================== AGREGADOS MENSUALES (monthly_rollups) ====================
+
+    def _apply_rollup_delta(self, cursor, user_id, transaction_date, transaction_type, category_id, amount, count):
+        """Suma (o resta) un importe a la cubeta (usuario, mes, tipo, categoría).
+        Debe llamarse en la misma transacción que modifica la tabla transactions."""
+        year_month = str(transaction_date)[:7]
+        cursor.execute('''
+            INSERT INTO monthly_rollups (user_id, year_month, type, category_id, total, count)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, year_month, type, category_id)
+            DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+        ''', (user_id, year_month, transaction_type, category_id, amount, count))
+        if count < 0:
+            cursor.execute('''
+                DELETE FROM monthly_rollups
+                WHERE user_id = ? AND year_month = ? AND type = ? AND category_id = ? AND count <= 0
+            ''', (user_id, year_month, transaction_type, category_id))
+
+    def rebuild_monthly_rollups(self, repair=True):
+        """Verifica monthly_rollups contra las transacciones y, si repair=True,
+        lo reconstruye. Devuelve un informe con las cubetas discrepantes."""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT user_id, substr(transaction_date, 1, 7), type, category_id, SUM(amount), COUNT(*)
+                    FROM transactions
+                    GROUP BY user_id, substr(transaction_date, 1, 7), type, category_id
+                ''')
+                expected = {row[:4]: (float(row[4]), row[5]) for row in cursor.fetchall()}
+                cursor.execute('''
+                    SELECT user_id, year_month, type, category_id, total, count
+                    FROM monthly_rollups
+                ''')
+                actual = {row[:4]: (float(row[4]), row[5]) for row in cursor.fetchall()}
+
+                mismatches = []
+                for key in set(expected) | set(actual):
+                    exp_total, exp_count = expected.get(key, (0.0, 0))
+                    act_total, act_count = actual.get(key, (0.0, 0))
+                    if exp_count != act_count or abs(exp_total - act_total) > 0.005:
+                        mismatches.append({
+                            'user_id': key[0],
+                            'year_month': key[1],
+                            'type': key[2],
+                            'category_id': key[3],
+                            'expected': {'total': round(exp_total, 2), 'count': exp_count},
+                            'actual': {'total': round(act_total, 2), 'count': act_count}
+                        })
+
+                repaired = False
+                if mismatches and repair:
+                    cursor.execute('DELETE FROM monthly_rollups')
+                    cursor.execute(ROLLUPS_REBUILD_SQL)
+                    conn.commit()
+                    repaired = True
+                return {'buckets': len(expected), 'mismatches': mismatches, 'repaired': repaired}
+        except sqlite3.Error as e:
+            print(f"Error al reconstruir agregados mensuales: {e}")
+            return None
+
 if __name__ == "__main__":
+    import sys
     # Inicializar la base de datos
     db = PortfolioDatabase()
-    db.insert_sample_data()
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == 'migrate':
+        # python database.py migrate: aplica las migraciones pendientes y muestra la versión
+        with db.connection(readonly=True) as conn:
+            print(f"Versión del esquema: {current_version(conn.cursor())} (última: {LATEST_VERSION})")
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == 'rebuild-rollups':
+        # python database.py rebuild-rollups [--check]
+        report = db.rebuild_monthly_rollups(repair='--check' not in sys.argv)
+        if report is None:
+            sys.exit(1)
+        print(f"Cubetas: {report['buckets']}, discrepancias: {len(report['mismatches'])}, reparado: {report['repaired']}")
+        sys.exit(1 if report['mismatches'] and not report['repaired'] else 0)
+    if len(sys.argv) > 1 and sys.argv[1] == 'rebuild-sales':
+        # python database.py rebuild-sales: recalcula los agregados diarios de ventas
+        rows = db.rebuild_product_sales_daily()
+        if rows is None:
+            sys.exit(1)
+        print(f"Filas (día, producto) de ventas: {rows}")
+        sys.exit(0)
+    db.insert_sample_data()
@@ -0,0 +1,245 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PooledConnection:
+    """Envoltorio de una conexión del pool.
+
+    Se comporta como una conexión sqlite3 normal, pero close() la devuelve al
+    pool en lugar de cerrarla, de modo que el código existente que hace
+    conn.close() sigue funcionando sin abrir el archivo en cada petición.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Igual que sqlite3.Connection: commit/rollback, sin cerrar
+        if exc_type is None:
+            self._raw.commit()
+        else:
+            self._raw.rollback()
+        return False
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool.release(self._raw)
+
+    def __del__(self):
+        # Si el llamador olvidó close(), la conexión vuelve igualmente al pool
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Pool acotado de conexiones SQLite reutilizables.
+
+    - Reutiliza conexiones abiertas (evita abrir el archivo, parsear el esquema
+      y calentar la caché de páginas en cada petición).
+    - Como máximo max_size conexiones abiertas; si todas están en uso se espera
+      hasta timeout segundos.
+    - Comprueba la salud (SELECT 1) de las conexiones que llevan inactivas más
+      de health_check_interval segundos.
+    - Recicla cada conexión después de max_uses usos.
+    - Se reinicia automáticamente tras un fork (gunicorn --preload).
+    """
+
+    def __init__(self, db_path, max_size=8, max_uses=1000, timeout=5.0,
+                 health_check_interval=30.0, on_connect=None, **connect_kwargs):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.max_uses = max_uses
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.on_connect = on_connect
+        self.connect_kwargs = connect_kwargs
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._meta = {}  # id(conn) -> {'uses': n, 'last_used': t}
+        self._open = 0
+        self._local = threading.local()
+        self._stats = {'hits': 0, 'misses': 0, 'waits': 0, 'timeouts': 0,
+                       'recycled': 0, 'discarded': 0}
+
+    def _check_fork(self):
+        # Las conexiones SQLite no deben compartirse entre procesos
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+    def _connect(self):
+        raw = sqlite3.connect(self.db_path, check_same_thread=False, **self.connect_kwargs)
+        if self.on_connect:
+            self.on_connect(raw)
+        self._meta[id(raw)] = {'uses': 0, 'last_used': time.monotonic()}
+        return raw
+
+    def _discard(self, raw):
+        self._meta.pop(id(raw), None)
+        with self._lock:
+            self._open -= 1
+        try:
+            raw.close()
+        except sqlite3.Error:
+            pass
+
+    def _is_healthy(self, raw):
+        meta = self._meta.get(id(raw))
+        if meta is None:
+            return False
+        if time.monotonic() - meta['last_used'] < self.health_check_interval:
+            return True
+        try:
+            raw.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        """Obtiene una conexión cruda del pool (bloquea si está agotado)"""
+        self._check_fork()
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while True:
+            try:
+                raw = self._idle.get_nowait()
+            except queue.Empty:
+                raw = None
+
+            if raw is None:
+                with self._lock:
+                    can_open = self._open < self.max_size
+                    if can_open:
+                        self._open += 1
+                        self._stats['misses'] += 1
+                        if waited:
+                            self._stats['waits'] += 1
+                if can_open:
+                    try:
+                        return self._connect()
+                    except sqlite3.Error:
+                        with self._lock:
+                            self._open -= 1
+                        raise
+                # Pool agotado: esperar a que otro hilo libere una conexión
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    waited = True
+                    try:
+                        raw = self._idle.get(timeout=remaining)
+                    except queue.Empty:
+                        raw = None
+                if raw is None:
+                    with self._lock:
+                        self._stats['timeouts'] += 1
+                    raise sqlite3.OperationalError('Pool de conexiones agotado')
+
+            if self._is_healthy(raw):
+                with self._lock:
+                    self._stats['hits'] += 1
+                    if waited:
+                        self._stats['waits'] += 1
+                return raw
+            with self._lock:
+                self._stats['discarded'] += 1
+            self._discard(raw)
+
+    def release(self, raw):
+        """Devuelve una conexión al pool, descartando transacciones abiertas"""
+        if self._pid != os.getpid():
+            return
+        meta = self._meta.get(id(raw))
+        if meta is None:
+            return
+        try:
+            if raw.in_transaction:
+                raw.rollback()
+        except sqlite3.Error:
+            self._discard(raw)
+            return
+        meta['uses'] += 1
+        meta['last_used'] = time.monotonic()
+        if meta['uses'] >= self.max_uses:
+            with self._lock:
+                self._stats['recycled'] += 1
+            self._discard(raw)
+            return
+        self._idle.put(raw)
+
+    def get(self):
+        """Conexión envuelta cuyo close() la devuelve al pool"""
+        return PooledConnection(self, self.acquire())
+
+    @contextmanager
+    def connection(self):
+        """Context manager con reutilización por hilo.
+
+        Las llamadas anidadas dentro del mismo hilo comparten la misma
+        conexión, así que un método puede llamar a otro sin pedir una segunda
+        conexión al pool. Solo el bloque más externo la devuelve.
+        """
+        self._check_fork()
+        local = self._local
+        raw = getattr(local, 'conn', None)
+        if raw is not None:
+            local.depth += 1
+            try:
+                yield raw
+            finally:
+                local.depth -= 1
+            return
+        raw = self.acquire()
+        local.conn = raw
+        local.depth = 1
+        try:
+            yield raw
+        finally:
+            local.conn = None
+            local.depth = 0
+            self.release(raw)
+
+    def current(self):
+        """Conexión que el hilo actual tiene tomada con connection(), o None"""
+        if self._pid != os.getpid():
+            return None
+        return getattr(self._local, 'conn', None)
+
+    def stats(self):
+        """Estadísticas del pool: aciertos, esperas, conexiones abiertas..."""
+        self._check_fork()
+        with self._lock:
+            data = dict(self._stats)
+            data['open'] = self._open
+        data['idle'] = self._idle.qsize()
+        data['in_use'] = data['open'] - data['idle']
+        data['max_size'] = self.max_size
+        return data
+
+    def close_all(self):
+        """Cierra todas las conexiones inactivas"""
+        while True:
+            try:
+                raw = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(raw)
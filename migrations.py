@@ -0,0 +1,436 @@
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+# Componente con el que PortfolioDatabase registra su versión en schema_version
+# (el backend de Employee Manager usa la misma tabla con su propio componente)
+SCHEMA_COMPONENT = 'portfolio'
+
+# Tablas con contador de cambios (ETag de los listados que dependen de ellas)
+VERSIONED_TABLES = ('products', 'categories', 'employees')
+
+# Recalcula monthly_rollups a partir de las transacciones
+ROLLUPS_REBUILD_SQL = '''
+    INSERT INTO monthly_rollups (user_id, year_month, type, category_id, total, count)
+    SELECT user_id, substr(transaction_date, 1, 7), type, category_id, SUM(amount), COUNT(*)
+    FROM transactions
+    GROUP BY user_id, substr(transaction_date, 1, 7), type, category_id
+'''
+
+# Recalcula product_sales_daily a partir de las líneas de pedido
+SALES_DAILY_REBUILD_SQL = '''
+    INSERT INTO product_sales_daily (day, product_id, quantity, revenue, orders)
+    SELECT date(o.created_at), oi.product_id, SUM(oi.quantity),
+           SUM(oi.quantity * oi.unit_price), COUNT(DISTINCT o.id)
+    FROM order_items oi
+    JOIN orders o ON o.id = oi.order_id
+    GROUP BY date(o.created_at), oi.product_id
+'''
+
+
+def table_exists(cursor, name):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    # fetchall() termina la sentencia (una sentencia abierta impide SAVEPOINT)
+    return bool(cursor.fetchall())
+
+
+# ==================== PASOS DE MIGRACIÓN ====================
+# Cada paso debe poder ejecutarse sobre una base creada antes de existir
+# schema_version (IF NOT EXISTS, comprobaciones previas), porque esas bases
+# empiezan en la versión 0 y reciben todos los pasos.
+
+def _base_tables(cursor):
+    # Tabla para el sistema de autenticación
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            first_name VARCHAR(50),
+            last_name VARCHAR(50),
+            role VARCHAR(20) DEFAULT 'user',
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Tabla para el sistema de empleados (Employee Manager)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS employees (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_id VARCHAR(20) UNIQUE NOT NULL,
+            first_name VARCHAR(50) NOT NULL,
+            last_name VARCHAR(50) NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            phone VARCHAR(20),
+            department VARCHAR(50),
+            position VARCHAR(100),
+            salary DECIMAL(10,2),
+            hire_date DATE,
+            status VARCHAR(20) DEFAULT 'active',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Tabla para categorías de transacciones (Personal Finance Tracker)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name VARCHAR(50) NOT NULL,
+            type VARCHAR(20) NOT NULL CHECK (type IN ('income', 'expense')),
+            color VARCHAR(7) DEFAULT '#007bff',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Índice único para evitar duplicación de categorías por nombre y tipo
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_categories_name_type
+        ON categories (name, type)
+    ''')
+
+    # Tabla para transacciones (Personal Finance Tracker)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount DECIMAL(10,2) NOT NULL CHECK (amount > 0),
+            type VARCHAR(20) NOT NULL CHECK (type IN ('income', 'expense')),
+            category_id INTEGER NOT NULL,
+            description TEXT,
+            transaction_date DATE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE RESTRICT
+        )
+    ''')
+
+    # ==================== TABLAS PARA MINI E-COMMERCE ====================
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            price DECIMAL(10,2) NOT NULL CHECK (price >= 0),
+            stock INTEGER NOT NULL DEFAULT 0 CHECK (stock >= 0),
+            image_url TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_products_name ON products(name)
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_name TEXT,
+            customer_email TEXT,
+            total DECIMAL(10,2) NOT NULL DEFAULT 0,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL CHECK (quantity > 0),
+            unit_price DECIMAL(10,2) NOT NULL,
+            FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+    ''')
+
+
+def _products_category(cursor):
+    # Añadir columna 'category' si no existe
+    cursor.execute("PRAGMA table_info(products)")
+    cols = [row[1] for row in cursor.fetchall()]
+    if 'category' not in cols:
+        cursor.execute("ALTER TABLE products ADD COLUMN category TEXT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_products_category ON products(category)")
+
+
+def _transactions_summary_index(cursor):
+    # Índice de cobertura para resúmenes por rango de fechas: permite
+    # resolver get_monthly_summary sin leer la tabla
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_date_cover
+        ON transactions (user_id, transaction_date, type, category_id, amount)
+    ''')
+
+
+def _monthly_rollups(cursor):
+    # Agregados mensuales materializados (mantenidos por add/update/delete_transaction)
+    rollups_exist = table_exists(cursor, 'monthly_rollups')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS monthly_rollups (
+            user_id INTEGER NOT NULL,
+            year_month TEXT NOT NULL,
+            type VARCHAR(20) NOT NULL,
+            category_id INTEGER NOT NULL,
+            total DECIMAL(12,2) NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, year_month, type, category_id)
+        ) WITHOUT ROWID
+    ''')
+    if not rollups_exist:
+        cursor.execute(ROLLUPS_REBUILD_SQL)
+
+
+def _transactions_keyset_index(cursor):
+    # Índice para listar transacciones en orden (paginación keyset)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_keyset
+        ON transactions (user_id, transaction_date, created_at, id)
+    ''')
+
+
+def _products_fts(cursor):
+    # Índice de texto completo (FTS5) sobre nombre y descripción.
+    # Tabla de contenido externo: no duplica el texto, lo lee de products.
+    # remove_diacritics 2 hace que "cancion" encuentre "canción".
+    fts_exists = table_exists(cursor, 'products_fts')
+    cursor.execute('SAVEPOINT products_fts')
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                name, description,
+                content='products', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+                INSERT INTO products_fts(rowid, name, description)
+                VALUES (new.id, new.name, new.description);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+                INSERT INTO products_fts(products_fts, rowid, name, description)
+                VALUES ('delete', old.id, old.name, old.description);
+            END
+        ''')
+        # Solo cuando cambia el texto: los descuentos de stock no tocan el índice
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description ON products BEGIN
+                INSERT INTO products_fts(products_fts, rowid, name, description)
+                VALUES ('delete', old.id, old.name, old.description);
+                INSERT INTO products_fts(rowid, name, description)
+                VALUES (new.id, new.name, new.description);
+            END
+        ''')
+        if not fts_exists:
+            cursor.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+    except sqlite3.OperationalError as e:
+        # SQLite compilado sin FTS5: get_products usa la búsqueda LIKE
+        cursor.execute('ROLLBACK TO products_fts')
+        logger.warning("FTS5 no disponible, búsqueda con LIKE: %s", e)
+    cursor.execute('RELEASE products_fts')
+
+
+def _table_versions(cursor):
+    # Contadores de cambios por tabla (para ETag / GET condicional).
+    # Los incrementan triggers, así que cuentan también las escrituras
+    # hechas desde otros procesos o backends sobre el mismo archivo.
+    # El valor inicial es aleatorio para que una base recreada no
+    # repita versiones ya servidas.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    for table in VERSIONED_TABLES:
+        cursor.execute('''
+            INSERT OR IGNORE INTO table_versions (table_name, version, updated_at)
+            VALUES (?, abs(random() % 1000000000), CAST(strftime('%s', 'now') AS INTEGER))
+        ''', (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()}
+                AFTER {event} ON {table} BEGIN
+                    UPDATE table_versions
+                    SET version = version + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+                    WHERE table_name = '{table}';
+                END
+            ''')
+
+
+def _orders_indexes(cursor):
+    # Listado de pedidos paginado (keyset sobre created_at, id), también por
+    # estado o email del cliente
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_orders_created
+        ON orders (created_at, id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_orders_status_created
+        ON orders (status, created_at, id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_orders_email_created
+        ON orders (customer_email, created_at, id)
+    ''')
+    # Líneas de un pedido (detalle, recuento y modo expand)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_order_items_order
+        ON order_items (order_id)
+    ''')
+
+
+def _product_sales_daily(cursor):
+    # Ventas diarias por producto (mantenidas por create_order): las consultas
+    # de analítica recorren días x productos en lugar de todas las líneas
+    sales_exist = table_exists(cursor, 'product_sales_daily')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS product_sales_daily (
+            day TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            revenue DECIMAL(12,2) NOT NULL DEFAULT 0,
+            orders INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, product_id)
+        ) WITHOUT ROWID
+    ''')
+    if not sales_exist:
+        cursor.execute(SALES_DAILY_REBUILD_SQL)
+    # Alertas de stock bajo
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_products_stock ON products (stock)
+    ''')
+
+
+def _cart_items(cursor):
+    # Carritos en el servidor: una fila por (carrito, producto); el cliente
+    # solo guarda el identificador opaco del carrito en una cookie
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cart_items (
+            cart_id TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL CHECK (quantity > 0),
+            updated_at INTEGER NOT NULL,
+            PRIMARY KEY (cart_id, product_id)
+        ) WITHOUT ROWID
+    ''')
+    # Limpieza de carritos abandonados
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_cart_items_updated ON cart_items (updated_at)
+    ''')
+
+
+def _stock_reservations(cursor):
+    # Reservas de stock de los carritos, con caducidad. product_reservations
+    # lleva el total reservado por producto (mantenido en las mismas
+    # transacciones) para comprobar la disponibilidad con una sola fila.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stock_reservations (
+            cart_id TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL CHECK (quantity > 0),
+            expires_at INTEGER NOT NULL,
+            PRIMARY KEY (cart_id, product_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_stock_reservations_expires
+        ON stock_reservations (expires_at)
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS product_reservations (
+            product_id INTEGER PRIMARY KEY,
+            reserved INTEGER NOT NULL DEFAULT 0 CHECK (reserved >= 0)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _stock_reservations_product_index(cursor):
+    # Reservas vigentes por producto (checkout): búsqueda por producto y
+    # rango de caducidad sin recorrer las reservas de todos los carritos
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_stock_reservations_product
+        ON stock_reservations (product_id, expires_at)
+    ''')
+
+
+# Migraciones en orden: (versión, descripción, función que recibe el cursor).
+# Para cambiar el esquema se añade un paso nuevo al final; los pasos ya
+# publicados no se modifican ni se reordenan.
+MIGRATIONS = [
+    (1, 'Tablas base (usuarios, empleados, finanzas, e-commerce)', _base_tables),
+    (2, "Columna products.category e índice", _products_category),
+    (3, 'Índice de cobertura para resúmenes mensuales', _transactions_summary_index),
+    (4, 'Agregados monthly_rollups', _monthly_rollups),
+    (5, 'Índice keyset de transacciones', _transactions_keyset_index),
+    (6, 'Búsqueda de texto completo products_fts', _products_fts),
+    (7, 'Contadores de cambios table_versions', _table_versions),
+    (8, 'Índices de pedidos para paginación y filtros', _orders_indexes),
+    (9, 'Agregados diarios de ventas product_sales_daily', _product_sales_daily),
+    (10, 'Carritos en el servidor cart_items', _cart_items),
+    (11, 'Reservas de stock stock_reservations', _stock_reservations),
+    (12, 'Índice de reservas vigentes por producto', _stock_reservations_product_index),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(cursor):
+    """Versión del esquema registrada (0 si la base no tiene schema_version)"""
+    try:
+        cursor.execute('SELECT version FROM schema_version WHERE component = ?', (SCHEMA_COMPONENT,))
+    except sqlite3.OperationalError:
+        return 0
+    rows = cursor.fetchall()
+    return rows[0][0] if rows else 0
+
+
+def migrate(conn):
+    """Aplica los pasos pendientes y devuelve la lista de versiones aplicadas.
+
+    Camino rápido: si la versión registrada ya es la última solo se lee un
+    entero. Si hay pasos pendientes se ejecutan todos en una transacción
+    BEGIN IMMEDIATE (el DDL de SQLite es transaccional): otro proceso que
+    arranque a la vez espera el bloqueo y, al comprobar de nuevo la versión,
+    no repite nada. Si un paso falla no se aplica ninguno.
+    """
+    cursor = conn.cursor()
+    if current_version(cursor) >= LATEST_VERSION:
+        return []
+
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                component TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        version = current_version(cursor)
+        applied = []
+        for step, description, apply in MIGRATIONS:
+            if step <= version:
+                continue
+            logger.info("Migración %s: %s", step, description)
+            apply(cursor)
+            applied.append(step)
+        if applied:
+            cursor.execute('''
+                INSERT INTO schema_version (component, version) VALUES (?, ?)
+                ON CONFLICT (component) DO UPDATE SET version = excluded.version, updated_at = CURRENT_TIMESTAMP
+            ''', (SCHEMA_COMPONENT, applied[-1]))
+        conn.commit()
+        return applied
+    except Exception:
+        conn.rollback()
+        raise
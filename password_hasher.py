@@ -0,0 +1,149 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Iteraciones PBKDF2-SHA256 por defecto (las mismas que usa werkzeug 2.3)
+DEFAULT_ITERATIONS = 600000
+
+
+class HasherBusy(Exception):
+    """Demasiadas operaciones de hash en curso: el cliente debe reintentar"""
+
+    def __init__(self, retry_after=1):
+        super().__init__('Servicio de autenticación saturado, reintente en unos segundos')
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """Cálculo y verificación de hashes de contraseña fuera del hilo de la petición.
+
+    - Las operaciones PBKDF2 se ejecutan en un pool de procesos dedicado
+      (workers > 0), de modo que una ráfaga de logins no ocupa los hilos que
+      sirven el resto de la API. Con workers=0 se ejecutan en el propio hilo.
+    - Como mucho max_pending operaciones en curso (en cola o calculándose);
+      por encima se lanza HasherBusy sin esperar (la API responde 429). Una
+      operación que supera timeout también lanza HasherBusy, y sigue ocupando
+      su plaza hasta que el proceso del pool termina de calcularla.
+    - Los procesos del pool se crean con forkserver (spawn donde no existe):
+      no heredan hilos, locks ni conexiones abiertas del proceso de la API.
+    - iterations es el factor de trabajo de los hashes nuevos; los hashes
+      existentes llevan sus iteraciones dentro y se verifican igual.
+    """
+
+    def __init__(self, workers=2, max_pending=32, iterations=DEFAULT_ITERATIONS, timeout=30.0):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.iterations = iterations
+        self.method = f'pbkdf2:sha256:{iterations}'
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {
+            'hash': {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0},
+            'verify': {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0},
+            'rejected': 0,
+            'peak_pending': 0,
+        }
+
+    def _get_executor(self):
+        # El pool se crea en el primer uso (no al importar la aplicación)
+        with self._lock:
+            if self._executor is None:
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._executor
+
+    def _discard_executor(self):
+        # Un proceso del pool murió: se descarta el pool y se recrea en el siguiente uso
+        with self._lock:
+            self._executor = None
+
+    def _finish(self, kind, start):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._pending -= 1
+            stats = self._stats[kind]
+            stats['count'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+        self._slots.release()
+
+    def _run(self, kind, func, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise HasherBusy()
+        start = time.perf_counter()
+        with self._lock:
+            self._pending += 1
+            self._stats['peak_pending'] = max(self._stats['peak_pending'], self._pending)
+        if self.workers <= 0:
+            try:
+                return func(*args)
+            finally:
+                self._finish(kind, start)
+
+        try:
+            future = self._get_executor().submit(func, *args)
+        except BrokenProcessPool:
+            self._discard_executor()
+            try:
+                return func(*args)
+            finally:
+                self._finish(kind, start)
+        except BaseException:
+            self._finish(kind, start)
+            raise
+        # La plaza se libera cuando el cálculo termina, no cuando el hilo deja
+        # de esperar: un timeout no permite acumular trabajos en el pool
+        future.add_done_callback(lambda _: self._finish(kind, start))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # Pool saturado: se responde como sobrecarga (429), no como error interno
+            raise HasherBusy(retry_after=max(1, int(self.timeout)))
+        except BrokenProcessPool:
+            self._discard_executor()
+            return func(*args)
+
+    def hash(self, password):
+        """Hash PBKDF2 de una contraseña con el factor de trabajo configurado"""
+        return self._run('hash', generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """True si la contraseña corresponde al hash almacenado"""
+        if not password_hash or password is None:
+            return False
+        return self._run('verify', check_password_hash, password_hash, password)
+
+    def stats(self):
+        with self._lock:
+            data = {
+                'workers': self.workers,
+                'iterations': self.iterations,
+                'pending': self._pending,
+                'max_pending': self.max_pending,
+                'peak_pending': self._stats['peak_pending'],
+                'rejected': self._stats['rejected'],
+            }
+            for kind in ('hash', 'verify'):
+                stats = self._stats[kind]
+                data[kind] = {
+                    'count': stats['count'],
+                    'avg_ms': round(stats['total_ms'] / stats['count'], 2) if stats['count'] else 0.0,
+                    'max_ms': round(stats['max_ms'], 2),
+                }
+        return data
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
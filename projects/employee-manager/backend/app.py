@@ -3,9 +3,11 @@ from flask_cors import CORS
 import os
 from datetime import datetime
 import io
+import tempfile
 from models import Employee, User, Database
-from auth import token_required, admin_required, login_user, register_user
-from utils import import_employees_from_csv, export_employees_to_excel, generate_csv_template, validate_employee_data
+from password_hasher import HasherBusy
+from auth import token_required, admin_required, login_user, register_user, logout_user, get_request_token
+from utils import import_employees_from_csv, write_employees_excel, generate_csv_template, validate_employee_data
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
@@ -14,7 +16,7 @@ app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
 CORS(app)
 
 # Inicializar base de datos
-db = Database()
+db = Database.shared()
 
 # Rutas de autenticación
 @app.route('/api/auth/login', methods=['POST'])
@@ -53,6 +55,14 @@ def register():
     else:
         return jsonify(result), 400
 
+@app.route('/api/auth/logout', methods=['POST'])
+@token_required
+def logout(current_user):
+    """Endpoint para cerrar sesión: revoca el token hasta su caducidad"""
+    token, _ = get_request_token()
+    result = logout_user(token)
+    return jsonify(result), 200 if result['success'] else 400
+
 # Rutas de empleados
 @app.route('/api/employees', methods=['GET'])
 def get_employees():
@@ -147,7 +157,8 @@ def import_employees(current_user):
         return jsonify({'message': 'Solo archivos CSV permitidos'}), 400
     
     try:
-        csv_content = file.read().decode('utf-8')
+        # Lectura en streaming del archivo subido (sin decodificarlo entero en memoria)
+        csv_content = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')
         result = import_employees_from_csv(csv_content)
         
         if result['success']:
@@ -167,29 +178,30 @@ def export_employees(current_user):
     filter_estado = request.args.get('estado', '')
     
     employee_model = Employee()
-    # Obtener todos los empleados que coincidan con los filtros
-    result = employee_model.get_all(page=1, per_page=10000, search=search, filter_estado=filter_estado)
+    # Todos los empleados que coincidan con los filtros, leídos del cursor por bloques
+    employees = employee_model.iter_all(search=search, filter_estado=filter_estado)
     
-    if not result['employees']:
+    # El libro se escribe en un archivo temporal en disco: memoria acotada
+    output = tempfile.TemporaryFile()
+    try:
+        exported = write_employees_excel(employees, output)
+    except Exception:
+        output.close()
+        return jsonify({'message': 'Error generando archivo Excel'}), 500
+    
+    if not exported:
+        output.close()
         return jsonify({'message': 'No hay empleados para exportar'}), 404
     
-    excel_data = export_employees_to_excel(result['employees'])
+    output.seek(0)
+    filename = f'empleados_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
     
-    if excel_data:
-        # Crear archivo en memoria
-        output = io.BytesIO(excel_data)
-        output.seek(0)
-        
-        filename = f'empleados_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
-    else:
-        return jsonify({'message': 'Error generando archivo Excel'}), 500
+    return send_file(
+        output,
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        as_attachment=True,
+        download_name=filename
+    )
 
 @app.route('/api/employees/template', methods=['GET'])
 @token_required
@@ -255,6 +267,13 @@ def not_found(error):
 def internal_error(error):
     return jsonify({'message': 'Error interno del servidor'}), 500
 
+@app.errorhandler(HasherBusy)
+def hasher_busy(error):
+    response = jsonify({'message': str(error)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
 if __name__ == '__main__':
     # Crear directorio de base de datos si no existe
     os.makedirs('../database', exist_ok=True)
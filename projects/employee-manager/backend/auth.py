@@ -2,7 +2,9 @@ from functools import wraps
 from flask import request, jsonify, current_app
 import jwt
 from datetime import datetime, timedelta
+import secrets
 from models import User
+from tokens import TokenVerifier, MemoryRevocationList, SQLiteRevocationList
 
 def generate_token(user_data):
     """Generar token JWT para el usuario"""
@@ -10,84 +12,88 @@ def generate_token(user_data):
         'user_id': user_data['id'],
         'username': user_data['username'],
         'role': user_data['role'],
+        'jti': secrets.token_hex(16),  # identificador para la lista de revocación
+        'iat': datetime.utcnow(),
         'exp': datetime.utcnow() + timedelta(hours=24)  # Token válido por 24 horas
     }
     
     return jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256')
 
+def get_token_verifier():
+    """Verificador de tokens de la aplicación (se crea en el primer uso).
+    Configuración: JWT_LEEWAY (segundos de margen de reloj), TOKEN_CACHE_ENTRIES
+    y TOKEN_REVOCATION ('sqlite', 'memory' o 'none')."""
+    verifier = current_app.extensions.get('token_verifier')
+    if verifier is None:
+        config = current_app.config
+        backend = config.get('TOKEN_REVOCATION', 'sqlite')
+        if backend == 'sqlite':
+            revocation = SQLiteRevocationList()
+        elif backend == 'memory':
+            revocation = MemoryRevocationList()
+        else:
+            revocation = None
+        verifier = TokenVerifier(
+            config['SECRET_KEY'],
+            leeway=config.get('JWT_LEEWAY', 30),
+            cache_entries=config.get('TOKEN_CACHE_ENTRIES', 4096),
+            revocation=revocation
+        )
+        verifier = current_app.extensions.setdefault('token_verifier', verifier)
+    return verifier
+
 def verify_token(token):
-    """Verificar y decodificar token JWT"""
+    """Verificar y decodificar token JWT (None si es inválido, expiró o fue revocado)"""
+    return get_token_verifier().verify(token)
+
+def get_request_token():
+    """Token Bearer de la petición. Devuelve (token, mensaje de error)."""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header:
+        return None, 'Token requerido'
     try:
-        payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        return payload
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
-        return None
+        token = auth_header.split(" ")[1]  # Bearer <token>
+    except IndexError:
+        return None, 'Token inválido'
+    if not token:
+        return None, 'Token requerido'
+    return token, None
 
-def token_required(f):
-    """Decorador para rutas que requieren autenticación"""
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        
-        # Buscar token en headers
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            try:
-                token = auth_header.split(" ")[1]  # Bearer <token>
-            except IndexError:
-                return jsonify({'message': 'Token inválido'}), 401
-        
-        if not token:
-            return jsonify({'message': 'Token requerido'}), 401
-        
-        try:
-            data = verify_token(token)
-            if data is None:
-                return jsonify({'message': 'Token inválido o expirado'}), 401
-            
-            current_user = data
+def auth_required(role=None):
+    """Fábrica de decoradores para rutas autenticadas; con role exige además ese rol.
+    La ruta recibe los claims del token como primer argumento."""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            token, error = get_request_token()
+            if error:
+                return jsonify({'message': error}), 401
             
-        except Exception as e:
-            return jsonify({'message': 'Token inválido'}), 401
-        
-        return f(current_user, *args, **kwargs)
-    
-    return decorated
-
-def admin_required(f):
-    """Decorador para rutas que requieren rol de administrador"""
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            try:
-                token = auth_header.split(" ")[1]
-            except IndexError:
-                return jsonify({'message': 'Token inválido'}), 401
-        
-        if not token:
-            return jsonify({'message': 'Token requerido'}), 401
-        
-        try:
-            data = verify_token(token)
-            if data is None:
+            current_user = verify_token(token)
+            if current_user is None:
                 return jsonify({'message': 'Token inválido o expirado'}), 401
             
-            if data['role'] != 'admin':
-                return jsonify({'message': 'Permisos de administrador requeridos'}), 403
+            if role is not None and current_user.get('role') != role:
+                return jsonify({'message': 'Permisos de administrador requeridos' if role == 'admin'
+                                else 'Permisos insuficientes'}), 403
             
-            current_user = data
-            
-        except Exception as e:
-            return jsonify({'message': 'Token inválido'}), 401
+            return f(current_user, *args, **kwargs)
         
-        return f(current_user, *args, **kwargs)
+        return decorated
     
-    return decorated
+    return decorator
+
+# Decorador para rutas que requieren autenticación
+token_required = auth_required()
+
+# Decorador para rutas que requieren rol de administrador
+admin_required = auth_required('admin')
+
+def logout_user(token):
+    """Revocar el token de la sesión actual"""
+    if get_token_verifier().revoke(token):
+        return {'success': True, 'message': 'Sesión cerrada'}
+    return {'success': False, 'message': 'Token inválido o revocación no disponible'}
 
 def login_user(username, password):
     """Función para autenticar usuario y generar token"""
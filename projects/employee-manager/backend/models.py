@@ -1,89 +1,188 @@
 import sqlite3
 import hashlib
+import sys
+import threading
+from functools import partial
 from datetime import datetime
 import os
 
+DEFAULT_DB_PATH = '../../../portfolio.db'
+
+# Módulos compartidos con la aplicación principal (raíz del repositorio). Se
+# añade al final de sys.path para no tapar los módulos de este backend.
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+
+from credentials import CredentialService
+
+# Verificación de contraseñas (misma lógica y formato de hash que la aplicación
+# principal; los hashes sha256 heredados se actualizan en el siguiente login)
+CREDENTIALS = CredentialService()
+
+# Componente con el que este backend registra su versión en schema_version
+SCHEMA_COMPONENT = 'employee_manager'
+
+def _migration_create_tables(cursor):
+    # Tabla de usuarios para autenticación
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            role TEXT DEFAULT 'user',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Tabla de empleados
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS employees (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_id TEXT UNIQUE NOT NULL,
+            first_name TEXT NOT NULL,
+            last_name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            phone TEXT,
+            department TEXT,
+            position TEXT NOT NULL,
+            salary REAL,
+            hire_date DATE NOT NULL,
+            status TEXT DEFAULT 'active',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _migration_seed_data(cursor):
+    # Crear usuario admin por defecto
+    admin_exists = cursor.execute(
+        'SELECT COUNT(*) FROM users WHERE username = ?', ('admin',)
+    ).fetchone()[0]
+    
+    if admin_exists == 0:
+        admin_password = hashlib.sha256('admin123'.encode()).hexdigest()
+        cursor.execute('''
+            INSERT INTO users (username, email, password_hash, role)
+            VALUES (?, ?, ?, ?)
+        ''', ('admin', 'admin@company.com', admin_password, 'admin'))
+    
+    # Insertar datos de muestra si no existen empleados
+    employees_count = cursor.execute('SELECT COUNT(*) FROM employees').fetchone()[0]
+    
+    if employees_count == 0:
+        sample_employees = [
+            ('EMP001', 'Juan', 'Pérez', 'juan.perez@empresa.com', '+1234567890', 'Desarrollo', 'Desarrollador Senior', 75000, '2023-01-15', 'active'),
+            ('EMP002', 'María', 'García', 'maria.garcia@empresa.com', '+1234567891', 'Marketing', 'Gerente de Marketing', 65000, '2023-02-01', 'active'),
+            ('EMP003', 'Carlos', 'López', 'carlos.lopez@empresa.com', '+1234567892', 'Recursos Humanos', 'Especialista en RRHH', 55000, '2023-03-10', 'active'),
+            ('EMP004', 'Ana', 'Martínez', 'ana.martinez@empresa.com', '+1234567893', 'Finanzas', 'Analista Financiero', 60000, '2023-04-05', 'active'),
+            ('EMP005', 'Luis', 'Rodríguez', 'luis.rodriguez@empresa.com', '+1234567894', 'Desarrollo', 'Desarrollador Junior', 45000, '2023-05-20', 'active')
+        ]
+        
+        cursor.executemany('''
+            INSERT INTO employees (employee_id, first_name, last_name, email, phone, department, position, salary, hire_date, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', sample_employees)
+
+def _migration_revoked_tokens(cursor):
+    # Lista de revocación de tokens JWT (logout); id creciente para sincronizar
+    # la copia en memoria de cada proceso leyendo solo las filas nuevas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS revoked_tokens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            token_id TEXT UNIQUE NOT NULL,
+            expires_at INTEGER NOT NULL,
+            revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+# Migraciones en orden: (versión, descripción, función que recibe el cursor).
+# Para cambiar el esquema se añade una entrada nueva al final; nunca se editan las aplicadas.
+MIGRATIONS = [
+    (1, 'Tablas users y employees', _migration_create_tables),
+    (2, 'Usuario admin y empleados de ejemplo', _migration_seed_data),
+    (3, 'Lista de revocación de tokens', _migration_revoked_tokens),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
 class Database:
-    def __init__(self, db_path='../../../portfolio.db'):
+    _shared = {}
+    _shared_lock = threading.Lock()
+    
+    def __init__(self, db_path=DEFAULT_DB_PATH):
         self.db_path = db_path
         self.init_database()
     
+    @classmethod
+    def shared(cls, db_path=DEFAULT_DB_PATH):
+        """Instancia única por proceso y archivo: el esquema se prepara una sola vez
+        y los modelos la reutilizan sin volver a ejecutar DDL en cada petición."""
+        key = os.path.abspath(db_path)
+        db = cls._shared.get(key)
+        if db is None:
+            with cls._shared_lock:
+                db = cls._shared.get(key)
+                if db is None:
+                    db = cls(db_path)
+                    cls._shared[key] = db
+        return db
+    
     def get_connection(self):
-        # Crear directorio si no existe
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         return sqlite3.connect(self.db_path)
     
+    @staticmethod
+    def _schema_version(cursor):
+        try:
+            row = cursor.execute(
+                'SELECT version FROM schema_version WHERE component = ?', (SCHEMA_COMPONENT,)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            # La tabla schema_version todavía no existe
+            return 0
+        return row[0] if row else 0
+    
     def init_database(self):
-        """Inicializar la base de datos con las tablas necesarias"""
+        """Aplicar las migraciones pendientes.
+        Si el esquema ya está al día solo se lee un entero de schema_version."""
+        # Crear directorio si no existe
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
         conn = self.get_connection()
         cursor = conn.cursor()
-        
-        # Tabla de usuarios para autenticación
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                role TEXT DEFAULT 'user',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Tabla de empleados
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS employees (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_id TEXT UNIQUE NOT NULL,
-                first_name TEXT NOT NULL,
-                last_name TEXT NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                phone TEXT,
-                department TEXT,
-                position TEXT NOT NULL,
-                salary REAL,
-                hire_date DATE NOT NULL,
-                status TEXT DEFAULT 'active',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Crear usuario admin por defecto
-        admin_exists = cursor.execute(
-            'SELECT COUNT(*) FROM users WHERE username = ?', ('admin',)
-        ).fetchone()[0]
-        
-        if admin_exists == 0:
-            admin_password = hashlib.sha256('admin123'.encode()).hexdigest()
-            cursor.execute('''
-                INSERT INTO users (username, email, password_hash, role)
-                VALUES (?, ?, ?, ?)
-            ''', ('admin', 'admin@company.com', admin_password, 'admin'))
-        
-        # Insertar datos de muestra si no existen empleados
-        employees_count = cursor.execute('SELECT COUNT(*) FROM employees').fetchone()[0]
-        
-        if employees_count == 0:
-            sample_employees = [
-                ('EMP001', 'Juan', 'Pérez', 'juan.perez@empresa.com', '+1234567890', 'Desarrollo', 'Desarrollador Senior', 75000, '2023-01-15', 'active'),
-                ('EMP002', 'María', 'García', 'maria.garcia@empresa.com', '+1234567891', 'Marketing', 'Gerente de Marketing', 65000, '2023-02-01', 'active'),
-                ('EMP003', 'Carlos', 'López', 'carlos.lopez@empresa.com', '+1234567892', 'Recursos Humanos', 'Especialista en RRHH', 55000, '2023-03-10', 'active'),
-                ('EMP004', 'Ana', 'Martínez', 'ana.martinez@empresa.com', '+1234567893', 'Finanzas', 'Analista Financiero', 60000, '2023-04-05', 'active'),
-                ('EMP005', 'Luis', 'Rodríguez', 'luis.rodriguez@empresa.com', '+1234567894', 'Desarrollo', 'Desarrollador Junior', 45000, '2023-05-20', 'active')
-            ]
+        try:
+            if self._schema_version(cursor) >= SCHEMA_VERSION:
+                return
             
-            cursor.executemany('''
-                INSERT INTO employees (employee_id, first_name, last_name, email, phone, department, position, salary, hire_date, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', sample_employees)
-        
-        conn.commit()
-        conn.close()
+            # Bloqueo de escritura: si otro proceso migra a la vez, se espera y se vuelve a comprobar
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    component TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            current = self._schema_version(cursor)
+            for version, description, migrate in MIGRATIONS:
+                if version > current:
+                    migrate(cursor)
+            cursor.execute('''
+                INSERT INTO schema_version (component, version) VALUES (?, ?)
+                ON CONFLICT (component) DO UPDATE SET version = excluded.version, updated_at = CURRENT_TIMESTAMP
+            ''', (SCHEMA_COMPONENT, max(current, SCHEMA_VERSION)))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
 
 class Employee:
-    def __init__(self, db_path='../../../portfolio.db'):
-        self.db = Database(db_path)
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db = Database.shared(db_path)
     
     def create(self, data):
         """Crear un nuevo empleado"""
@@ -118,12 +217,9 @@ class Employee:
         finally:
             conn.close()
     
-    def get_all(self, page=1, per_page=10, search='', filter_estado=''):
-        """Obtener todos los empleados con paginación y filtros"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        
-        # Construir query con filtros
+    @staticmethod
+    def _build_filters(search='', filter_estado=''):
+        """Cláusula WHERE y parámetros para los filtros de búsqueda y estado"""
         where_conditions = []
         params = []
         
@@ -137,6 +233,15 @@ class Employee:
             params.append(filter_estado)
         
         where_clause = ' WHERE ' + ' AND '.join(where_conditions) if where_conditions else ''
+        return where_clause, params
+    
+    def get_all(self, page=1, per_page=10, search='', filter_estado=''):
+        """Obtener todos los empleados con paginación y filtros"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        
+        # Construir query con filtros
+        where_clause, params = self._build_filters(search, filter_estado)
         
         # Contar total de registros
         count_query = f'SELECT COUNT(*) FROM employees{where_clause}'
@@ -167,6 +272,23 @@ class Employee:
             'total_pages': (total + per_page - 1) // per_page
         }
     
+    def iter_all(self, search='', filter_estado='', chunk_size=1000):
+        """Recorrer todos los empleados que cumplen los filtros, sin límite de filas.
+        Lee del cursor por bloques (fetchmany), así que la memoria no depende del total."""
+        where_clause, params = self._build_filters(search, filter_estado)
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.execute(f'SELECT * FROM employees{where_clause} ORDER BY created_at DESC', params)
+            columns = [description[0] for description in cursor.description]
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(zip(columns, row))
+        finally:
+            conn.close()
+    
     def get_by_id(self, employee_id):
         """Obtener un empleado por ID"""
         conn = self.db.get_connection()
@@ -238,16 +360,16 @@ class Employee:
             return {'success': False, 'error': 'Empleado no encontrado'}
 
 class User:
-    def __init__(self, db_path='../../../portfolio.db'):
-        self.db = Database(db_path)
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db = Database.shared(db_path)
     
     def create_user(self, username, email, password, role='user'):
         """Crear un nuevo usuario"""
+        password_hash = CREDENTIALS.hash(password)
         conn = self.db.get_connection()
         cursor = conn.cursor()
         
         try:
-            password_hash = hashlib.sha256(password.encode()).hexdigest()
             cursor.execute('''
                 INSERT INTO users (username, email, password_hash, role)
                 VALUES (?, ?, ?, ?)
@@ -265,21 +387,34 @@ class User:
             conn.close()
     
     def authenticate(self, username, password):
-        """Autenticar usuario"""
+        """Autenticar usuario (acepta hashes PBKDF2 y sha256 heredados)"""
         conn = self.db.get_connection()
         cursor = conn.cursor()
         
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
-        user = cursor.execute('''
-            SELECT id, username, email, role FROM users 
-            WHERE username = ? AND password_hash = ?
-        ''', (username, password_hash)).fetchone()
-        
-        if user:
-            columns = [description[0] for description in cursor.description]
-            user_dict = dict(zip(columns, user))
+        try:
+            user = cursor.execute('''
+                SELECT id, username, email, role, password_hash FROM users 
+                WHERE username = ?
+            ''', (username,)).fetchone()
+        finally:
             conn.close()
-            return user_dict
         
-        conn.close()
-        return None
\ No newline at end of file
+        if user and CREDENTIALS.verify(user[0], user[4], password,
+                                       on_upgrade=partial(self._upgrade_password_hash, user[0], user[4])):
+            return {'id': user[0], 'username': user[1], 'email': user[2], 'role': user[3]}
+        return None
+    
+    def _upgrade_password_hash(self, user_id, old_hash, new_hash):
+        """Guardar el hash actualizado si no ha cambiado desde que se leyó"""
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.execute('''
+                UPDATE users SET password_hash = ?
+                WHERE id = ? AND password_hash = ?
+            ''', (new_hash, user_id, old_hash))
+            conn.commit()
+            return cursor.rowcount > 0
+        except sqlite3.Error:
+            return False
+        finally:
+            conn.close()
\ No newline at end of file
@@ -0,0 +1,160 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+import jwt
+
+# models añade la raíz del repositorio a sys.path (módulo cache compartido)
+from models import Database, DEFAULT_DB_PATH
+from cache import TTLCache
+
+
+def token_digest(token):
+    """Huella SHA-256 (hex) de un token: clave de caché y de revocación sin guardar el token"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class MemoryRevocationList:
+    """Tokens revocados en memoria del proceso (se pierden al reiniciar)"""
+
+    def __init__(self):
+        self._revoked = {}  # token_id -> expires_at (epoch)
+        self._lock = threading.Lock()
+
+    def revoke(self, token_id, expires_at):
+        with self._lock:
+            self._revoked[token_id] = int(expires_at)
+            self._purge(time.time())
+
+    def is_revoked(self, token_id):
+        return token_id in self._revoked
+
+    def _purge(self, now):
+        # Un token caducado ya lo rechaza jwt.decode: no hace falta recordarlo
+        expired = [tid for tid, exp in self._revoked.items() if exp < now]
+        for tid in expired:
+            del self._revoked[tid]
+
+    def __len__(self):
+        return len(self._revoked)
+
+
+class SQLiteRevocationList(MemoryRevocationList):
+    """Tokens revocados persistidos en la tabla revoked_tokens.
+
+    La comprobación es una búsqueda en un dict en memoria; cada
+    refresh_interval segundos se leen las filas nuevas (id creciente) para
+    ver las revocaciones hechas por otros procesos.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, refresh_interval=5.0):
+        super().__init__()
+        self.db = Database.shared(db_path)
+        self.refresh_interval = refresh_interval
+        self._last_id = 0
+        self._next_refresh = 0.0
+        self._refresh_lock = threading.Lock()
+        self._refresh()
+
+    def revoke(self, token_id, expires_at):
+        conn = self.db.get_connection()
+        try:
+            conn.execute('''
+                INSERT OR IGNORE INTO revoked_tokens (token_id, expires_at) VALUES (?, ?)
+            ''', (token_id, int(expires_at)))
+            conn.execute('DELETE FROM revoked_tokens WHERE expires_at < ?', (int(time.time()),))
+            conn.commit()
+        finally:
+            conn.close()
+        super().revoke(token_id, expires_at)
+
+    def is_revoked(self, token_id):
+        if time.monotonic() >= self._next_refresh:
+            self._refresh()
+        return token_id in self._revoked
+
+    def _refresh(self):
+        if not self._refresh_lock.acquire(blocking=False):
+            return  # otro hilo ya está sincronizando
+        try:
+            conn = self.db.get_connection()
+            try:
+                rows = conn.execute('''
+                    SELECT id, token_id, expires_at FROM revoked_tokens
+                    WHERE id > ? AND expires_at >= ?
+                    ORDER BY id
+                ''', (self._last_id, int(time.time()))).fetchall()
+            except sqlite3.Error as e:
+                print(f"Error al leer tokens revocados: {e}")
+                rows = []
+            finally:
+                conn.close()
+            with self._lock:
+                for row_id, token_id, expires_at in rows:
+                    self._revoked[token_id] = expires_at
+                    self._last_id = max(self._last_id, row_id)
+            self._next_refresh = time.monotonic() + self.refresh_interval
+        finally:
+            self._refresh_lock.release()
+
+
+class TokenVerifier:
+    """Verificación de tokens JWT con caché de resultados.
+
+    - Un token verificado se recuerda (clave: su huella SHA-256) con sus
+      claims hasta exp + leeway, el mismo margen de reloj que se pasa a
+      jwt.decode, y como mucho max_cache_ttl segundos: el resultado de la
+      caché coincide con el que daría decodificarlo de nuevo.
+    - Si hay lista de revocación se consulta en cada petición (búsqueda en
+      memoria), también para los tokens que vienen de la caché.
+    """
+
+    def __init__(self, secret, algorithms=('HS256',), leeway=30, cache_entries=4096,
+                 max_cache_ttl=300.0, revocation=None):
+        self.secret = secret
+        self.algorithms = list(algorithms)
+        self.leeway = leeway
+        self.revocation = revocation
+        self.cache = TTLCache(max_entries=cache_entries, ttl=max_cache_ttl, max_bytes=4 * 1024 * 1024)
+
+    def decode(self, token):
+        """Claims del token (None si no es válido), sin comprobar revocación"""
+        digest = token_digest(token)
+        claims = self.cache.get(digest)
+        if claims is None:
+            try:
+                claims = jwt.decode(token, self.secret, algorithms=self.algorithms, leeway=self.leeway)
+            except jwt.InvalidTokenError:
+                return None
+            exp = claims.get('exp')
+            ttl = exp + self.leeway - time.time() if exp else None
+            self.cache.set(digest, claims, ttl=ttl)
+        return claims
+
+    def verify(self, token):
+        """Claims del token si es válido y no está revocado; None en otro caso"""
+        claims = self.decode(token)
+        if claims is None:
+            return None
+        if self.revocation is not None and self.revocation.is_revoked(claims.get('jti') or token_digest(token)):
+            return None
+        # Copia: la ruta recibe un dict propio, no la entrada de la caché
+        return dict(claims)
+
+    def revoke(self, token):
+        """Revoca un token válido hasta su caducidad. Devuelve False si no era válido."""
+        if self.revocation is None:
+            return False
+        claims = self.decode(token)
+        if claims is None:
+            return False
+        expires_at = claims.get('exp') or time.time() + self.cache.ttl
+        self.revocation.revoke(claims.get('jti') or token_digest(token), expires_at + self.leeway)
+        return True
+
+    def stats(self):
+        data = {'cache': self.cache.stats()}
+        if self.revocation is not None:
+            data['revoked'] = len(self.revocation)
+        return data
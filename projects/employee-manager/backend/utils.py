@@ -1,71 +1,168 @@
 import csv
 import io
+import itertools
+import re
 from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
 from datetime import datetime
 from models import Employee
 
-def import_employees_from_csv(csv_content):
-    """Importar empleados desde contenido CSV"""
+# Columnas que acepta la importación (las de la tabla employees)
+IMPORT_COLUMNS = [
+    'employee_id', 'first_name', 'last_name', 'email', 'phone',
+    'department', 'position', 'salary', 'hire_date', 'status'
+]
+IMPORT_REQUIRED_COLUMNS = ['employee_id', 'first_name', 'last_name', 'email', 'position', 'hire_date']
+
+# Nombres de columna en español (plantillas antiguas) -> columna de la tabla
+IMPORT_COLUMN_ALIASES = {
+    'documento': 'employee_id',
+    'nombre': 'first_name',
+    'apellido': 'last_name',
+    'telefono': 'phone',
+    'teléfono': 'phone',
+    'departamento': 'department',
+    'cargo': 'position',
+    'salario': 'salary',
+    'fecha_ingreso': 'hire_date',
+    'estado': 'status'
+}
+STATUS_ALIASES = {'active': 'active', 'activo': 'active', 'inactive': 'inactive', 'inactivo': 'inactive'}
+
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+IMPORT_BATCH_SIZE = 5000
+
+def _parse_import_date(value):
+    """Fecha en formato YYYY-MM-DD o dd/mm/yyyy -> YYYY-MM-DD (None si no es válida)"""
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(value, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+    return None
+
+def _validate_import_batch(batch, seen_ids, seen_emails, errors):
+    """Validar un lote de filas (número de fila, dict) y devolver las tuplas a insertar.
+    seen_ids/seen_emails contienen los valores ya existentes en la base de datos y los
+    de filas anteriores del archivo, de modo que los duplicados se detectan sin consultas."""
+    valid = []
+    for row_num, row in batch:
+        data = {col: (row.get(col) or '').strip() for col in IMPORT_COLUMNS}
+        
+        missing = [col for col in IMPORT_REQUIRED_COLUMNS if not data[col]]
+        if missing:
+            errors.append(f'Fila {row_num}: Campos requeridos vacíos: {", ".join(missing)}')
+            continue
+        
+        hire_date = _parse_import_date(data['hire_date'])
+        if hire_date is None:
+            errors.append(f'Fila {row_num}: Formato de fecha inválido')
+            continue
+        
+        if not EMAIL_PATTERN.match(data['email']):
+            errors.append(f'Fila {row_num}: Formato de email inválido')
+            continue
+        
+        status = STATUS_ALIASES.get((data['status'] or 'active').lower())
+        if status is None:
+            errors.append(f'Fila {row_num}: Estado debe ser "active" o "inactive"')
+            continue
+        
+        salary = None
+        if data['salary']:
+            try:
+                salary = float(data['salary'])
+            except ValueError:
+                errors.append(f'Fila {row_num}: Salario debe ser un número válido')
+                continue
+        
+        if data['employee_id'] in seen_ids:
+            errors.append(f'Fila {row_num}: El ID de empleado ya existe')
+            continue
+        if data['email'] in seen_emails:
+            errors.append(f'Fila {row_num}: El email ya existe')
+            continue
+        seen_ids.add(data['employee_id'])
+        seen_emails.add(data['email'])
+        
+        valid.append((
+            data['employee_id'], data['first_name'], data['last_name'], data['email'],
+            data['phone'] or None, data['department'] or None, data['position'],
+            salary, hire_date, status
+        ))
+    return valid
+
+def import_employees_from_csv(csv_content, batch_size=IMPORT_BATCH_SIZE, db_path=None):
+    """Importar empleados desde contenido CSV.
+    
+    csv_content puede ser texto o un archivo abierto en modo texto; se lee con el
+    módulo csv en lotes de batch_size filas. Cada lote se valida de una vez (fechas,
+    emails, duplicados dentro del archivo y contra los employee_id/email existentes,
+    cargados con una sola consulta) y se inserta con executemany. Todo ocurre en una
+    única transacción: si falla la base de datos no se importa nada.
+    """
     try:
-        # Leer CSV desde string
-        df = pd.read_csv(io.StringIO(csv_content))
+        csv_file = io.StringIO(csv_content) if isinstance(csv_content, str) else csv_content
+        reader = csv.reader(csv_file)
+        header = next(reader, None)
+        if not header:
+            return {'success': False, 'error': 'El archivo CSV está vacío'}
         
-        # Validar columnas requeridas
-        required_columns = ['nombre', 'documento', 'cargo', 'fecha_ingreso']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        # Normalizar cabeceras (acepta también los nombres en español)
+        columns = []
+        for name in header:
+            name = name.strip().lstrip('\ufeff').lower()
+            columns.append(IMPORT_COLUMN_ALIASES.get(name, name))
         
+        missing_columns = [col for col in IMPORT_REQUIRED_COLUMNS if col not in columns]
         if missing_columns:
             return {
                 'success': False,
                 'error': f'Columnas faltantes: {", ".join(missing_columns)}'
             }
         
-        employee_model = Employee()
-        imported_count = 0
-        errors = []
-        
-        for index, row in df.iterrows():
-            try:
-                # Preparar datos del empleado
-                employee_data = {
-                    'nombre': str(row['nombre']).strip(),
-                    'documento': str(row['documento']).strip(),
-                    'cargo': str(row['cargo']).strip(),
-                    'fecha_ingreso': str(row['fecha_ingreso']).strip(),
-                    'estado': str(row.get('estado', 'activo')).strip(),
-                    'salario': float(row['salario']) if pd.notna(row.get('salario')) else None,
-                    'telefono': str(row.get('telefono', '')).strip() if pd.notna(row.get('telefono')) else None,
-                    'email': str(row.get('email', '')).strip() if pd.notna(row.get('email')) else None,
-                    'direccion': str(row.get('direccion', '')).strip() if pd.notna(row.get('direccion')) else None,
-                    'notas': str(row.get('notas', '')).strip() if pd.notna(row.get('notas')) else None
-                }
-                
-                # Validar fecha
-                try:
-                    datetime.strptime(employee_data['fecha_ingreso'], '%Y-%m-%d')
-                except ValueError:
-                    try:
-                        # Intentar formato dd/mm/yyyy
-                        date_obj = datetime.strptime(employee_data['fecha_ingreso'], '%d/%m/%Y')
-                        employee_data['fecha_ingreso'] = date_obj.strftime('%Y-%m-%d')
-                    except ValueError:
-                        errors.append(f'Fila {index + 2}: Formato de fecha inválido')
-                        continue
-                
-                # Crear empleado
-                result = employee_model.create(employee_data)
-                if result['success']:
-                    imported_count += 1
-                else:
-                    errors.append(f'Fila {index + 2}: {result["error"]}')
-                    
-            except Exception as e:
-                errors.append(f'Fila {index + 2}: Error procesando datos - {str(e)}')
+        employee_model = Employee(db_path) if db_path else Employee()
+        conn = employee_model.db.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            
+            # Una sola consulta para detectar duplicados contra la base de datos
+            seen_ids = set()
+            seen_emails = set()
+            for existing_id, existing_email in cursor.execute('SELECT employee_id, email FROM employees'):
+                seen_ids.add(existing_id)
+                seen_emails.add(existing_email)
+            
+            imported_count = 0
+            total_rows = 0
+            errors = []
+            rows = ((row_num, dict(zip(columns, values))) for row_num, values in enumerate(reader, start=2))
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                total_rows += len(batch)
+                valid = _validate_import_batch(batch, seen_ids, seen_emails, errors)
+                cursor.executemany('''
+                    INSERT INTO employees (employee_id, first_name, last_name, email, phone,
+                                         department, position, salary, hire_date, status)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', valid)
+                imported_count += len(valid)
+            
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
         
         return {
             'success': True,
             'imported_count': imported_count,
-            'total_rows': len(df),
+            'total_rows': total_rows,
             'errors': errors
         }
         
@@ -75,43 +172,69 @@ def import_employees_from_csv(csv_content):
             'error': f'Error procesando CSV: {str(e)}'
         }
 
+# Columnas de la exportación, en el orden de la tabla employees
+EXPORT_COLUMNS = [
+    'id', 'employee_id', 'first_name', 'last_name', 'email', 'phone',
+    'department', 'position', 'salary', 'hire_date', 'status',
+    'created_at', 'updated_at'
+]
+
+# Filas usadas para calcular el ancho de las columnas
+WIDTH_SAMPLE_ROWS = 500
+
+# Límite de filas por hoja de Excel (incluida la cabecera)
+EXCEL_MAX_ROWS = 1048576
+
+def write_employees_excel(employees, output, columns=EXPORT_COLUMNS):
+    """Escribir empleados en un libro Excel en modo solo escritura (openpyxl write_only).
+    
+    employees puede ser cualquier iterable de diccionarios (p. ej. Employee.iter_all):
+    las filas se escriben a medida que llegan, sin cargarlas todas en memoria.
+    El ancho de las columnas se calcula con las primeras WIDTH_SAMPLE_ROWS filas.
+    Si se supera el límite de filas de Excel se continúa en otra hoja.
+    Devuelve el número de empleados escritos.
+    """
+    rows = ([employee.get(col) for col in columns] for employee in employees)
+    sample = list(itertools.islice(rows, WIDTH_SAMPLE_ROWS))
+    
+    widths = [len(col) for col in columns]
+    for row in sample:
+        for i, value in enumerate(row):
+            if value is not None:
+                widths[i] = max(widths[i], len(str(value)))
+    
+    workbook = Workbook(write_only=True)
+    
+    def new_sheet(number):
+        title = 'Empleados' if number == 1 else f'Empleados ({number})'
+        sheet = workbook.create_sheet(title)
+        # En modo solo escritura los anchos deben fijarse antes de la primera fila
+        for i, width in enumerate(widths, start=1):
+            sheet.column_dimensions[get_column_letter(i)].width = min(width + 2, 50)
+        sheet.append(columns)
+        return sheet
+    
+    sheet_number = 1
+    sheet = new_sheet(sheet_number)
+    sheet_rows = 1
+    count = 0
+    for row in itertools.chain(sample, rows):
+        if sheet_rows >= EXCEL_MAX_ROWS:
+            sheet_number += 1
+            sheet = new_sheet(sheet_number)
+            sheet_rows = 1
+        sheet.append(row)
+        sheet_rows += 1
+        count += 1
+    
+    workbook.save(output)
+    return count
+
 def export_employees_to_excel(employees_data):
     """Exportar empleados a Excel"""
     try:
-        # Crear DataFrame
-        df = pd.DataFrame(employees_data)
-        
-        # Reordenar columnas
-        column_order = [
-            'id', 'nombre', 'documento', 'cargo', 'fecha_ingreso', 
-            'estado', 'salario', 'telefono', 'email', 'direccion', 
-            'notas', 'created_at', 'updated_at'
-        ]
-        
-        # Filtrar solo las columnas que existen
-        existing_columns = [col for col in column_order if col in df.columns]
-        df = df[existing_columns]
-        
-        # Crear archivo Excel en memoria
         output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Empleados', index=False)
-            
-            # Ajustar ancho de columnas
-            worksheet = writer.sheets['Empleados']
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
-        
-        output.seek(0)
+        write_employees_excel(employees_data, output)
         return output.getvalue()
         
     except Exception as e:
@@ -119,22 +242,13 @@ def export_employees_to_excel(employees_data):
 
 def generate_csv_template():
     """Generar plantilla CSV para importación"""
-    template_data = {
-        'nombre': ['Juan Pérez', 'María García'],
-        'documento': ['12345678', '87654321'],
-        'cargo': ['Desarrollador', 'Analista'],
-        'fecha_ingreso': ['2024-01-15', '2024-02-01'],
-        'estado': ['activo', 'activo'],
-        'salario': [50000, 45000],
-        'telefono': ['555-1234', '555-5678'],
-        'email': ['juan@company.com', 'maria@company.com'],
-        'direccion': ['Calle 123', 'Avenida 456'],
-        'notas': ['Empleado ejemplar', 'Nueva contratación']
-    }
-    
     output = io.StringIO()
-    df = pd.DataFrame(template_data)
-    df.to_csv(output, index=False)
+    writer = csv.writer(output)
+    writer.writerow(IMPORT_COLUMNS)
+    writer.writerows([
+        ['EMP101', 'Juan', 'Pérez', 'juan@company.com', '555-1234', 'Desarrollo', 'Desarrollador', 50000, '2024-01-15', 'active'],
+        ['EMP102', 'María', 'García', 'maria@company.com', '555-5678', 'Finanzas', 'Analista', 45000, '2024-02-01', 'active']
+    ])
     return output.getvalue()
 
 def validate_employee_data(data):
@@ -167,9 +281,7 @@ def validate_employee_data(data):
     
     # Validar email
     if data.get('email') and data['email'].strip():
-        import re
-        email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        if not re.match(email_pattern, data['email']):
+        if not EMAIL_PATTERN.match(data['email']):
             errors.append('Formato de email inválido')
     
     return errors
\ No newline at end of file
@@ -562,7 +562,7 @@ async function handleImportCSV(e) {
         const data = await response.json();
         
         if (response.ok) {
-            showAlert(`Importación exitosa: ${data.imported} empleados importados`, 'success');
+            showAlert(`Importación exitosa: ${data.imported_count} empleados importados`, 'success');
             loadEmployees();
         } else {
             showAlert(data.message || 'Error en la importación', 'danger');
@@ -1,8 +1,13 @@
 import sqlite3
 import csv
 import io
+import json
+import math
+import base64
+import zlib
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from functools import lru_cache
+from typing import List, Dict, Optional, Iterator, Tuple
 import pandas as pd
 import numpy as np
 
@@ -13,6 +18,50 @@ Personal Finance Tracker Backend
 Sistema completo de gestión financiera personal
 """
 
+def encode_cursor(values: list) -> str:
+    """Codifica la posición de una paginación keyset como token opaco"""
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token: str, size: int) -> list:
+    """Decodifica un token de encode_cursor; ValueError si no es válido"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError) as e:
+        raise ValueError('Cursor inválido') from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Cursor inválido')
+    return values
+
+def gzip_stream(chunks: Iterator[str], level: int = 6) -> Iterator[bytes]:
+    """Comprime al vuelo (formato gzip) una secuencia de bloques de texto"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+# Campos editables de una transacción, en orden canónico
+TRANSACTION_UPDATE_FIELDS = ('amount', 'type', 'category_id', 'description', 'transaction_date')
+
+@lru_cache(maxsize=None)
+def transaction_update_sql(mask: int) -> Tuple[str, Tuple[str, ...]]:
+    """UPDATE de transactions para una máscara de bits de TRANSACTION_UPDATE_FIELDS.
+    El mismo conjunto de campos produce siempre el mismo SQL (se genera una vez)."""
+    columns = tuple(f for i, f in enumerate(TRANSACTION_UPDATE_FIELDS) if mask & (1 << i))
+    assignments = ', '.join(f"{f} = ?" for f in columns)
+    return f"UPDATE transactions SET {assignments} WHERE id = ? AND user_id = ?", columns
+
+# Recalcula monthly_rollups a partir de las transacciones
+ROLLUPS_REBUILD_SQL = '''
+    INSERT INTO monthly_rollups (user_id, year_month, type, category_id, total, count)
+    SELECT user_id, substr(transaction_date, 1, 7), type, category_id, SUM(amount), COUNT(*)
+    FROM transactions
+    GROUP BY user_id, substr(transaction_date, 1, 7), type, category_id
+'''
+
 class PersonalFinanceDB:
     def __init__(self, db_path: str = "personal_finance.db"):
         self.db_path = db_path
@@ -63,6 +112,35 @@ class PersonalFinanceDB:
             )
         ''')
         
+        # Índice de cobertura para consultas por usuario y rango de fechas
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transactions_user_date_cover
+            ON transactions (user_id, transaction_date, type, category_id, amount)
+        ''')
+        
+        # Índice para listar transacciones en orden (paginación keyset)
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transactions_user_keyset
+            ON transactions (user_id, transaction_date, created_at, id)
+        ''')
+        
+        # Agregados mensuales materializados (mantenidos por add/update/delete_transaction)
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'monthly_rollups'")
+        rollups_exist = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS monthly_rollups (
+                user_id INTEGER NOT NULL,
+                year_month TEXT NOT NULL,
+                type TEXT NOT NULL,
+                category_id INTEGER NOT NULL,
+                total DECIMAL(12,2) NOT NULL DEFAULT 0,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, year_month, type, category_id)
+            ) WITHOUT ROWID
+        ''')
+        if not rollups_exist:
+            cursor.execute(ROLLUPS_REBUILD_SQL)
+        
         # Tabla de presupuestos
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS budgets (
@@ -134,20 +212,20 @@ class PersonalFinanceDB:
         ''', (user_id, amount, transaction_type, category_id, description, transaction_date))
         
         transaction_id = cursor.lastrowid
+        self._apply_rollup_delta(cursor, user_id, transaction_date, transaction_type, category_id, amount, 1)
         conn.commit()
         conn.close()
         
         return transaction_id
     
-    def get_transactions_by_user(self, user_id: int, start_date: str = None, 
-                                end_date: str = None, category_id: int = None) -> List[Dict]:
-        """Obtener transacciones de un usuario con filtros opcionales"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+    def _transactions_query(self, user_id: int, start_date: str = None, end_date: str = None,
+                            category_id: int = None, after: list = None):
+        """Consulta de transacciones ordenada por (fecha, created_at, id) descendente.
+        after=(fecha, created_at, id) continúa justo después de esa fila (keyset)."""
         query = '''
             SELECT t.id, t.amount, t.type, t.description, t.transaction_date,
-                   c.name as category_name, c.color as category_color, c.icon as category_icon
+                   c.name as category_name, c.color as category_color, c.icon as category_icon,
+                   t.created_at
             FROM transactions t
             JOIN categories c ON t.category_id = c.id
             WHERE t.user_id = ?
@@ -166,91 +244,106 @@ class PersonalFinanceDB:
             query += ' AND t.category_id = ?'
             params.append(category_id)
         
-        query += ' ORDER BY t.transaction_date DESC, t.created_at DESC'
+        if after:
+            query += ' AND (t.transaction_date, t.created_at, t.id) < (?, ?, ?)'
+            params.extend(after)
         
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        conn.close()
+        query += ' ORDER BY t.transaction_date DESC, t.created_at DESC, t.id DESC'
+        return query, params
+    
+    @staticmethod
+    def _transaction_row_to_dict(row) -> Dict:
+        return {
+            'id': row[0],
+            'amount': float(row[1]),
+            'type': row[2],
+            'description': row[3],
+            'transaction_date': row[4],
+            'category_name': row[5],
+            'category_color': row[6],
+            'category_icon': row[7]
+        }
+    
+    def get_transactions_by_user(self, user_id: int, start_date: str = None, 
+                                end_date: str = None, category_id: int = None) -> List[Dict]:
+        """Obtener transacciones de un usuario con filtros opcionales"""
+        return list(self.iter_transactions_by_user(user_id, start_date, end_date, category_id))
+    
+    def iter_transactions_by_user(self, user_id: int, start_date: str = None, end_date: str = None,
+                                  category_id: int = None, after: list = None,
+                                  chunk_size: int = 500) -> Iterator[Dict]:
+        """Generador de transacciones leídas por bloques (fetchmany): memoria constante"""
+        query, params = self._transactions_query(user_id, start_date, end_date, category_id, after)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._transaction_row_to_dict(row)
+        finally:
+            conn.close()
+    
+    def get_transactions_page(self, user_id: int, limit: int = 50, after: str = None,
+                              start_date: str = None, end_date: str = None,
+                              category_id: int = None) -> Tuple[List[Dict], Optional[str]]:
+        """Página de transacciones con paginación keyset.
+        Devuelve (transacciones, next_cursor); ValueError si el cursor no es válido."""
+        after_values = decode_cursor(after, 3) if after else None
+        query, params = self._transactions_query(user_id, start_date, end_date, category_id, after_values)
+        query += ' LIMIT ?'
+        params.append(limit + 1)
         
-        transactions = []
-        for row in rows:
-            transactions.append({
-                'id': row[0],
-                'amount': float(row[1]),
-                'type': row[2],
-                'description': row[3],
-                'transaction_date': row[4],
-                'category_name': row[5],
-                'category_color': row[6],
-                'category_icon': row[7]
-            })
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(query, params).fetchall()
+        conn.close()
         
-        return transactions
+        transactions = [self._transaction_row_to_dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor([last[4], last[8], last[0]])
+        return transactions, next_cursor
     
     def get_monthly_summary(self, user_id: int, year: int, month: int) -> Dict:
-        """Obtener resumen mensual de un usuario"""
+        """Obtener resumen mensual de un usuario (desde monthly_rollups)"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        # Calcular totales de ingresos y gastos
-        cursor.execute('''
-            SELECT 
-                SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) as total_income,
-                SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END) as total_expense
-            FROM transactions
-            WHERE user_id = ? AND strftime('%Y', transaction_date) = ? AND strftime('%m', transaction_date) = ?
-        ''', (user_id, str(year), f"{month:02d}"))
-        
-        result = cursor.fetchone()
-        total_income = float(result[0]) if result[0] else 0.0
-        total_expense = float(result[1]) if result[1] else 0.0
-        
-        # Gastos por categoría
-        cursor.execute('''
-            SELECT c.name, c.color, SUM(t.amount) as total
-            FROM transactions t
-            JOIN categories c ON t.category_id = c.id
-            WHERE t.user_id = ? AND t.type = 'expense' 
-            AND strftime('%Y', t.transaction_date) = ? AND strftime('%m', t.transaction_date) = ?
-            GROUP BY c.id, c.name, c.color
-            ORDER BY total DESC
-        ''', (user_id, str(year), f"{month:02d}"))
-        
-        expenses_by_category = []
-        for row in cursor.fetchall():
-            expenses_by_category.append({
-                'category': row[0],
-                'color': row[1],
-                'amount': float(row[2])
-            })
-        
-        # Ingresos por categoría
+        # Una sola consulta sobre los agregados: O(categorías) en lugar de O(transacciones)
         cursor.execute('''
-            SELECT c.name, c.color, SUM(t.amount) as total
-            FROM transactions t
-            JOIN categories c ON t.category_id = c.id
-            WHERE t.user_id = ? AND t.type = 'income' 
-            AND strftime('%Y', t.transaction_date) = ? AND strftime('%m', t.transaction_date) = ?
-            GROUP BY c.id, c.name, c.color
+            SELECT r.type, c.id, c.name, c.color, SUM(r.total) as total
+            FROM monthly_rollups r
+            LEFT JOIN categories c ON r.category_id = c.id
+            WHERE r.user_id = ? AND r.year_month = ?
+            GROUP BY r.type, r.category_id
             ORDER BY total DESC
-        ''', (user_id, str(year), f"{month:02d}"))
+        ''', (user_id, f"{year:04d}-{month:02d}"))
         
-        income_by_category = []
+        totals = {'income': 0.0, 'expense': 0.0}
+        by_category = {'income': [], 'expense': []}
         for row in cursor.fetchall():
-            income_by_category.append({
-                'category': row[0],
-                'color': row[1],
-                'amount': float(row[2])
-            })
+            amount = round(float(row[4]), 2)
+            totals[row[0]] += amount
+            if row[1] is not None:
+                by_category[row[0]].append({
+                    'category': row[2],
+                    'color': row[3],
+                    'amount': amount
+                })
         
         conn.close()
         
+        total_income = round(totals['income'], 2)
+        total_expense = round(totals['expense'], 2)
         return {
             'total_income': total_income,
             'total_expense': total_expense,
-            'balance': total_income - total_expense,
-            'expenses_by_category': expenses_by_category,
-            'income_by_category': income_by_category
+            'balance': round(total_income - total_expense, 2),
+            'expenses_by_category': by_category['expense'],
+            'income_by_category': by_category['income']
         }
     
     def get_all_categories(self, user_id: int = None) -> List[Dict]:
@@ -288,88 +381,166 @@ class PersonalFinanceDB:
     
     def export_transactions_csv(self, user_id: int, start_date: str = None, end_date: str = None) -> str:
         """Exportar transacciones a CSV"""
-        transactions = self.get_transactions_by_user(user_id, start_date, end_date)
-        
+        return ''.join(self.iter_transactions_csv(user_id, start_date, end_date))
+    
+    def iter_transactions_csv(self, user_id: int, start_date: str = None, end_date: str = None,
+                              chunk_size: int = 1000) -> Iterator[str]:
+        """Exportación CSV en streaming: un bloque de texto por cada fetchmany.
+        La memoria usada no depende del tamaño del historial."""
+        query, params = self._transactions_query(user_id, start_date, end_date)
         output = io.StringIO()
         writer = csv.writer(output)
         
         # Escribir encabezados
         writer.writerow(['Fecha', 'Tipo', 'Categoría', 'Monto', 'Descripción'])
+        yield output.getvalue()
         
-        # Escribir datos
-        for transaction in transactions:
-            writer.writerow([
-                transaction['transaction_date'],
-                transaction['type'],
-                transaction['category_name'],
-                transaction['amount'],
-                transaction['description']
-            ])
-        
-        return output.getvalue()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                output.seek(0)
+                output.truncate()
+                writer.writerows((row[4], row[2], row[5], float(row[1]), row[3]) for row in rows)
+                yield output.getvalue()
+        finally:
+            conn.close()
     
-    def import_transactions_csv(self, user_id: int, csv_content: str) -> Dict:
-        """Importar transacciones desde CSV"""
+    def import_transactions_csv(self, user_id: int, csv_content, batch_size: int = 5000,
+                                progress_callback=None) -> Dict:
+        """Importar transacciones desde CSV.
+        
+        csv_content puede ser el texto completo o un objeto de archivo abierto en
+        modo texto (se lee en streaming, sin cargarlo entero en memoria). Las filas
+        válidas se insertan con executemany en lotes de batch_size dentro de una
+        única transacción. Una fila que la base de datos rechaza (restricción)
+        se informa como error de esa fila sin afectar al resto; un error de la
+        propia base de datos revierte la importación completa. monthly_rollups
+        se actualiza una vez al final con los totales de las filas insertadas.
+        progress_callback(filas_procesadas, filas_importadas) se llama tras cada lote.
+        """
+        csv_file = io.StringIO(csv_content) if isinstance(csv_content, str) else csv_content
+        reader = csv.DictReader(csv_file)
+        
+        imported_count = 0
+        processed = 0
+        errors = []
+        
+        # Obtener categorías para mapeo
+        categories = self.get_all_categories(user_id)
+        category_map = {cat['name'].lower(): cat['id'] for cat in categories}
+        type_map = {'income': 'income', 'ingreso': 'income', 'expense': 'expense', 'gasto': 'expense'}
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
         try:
-            # Leer CSV
-            csv_file = io.StringIO(csv_content)
-            reader = csv.DictReader(csv_file)
-            
-            imported_count = 0
-            errors = []
-            
-            # Obtener categorías para mapeo
-            categories = self.get_all_categories(user_id)
-            category_map = {cat['name'].lower(): cat['id'] for cat in categories}
+            cursor.execute('BEGIN IMMEDIATE')
+            batch = []
+            # (mes, tipo, categoría) -> [total, count]
+            rollups = {}
             
             for row_num, row in enumerate(reader, start=2):
+                processed += 1
                 try:
                     # Validar y procesar cada fila
-                    date = row.get('Fecha', '').strip()
-                    transaction_type = row.get('Tipo', '').strip().lower()
-                    category_name = row.get('Categoría', '').strip()
-                    amount = float(row.get('Monto', 0))
-                    description = row.get('Descripción', '').strip()
+                    date = (row.get('Fecha') or '').strip()
+                    transaction_type = (row.get('Tipo') or '').strip().lower()
+                    category_name = (row.get('Categoría') or '').strip()
+                    amount = float(row.get('Monto') or 0)
+                    description = (row.get('Descripción') or '').strip()
                     
-                    # Validaciones
-                    if not date or not transaction_type or not category_name or amount <= 0:
+                    # Validaciones (NaN no es <= 0: se descarta con isfinite)
+                    if (not date or not transaction_type or not category_name
+                            or not math.isfinite(amount) or amount <= 0):
                         errors.append(f"Fila {row_num}: Datos incompletos o inválidos")
                         continue
                     
-                    if transaction_type not in ['income', 'expense', 'ingreso', 'gasto']:
+                    transaction_type = type_map.get(transaction_type)
+                    if transaction_type is None:
                         errors.append(f"Fila {row_num}: Tipo de transacción inválido")
                         continue
                     
-                    # Mapear tipo
-                    if transaction_type in ['ingreso']:
-                        transaction_type = 'income'
-                    elif transaction_type in ['gasto']:
-                        transaction_type = 'expense'
-                    
                     # Buscar categoría
                     category_id = category_map.get(category_name.lower())
                     if not category_id:
                         errors.append(f"Fila {row_num}: Categoría '{category_name}' no encontrada")
                         continue
-                    
-                    # Agregar transacción
-                    self.add_transaction(user_id, amount, transaction_type, category_id, description, date)
-                    imported_count += 1
-                    
                 except Exception as e:
                     errors.append(f"Fila {row_num}: Error al procesar - {str(e)}")
+                    continue
+                
+                batch.append((row_num, (user_id, amount, transaction_type, category_id, description, date)))
+                
+                if len(batch) >= batch_size:
+                    imported_count += self._import_batch(cursor, batch, rollups, errors)
+                    batch = []
+                    if progress_callback:
+                        progress_callback(processed, imported_count)
+            
+            if batch:
+                imported_count += self._import_batch(cursor, batch, rollups, errors)
+            
+            cursor.executemany('''
+                INSERT INTO monthly_rollups (user_id, year_month, type, category_id, total, count)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, year_month, type, category_id)
+                DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+            ''', [(user_id, ym, t, cat, total, count) for (ym, t, cat), (total, count) in rollups.items()])
+            conn.commit()
+            if progress_callback:
+                progress_callback(processed, imported_count)
             
             return {
                 'success': True,
                 'imported_count': imported_count,
+                'processed_count': processed,
                 'errors': errors
             }
             
         except Exception as e:
+            conn.rollback()
             return {
                 'success': False,
                 'error': f"Error al procesar CSV: {str(e)}"
             }
+        finally:
+            conn.close()
+    
+    def _import_batch(self, cursor, batch: List[Tuple], rollups: Dict, errors: List[str]) -> int:
+        """Inserta un lote [(fila, valores)] dentro de un SAVEPOINT. Si alguna
+        fila viola una restricción, se deshace el lote y se inserta fila a
+        fila para informar solo de las rechazadas. Acumula en rollups los
+        totales de las filas insertadas y devuelve cuántas se insertaron."""
+        cursor.execute('SAVEPOINT import_batch')
+        try:
+            self._insert_transaction_batch(cursor, [values for _, values in batch])
+            inserted = batch
+        except sqlite3.IntegrityError:
+            cursor.execute('ROLLBACK TO import_batch')
+            inserted = []
+            for row_num, values in batch:
+                try:
+                    self._insert_transaction_batch(cursor, [values])
+                    inserted.append((row_num, values))
+                except sqlite3.IntegrityError as e:
+                    errors.append(f"Fila {row_num}: Error al procesar - {str(e)}")
+        cursor.execute('RELEASE import_batch')
+        
+        for _, (_, amount, transaction_type, category_id, _, date) in inserted:
+            bucket = rollups.setdefault((date[:7], transaction_type, category_id), [0.0, 0])
+            bucket[0] += amount
+            bucket[1] += 1
+        return len(inserted)
+    
+    @staticmethod
+    def _insert_transaction_batch(cursor, batch: List[Tuple]):
+        cursor.executemany('''
+            INSERT INTO transactions (user_id, amount, type, category_id, description, transaction_date)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', batch)
     
     def predict_monthly_expense(self, user_id: int, months_back: int = 6) -> Dict:
         """Predicción simple de gasto mensual usando media móvil"""
@@ -423,56 +594,146 @@ class PersonalFinanceDB:
             }
     
     def delete_transaction(self, transaction_id: int, user_id: int) -> bool:
-        """Eliminar una transacción"""
+        """Eliminar una transacción.
+        Lectura de la fila, borrado y ajuste de monthly_rollups en una sola
+        transacción BEGIN IMMEDIATE (dos borrados simultáneos no descuentan dos veces)."""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        
-        cursor.execute('''
-            DELETE FROM transactions
-            WHERE id = ? AND user_id = ?
-        ''', (transaction_id, user_id))
-        
-        success = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
-        
-        return success
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            old = cursor.execute('''
+                SELECT amount, type, category_id, transaction_date
+                FROM transactions
+                WHERE id = ? AND user_id = ?
+            ''', (transaction_id, user_id)).fetchone()
+            
+            success = False
+            if old:
+                cursor.execute('''
+                    DELETE FROM transactions
+                    WHERE id = ? AND user_id = ?
+                ''', (transaction_id, user_id))
+                success = cursor.rowcount > 0
+                if success:
+                    self._apply_rollup_delta(cursor, user_id, old[3], old[1], old[2], -float(old[0]), -1)
+            conn.commit()
+            return success
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
     
     def update_transaction(self, transaction_id: int, user_id: int, data: Dict) -> bool:
-        """Actualizar una transacción"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Construir query dinámicamente
-        fields = []
-        values = []
-        
-        for field in ['amount', 'type', 'category_id', 'description', 'transaction_date']:
+        """Actualizar una transacción.
+        La fila anterior se lee dentro de la misma transacción BEGIN IMMEDIATE
+        que la escribe y mueve su importe entre cubetas de monthly_rollups."""
+        # Construir query según los campos presentes (SQL memorizado por máscara de campos)
+        mask = 0
+        for i, field in enumerate(TRANSACTION_UPDATE_FIELDS):
             if field in data:
-                fields.append(f"{field} = ?")
-                values.append(data[field])
+                mask |= 1 << i
         
-        if not fields:
+        if not mask:
             return False
         
-        values.extend([transaction_id, user_id])
+        query, columns = transaction_update_sql(mask)
+        values = [data[field] for field in columns] + [transaction_id, user_id]
         
-        query = f'''
-            UPDATE transactions
-            SET {', '.join(fields)}
-            WHERE id = ? AND user_id = ?
-        '''
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            old = cursor.execute('''
+                SELECT amount, type, category_id, transaction_date
+                FROM transactions
+                WHERE id = ? AND user_id = ?
+            ''', (transaction_id, user_id)).fetchone()
+            if not old:
+                conn.commit()
+                return False
+            
+            cursor.execute(query, values)
+            success = cursor.rowcount > 0
+            
+            # Mover el importe entre cubetas si cambió monto, tipo, categoría o fecha
+            if success:
+                new = tuple(
+                    data[field] if field in data else old[i]
+                    for i, field in enumerate(['amount', 'type', 'category_id', 'transaction_date'])
+                )
+                if new != tuple(old):
+                    self._apply_rollup_delta(cursor, user_id, old[3], old[1], old[2], -float(old[0]), -1)
+                    self._apply_rollup_delta(cursor, user_id, new[3], new[1], new[2], float(new[0]), 1)
+            conn.commit()
+            return success
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    
+    def _apply_rollup_delta(self, cursor, user_id: int, transaction_date: str, transaction_type: str,
+                            category_id: int, amount: float, count: int):
+        """Suma (o resta) un importe a la cubeta (usuario, mes, tipo, categoría).
+        Debe ejecutarse en la misma transacción que modifica transactions."""
+        year_month = str(transaction_date)[:7]
+        cursor.execute('''
+            INSERT INTO monthly_rollups (user_id, year_month, type, category_id, total, count)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, year_month, type, category_id)
+            DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+        ''', (user_id, year_month, transaction_type, category_id, amount, count))
+        if count < 0:
+            cursor.execute('''
+                DELETE FROM monthly_rollups
+                WHERE user_id = ? AND year_month = ? AND type = ? AND category_id = ? AND count <= 0
+            ''', (user_id, year_month, transaction_type, category_id))
+    
+    def rebuild_monthly_rollups(self, repair: bool = True) -> Dict:
+        """Verificar monthly_rollups contra las transacciones y repararlo si hace falta"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
         
-        cursor.execute(query, values)
-        success = cursor.rowcount > 0
-        conn.commit()
+        cursor.execute('''
+            SELECT user_id, substr(transaction_date, 1, 7), type, category_id, SUM(amount), COUNT(*)
+            FROM transactions
+            GROUP BY user_id, substr(transaction_date, 1, 7), type, category_id
+        ''')
+        expected = {row[:4]: (float(row[4]), row[5]) for row in cursor.fetchall()}
+        cursor.execute('SELECT user_id, year_month, type, category_id, total, count FROM monthly_rollups')
+        actual = {row[:4]: (float(row[4]), row[5]) for row in cursor.fetchall()}
+        
+        mismatches = []
+        for key in set(expected) | set(actual):
+            exp_total, exp_count = expected.get(key, (0.0, 0))
+            act_total, act_count = actual.get(key, (0.0, 0))
+            if exp_count != act_count or abs(exp_total - act_total) > 0.005:
+                mismatches.append({
+                    'user_id': key[0],
+                    'year_month': key[1],
+                    'type': key[2],
+                    'category_id': key[3],
+                    'expected': {'total': round(exp_total, 2), 'count': exp_count},
+                    'actual': {'total': round(act_total, 2), 'count': act_count}
+                })
+        
+        repaired = False
+        if mismatches and repair:
+            cursor.execute('DELETE FROM monthly_rollups')
+            cursor.execute(ROLLUPS_REBUILD_SQL)
+            conn.commit()
+            repaired = True
         conn.close()
         
-        return success
+        return {'buckets': len(expected), 'mismatches': mismatches, 'repaired': repaired}
 # --- Flask API server ---
-from flask import Flask, request, jsonify
+import itertools
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 
+MAX_PAGE_SIZE = 500
+
 app = Flask(__name__)
 CORS(app)
 
@@ -489,9 +750,44 @@ def api_get_transactions(user_id):
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     category_id = request.args.get('category_id', type=int)
+    after = request.args.get('after')
+    limit = request.args.get('limit', type=int)
+    if limit is not None and not 0 < limit <= MAX_PAGE_SIZE:
+        return jsonify({'success': False, 'error': f'limit debe estar entre 1 y {MAX_PAGE_SIZE}'}), 400
+    
+    # Streaming NDJSON: una transacción por línea, memoria constante
+    if request.args.get('format') == 'ndjson':
+        try:
+            after_values = decode_cursor(after, 3) if after else None
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        rows = db.iter_transactions_by_user(user_id, start_date, end_date, category_id, after=after_values)
+        if limit:
+            rows = itertools.islice(rows, limit)
+        lines = (json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+        return Response(lines, mimetype='application/x-ndjson')
+    
+    # Paginación keyset
+    if limit is not None or after:
+        try:
+            data, next_cursor = db.get_transactions_page(user_id, limit or 50, after, start_date, end_date, category_id)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        return jsonify({'data': data, 'next_cursor': next_cursor})
+    
     data = db.get_transactions_by_user(user_id, start_date, end_date, category_id)
     return jsonify({'data': data})
 
+@app.get('/api/finance/transactions/<int:user_id>/export')
+def api_export_transactions(user_id: int):
+    """Descarga CSV en streaming; comprimida con gzip si el cliente lo acepta (gzip=0 lo desactiva)"""
+    chunks = db.iter_transactions_csv(user_id, request.args.get('start_date'), request.args.get('end_date'))
+    headers = {'Content-Disposition': f'attachment; filename=transacciones_{user_id}.csv', 'Vary': 'Accept-Encoding'}
+    if request.args.get('gzip') != '0' and request.accept_encodings['gzip']:
+        headers['Content-Encoding'] = 'gzip'
+        chunks = gzip_stream(chunks)
+    return Response(chunks, mimetype='text/csv', headers=headers)
+
 @app.post('/api/finance/transactions')
 def api_create_transaction():
     payload = request.get_json(force=True) or {}
@@ -536,4 +832,24 @@ def api_health():
     return jsonify({'ok': True})
 
 if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == 'rebuild-rollups':
+        # python app.py rebuild-rollups [--check]
+        report = db.rebuild_monthly_rollups(repair='--check' not in sys.argv)
+        print(f"Cubetas: {report['buckets']}, discrepancias: {len(report['mismatches'])}, reparado: {report['repaired']}")
+        sys.exit(1 if report['mismatches'] and not report['repaired'] else 0)
+    if len(sys.argv) > 3 and sys.argv[1] == 'import-csv':
+        # python app.py import-csv <user_id> <archivo.csv>
+        with open(sys.argv[3], newline='', encoding='utf-8') as f:
+            result = db.import_transactions_csv(
+                int(sys.argv[2]), f,
+                progress_callback=lambda done, ok: print(f"Procesadas {done} filas, importadas {ok}")
+            )
+        if not result['success']:
+            print(result['error'])
+            sys.exit(1)
+        print(f"Importadas: {result['imported_count']}, errores: {len(result['errors'])}")
+        for error in result['errors'][:20]:
+            print(error)
+        sys.exit(0)
     app.run(host='0.0.0.0', port=5001, debug=False)
\ No newline at end of file
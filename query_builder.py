@@ -0,0 +1,80 @@
+import threading
+
+
+class UpdateBuilder:
+    """Generador de sentencias UPDATE con campos variables.
+
+    Las columnas permitidas tienen un orden canónico y cada combinación de
+    campos se identifica por una máscara de bits. El SQL de cada máscara se
+    genera una sola vez y se reutiliza: el mismo conjunto de campos produce
+    siempre el mismo texto, de modo que la caché de sentencias preparadas
+    de cada conexión sqlite3 (cached_statements) lo encuentra ya compilado.
+    """
+
+    def __init__(self, table, columns, key=('id',), touch_updated_at=False):
+        self.table = table
+        self.columns = tuple(columns)
+        self.key = tuple(key)
+        self.touch_updated_at = touch_updated_at
+        self._bits = {column: 1 << i for i, column in enumerate(self.columns)}
+        self._cache = {}  # máscara -> (sql, columnas en orden)
+        self._lock = threading.Lock()
+
+    def mask(self, fields):
+        """Máscara de bits de los campos permitidos presentes en fields"""
+        mask = 0
+        for field in fields:
+            bit = self._bits.get(field)
+            if bit:
+                mask |= bit
+        return mask
+
+    def statement(self, mask):
+        """(sql, columnas) para una máscara; se genera una vez por máscara"""
+        cached = self._cache.get(mask)
+        if cached is not None:
+            return cached
+        columns = tuple(c for c in self.columns if mask & self._bits[c])
+        assignments = [f"{c} = ?" for c in columns]
+        if self.touch_updated_at:
+            assignments.append("updated_at = CURRENT_TIMESTAMP")
+        where = ' AND '.join(f"{k} = ?" for k in self.key)
+        sql = f"UPDATE {self.table} SET {', '.join(assignments)} WHERE {where}"
+        with self._lock:
+            self._cache.setdefault(mask, (sql, columns))
+        return self._cache[mask]
+
+    def build(self, data, *key_values):
+        """Sentencia y parámetros para actualizar una fila.
+        data: dict campo -> valor (se ignoran los campos no permitidos).
+        Devuelve (None, None) si no hay nada que actualizar."""
+        mask = self.mask(data)
+        if not mask:
+            return None, None
+        sql, columns = self.statement(mask)
+        return sql, [data[c] for c in columns] + list(key_values)
+
+    def build_many(self, rows):
+        """Agrupa filas (dicts con los campos de la clave y los campos a cambiar)
+        por conjunto de campos. Devuelve (grupos, errores): grupos es
+        [(sql, [parámetros, ...]), ...] listo para executemany y errores es
+        [(índice, motivo), ...] con las filas que no son un dict, no traen
+        todos los campos de la clave o no tienen campos que actualizar."""
+        groups = {}
+        errors = []
+        for index, row in enumerate(rows):
+            if not isinstance(row, dict):
+                errors.append((index, 'Cada elemento debe ser un objeto'))
+                continue
+            missing = [k for k in self.key if row.get(k) is None]
+            if missing:
+                errors.append((index, f"{', '.join(missing)} es requerido"))
+                continue
+            mask = self.mask(row)
+            if not mask:
+                errors.append((index, 'No hay campos para actualizar'))
+                continue
+            sql, columns = self.statement(mask)
+            params = [row[c] for c in columns] + [row[k] for k in self.key]
+            groups.setdefault(sql, []).append(params)
+        return list(groups.items()), errors
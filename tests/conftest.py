@@ -0,0 +1,44 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FINANCE_APP = os.path.join(REPO_ROOT, 'projects', 'personal-finance-tracker', 'backend', 'app.py')
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from database import PortfolioDatabase  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    """PortfolioDatabase sobre un archivo temporal (esquema migrado)"""
+    database = PortfolioDatabase(str(tmp_path / 'portfolio.db'))
+    yield database
+    database.pool.close_all()
+    if database.read_pool is not database.pool:
+        database.read_pool.close_all()
+
+
+@pytest.fixture(scope='session')
+def finance_module(tmp_path_factory):
+    """Módulo del backend de finanzas, importado desde un directorio temporal
+    (al importarse crea personal_finance.db en el directorio actual)"""
+    pytest.importorskip('pandas')
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('finance'))
+    try:
+        spec = importlib.util.spec_from_file_location('finance_app', FINANCE_APP)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        os.chdir(cwd)
+    return module
+
+
+@pytest.fixture
+def finance_db(finance_module, tmp_path):
+    return finance_module.PersonalFinanceDB(str(tmp_path / 'finance.db'))
@@ -0,0 +1,180 @@
+import sqlite3
+import threading
+
+from cart_store import create_cart_store
+
+
+def _product(db, stock, price=10.0, name='Producto'):
+    return db.create_product(name, '', price, stock)
+
+
+def _run_concurrently(worker, threads):
+    barrier = threading.Barrier(threads)
+    results = []
+    lock = threading.Lock()
+
+    def run(n):
+        barrier.wait()
+        value = worker(n)
+        with lock:
+            results.append(value)
+
+    pool = [threading.Thread(target=run, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return results
+
+
+def _stock(db, product_id):
+    return db.get_products_by_ids([product_id], use_cache=False)[product_id]['stock']
+
+
+def _sold(db, product_id):
+    with db.connection() as conn:
+        row = conn.execute('SELECT COALESCE(SUM(quantity), 0) FROM order_items WHERE product_id = ?',
+                           (product_id,)).fetchone()
+    return row[0]
+
+
+def test_concurrent_checkout_never_oversells(db):
+    product_id = _product(db, stock=10)
+
+    def buy(n):
+        return [db.create_order([{'product_id': product_id, 'quantity': 1}])[0] for _ in range(5)]
+
+    orders = [order for batch in _run_concurrently(buy, 8) for order in batch if order]
+
+    assert len(orders) == 10
+    assert _stock(db, product_id) == 0
+    assert _sold(db, product_id) == 10
+
+
+def test_checkout_rejects_whole_order_when_one_line_is_short(db):
+    plenty = _product(db, stock=5, name='A')
+    scarce = _product(db, stock=1, name='B')
+
+    order_id, _ = db.create_order([{'product_id': plenty, 'quantity': 2}, {'product_id': scarce, 'quantity': 2}])
+
+    assert order_id is None
+    assert _stock(db, plenty) == 5
+    assert _stock(db, scarce) == 1
+
+
+def test_checkout_rejects_non_positive_quantities(db, capsys):
+    product_id = _product(db, stock=5)
+
+    assert db.create_order([{'product_id': product_id, 'quantity': 0}]) == (None, None)
+    assert 'Cantidad inválida' in capsys.readouterr().out
+    assert _stock(db, product_id) == 5
+
+
+def test_checkout_retries_when_the_database_is_busy(db, monkeypatch):
+    product_id = _product(db, stock=5)
+    select_products = db._select_products
+    calls = []
+
+    def busy_once(cursor, ids):
+        calls.append(ids)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        return select_products(cursor, ids)
+
+    monkeypatch.setattr(db, '_select_products', busy_once)
+
+    order_id, _ = db.create_order([{'product_id': product_id, 'quantity': 2}])
+
+    assert order_id is not None and len(calls) == 2
+    assert _stock(db, product_id) == 3
+
+
+def test_reserved_stock_is_not_sold_to_other_carts(db):
+    product_id = _product(db, stock=3)
+
+    assert db.reserve_stock('cart-a', product_id, 2) is True
+    assert db.reserve_stock('cart-b', product_id, 2) is False
+    assert db.create_order([{'product_id': product_id, 'quantity': 2}])[0] is None
+
+    # El carrito que reservó convierte su reserva en el pedido
+    order_id, total = db.create_order([{'product_id': product_id, 'quantity': 2}], cart_id='cart-a')
+    assert order_id is not None and total == 20.0
+    assert _stock(db, product_id) == 1
+    assert db.reserve_stock('cart-b', product_id, 1) is True
+
+
+def test_expired_reservations_do_not_hold_stock(db):
+    product_id = _product(db, stock=3)
+    assert db.reserve_stock('cart-a', product_id, 2, ttl=-10)
+
+    # Sin pasar el barrido: la reserva caducada no cuenta en el checkout
+    assert db.create_order([{'product_id': product_id, 'quantity': 3}])[0] is not None
+    assert db.sweep_expired_reservations() == 1
+
+
+def _reserved(db, cart_id, product_id):
+    with db.connection() as conn:
+        row = conn.execute('SELECT quantity FROM stock_reservations WHERE cart_id = ? AND product_id = ?',
+                           (cart_id, product_id)).fetchone()
+    return row[0] if row else 0
+
+
+def test_concurrent_cart_changes_keep_line_and_reservation_in_sync(db):
+    product_id = _product(db, stock=100)
+    for kind in ('sqlite', 'memory'):
+        store = create_cart_store(kind, db)
+        cart_id = f'cart-{kind}'
+
+        def add(n):
+            return [store.add(cart_id, product_id, 1, ttl=900) for _ in range(5)]
+
+        _run_concurrently(add, 4)
+        assert store.get(cart_id) == {product_id: 20}
+        assert _reserved(db, cart_id, product_id) == 20
+
+        def update(n):
+            return [store.update(cart_id, product_id, 1 + (n + i) % 7, ttl=900) for i in range(10)]
+
+        _run_concurrently(update, 4)
+        assert _reserved(db, cart_id, product_id) == store.get(cart_id)[product_id]
+
+        assert store.update(cart_id, product_id, 0, ttl=900) == 0
+        assert store.get(cart_id) == {}
+        assert _reserved(db, cart_id, product_id) == 0
+
+
+def test_cart_changes_without_stock_leave_cart_unchanged(db):
+    product_id = _product(db, stock=2)
+    store = create_cart_store('sqlite', db)
+
+    assert store.add('cart-a', product_id, 2, ttl=900) == 2
+    assert store.add('cart-a', product_id, 1, ttl=900) is None
+    assert store.update('cart-a', product_id, 3, ttl=900) is None
+    assert store.get('cart-a') == {product_id: 2}
+    assert _reserved(db, 'cart-a', product_id) == 2
+
+
+def test_legacy_session_cart_is_migrated_with_reservations(db, monkeypatch, tmp_path):
+    # Al importarse, app abre portfolio.db en el directorio actual
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('RESERVATION_SWEEP_INTERVAL', '0')
+    import app as web
+
+    store = create_cart_store('sqlite', db)
+    monkeypatch.setattr(web, 'db', db)
+    monkeypatch.setattr(web, 'cart_store', store)
+    in_stock = _product(db, stock=5, name='A')
+    sold_out = _product(db, stock=1, name='B')
+    assert db.reserve_stock('other-cart', sold_out, 1)
+
+    client = web.app.test_client()
+    with client.session_transaction() as session:
+        session['cart'] = {str(in_stock): 2, str(sold_out): 1}
+    response = client.get('/api/ecommerce/cart')
+
+    cart_id = client.get_cookie('cart_id').value
+    assert [item['product_id'] for item in response.get_json()['data']['items']] == [in_stock]
+    assert _reserved(db, cart_id, in_stock) == 2
+    assert client.post('/api/ecommerce/cart/update', json={'product_id': in_stock, 'quantity': 4}).status_code == 200
+    assert client.post('/api/ecommerce/cart/update', json={'product_id': in_stock, 'quantity': 6}).status_code == 400
+    assert _reserved(db, cart_id, in_stock) == 4
@@ -0,0 +1,179 @@
+import random
+import sys
+import threading
+
+USER_ID = 1
+
+
+def _transactions(db, rows):
+    for amount, kind, category_id, date in rows:
+        db.add_transaction(USER_ID, amount, kind, category_id, '', date)
+
+
+def _categories(db):
+    with db.connection() as conn:
+        food = conn.execute("INSERT INTO categories (name, type, color) VALUES ('Comida', 'expense', '#111111')").lastrowid
+        salary = conn.execute("INSERT INTO categories (name, type, color) VALUES ('Salario', 'income', '#222222')").lastrowid
+        conn.commit()
+    return food, salary
+
+
+def test_monthly_summary_covers_exactly_the_requested_month(db):
+    food, salary = _categories(db)
+    _transactions(db, [
+        (100.0, 'income', salary, '2024-01-31'),
+        (40.0, 'expense', food, '2024-02-01'),
+        (15.5, 'expense', food, '2024-02-29'),
+        (999.0, 'expense', food, '2024-03-01'),
+    ])
+
+    summary = db.get_monthly_summary(USER_ID, 2024, 2)
+
+    assert summary['income'] == 0
+    assert summary['expense'] == 55.5
+    assert summary['balance'] == -55.5
+    assert summary['expenses_by_category'] == [{'category': 'Comida', 'color': '#111111', 'amount': 55.5}]
+
+
+def test_monthly_rollups_follow_transaction_changes(db):
+    food, _ = _categories(db)
+    _transactions(db, [(40.0, 'expense', food, '2024-02-01'), (10.0, 'expense', food, '2024-02-15')])
+    with db.connection() as conn:
+        first_id = conn.execute('SELECT MIN(id) FROM transactions').fetchone()[0]
+
+    db.update_transaction(first_id, USER_ID, {'transaction_date': '2024-03-05'})
+
+    with db.connection() as conn:
+        rows = conn.execute('''
+            SELECT year_month, total, count FROM monthly_rollups
+            WHERE user_id = ? ORDER BY year_month
+        ''', (USER_ID,)).fetchall()
+    assert [(ym, float(total), count) for ym, total, count in rows] == [('2024-02', 10.0, 1), ('2024-03', 40.0, 1)]
+    assert db.get_monthly_summary(USER_ID, 2024, 3)['expense'] == 40.0
+    assert db.rebuild_monthly_rollups(repair=False)['mismatches'] == []
+
+
+def _run_threads(worker, count):
+    # Cambios de hilo muy frecuentes: lectura y escritura se intercalan
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+
+def test_concurrent_updates_keep_monthly_rollups_consistent(db):
+    _transactions(db, [(10.0, 'expense', 1, '2024-01-15')] * 5)
+    with db.connection() as conn:
+        ids = [row[0] for row in conn.execute('SELECT id FROM transactions')]
+
+    def work(seed):
+        rng = random.Random(seed)
+        for _ in range(100):
+            transaction_id = rng.choice(ids)
+            if rng.random() < 0.1:
+                db.delete_transaction(transaction_id, USER_ID)
+            else:
+                db.update_transaction(transaction_id, USER_ID, {
+                    'amount': rng.randint(1, 100),
+                    'transaction_date': rng.choice(['2024-01-15', '2024-02-15'])
+                })
+
+    _run_threads(work, 4)
+
+    assert db.rebuild_monthly_rollups(repair=False)['mismatches'] == []
+
+
+def test_finance_backend_concurrent_updates_keep_rollups_consistent(finance_db):
+    for _ in range(5):
+        finance_db.add_transaction(USER_ID, 10.0, 'expense', 1, '', '2024-01-15')
+    ids = [t['id'] for t in finance_db.get_transactions_by_user(USER_ID)]
+
+    def work(seed):
+        rng = random.Random(seed)
+        for _ in range(100):
+            finance_db.update_transaction(rng.choice(ids), USER_ID, {
+                'amount': rng.randint(1, 100),
+                'transaction_date': rng.choice(['2024-01-15', '2024-02-15'])
+            })
+
+    _run_threads(work, 4)
+
+    assert finance_db.rebuild_monthly_rollups(repair=False)['mismatches'] == []
+
+
+def test_csv_import_reports_row_errors_and_updates_rollups(finance_db):
+    lines = ['Fecha,Tipo,Categoría,Monto,Descripción']
+    for i in range(250):
+        lines.append(f'2024-0{1 + i % 3}-10,gasto,Alimentación,{1 + i % 7},compra {i}')
+    lines.append('2024-01-10,gasto,Inexistente,5,x')
+    lines.append('2024-01-10,regalo,Alimentación,5,x')
+    lines.append(',gasto,Alimentación,5,x')
+    progress = []
+
+    result = finance_db.import_transactions_csv(
+        USER_ID, '\n'.join(lines), batch_size=100,
+        progress_callback=lambda processed, imported: progress.append(imported)
+    )
+
+    assert result['success'] is True
+    assert result['imported_count'] == 250
+    assert result['processed_count'] == 253
+    assert len(result['errors']) == 3
+    assert progress[:2] == [100, 200] and progress[-1] == 250
+    assert finance_db.rebuild_monthly_rollups(repair=False)['mismatches'] == []
+
+
+def test_csv_import_rejects_non_finite_amounts_per_row(finance_db):
+    csv_content = ('Fecha,Tipo,Categoría,Monto\n'
+                   '2024-01-10,gasto,Alimentación,5\n'
+                   '2024-01-10,gasto,Alimentación,nan\n'
+                   '2024-01-10,gasto,Alimentación,inf\n'
+                   '2024-01-11,gasto,Alimentación,7\n')
+
+    result = finance_db.import_transactions_csv(USER_ID, csv_content)
+
+    assert result['success'] is True
+    assert result['imported_count'] == 2
+    assert [error.split(':')[0] for error in result['errors']] == ['Fila 3', 'Fila 4']
+
+
+def test_rows_rejected_by_the_database_do_not_abort_the_import(finance_db, monkeypatch):
+    insert_batch = finance_db._insert_transaction_batch
+
+    def reject_null_amount(cursor, batch):
+        # Simula una fila que pasa la validación pero viola NOT NULL
+        insert_batch(cursor, [row[:1] + (None,) + row[2:] if row[1] == 6.0 else row for row in batch])
+
+    monkeypatch.setattr(finance_db, '_insert_transaction_batch', reject_null_amount)
+    lines = ['Fecha,Tipo,Categoría,Monto'] + [f'2024-01-10,gasto,Alimentación,{n}' for n in range(1, 11)]
+
+    result = finance_db.import_transactions_csv(USER_ID, '\n'.join(lines), batch_size=4)
+
+    assert result['success'] is True
+    assert result['imported_count'] == 9
+    assert len(result['errors']) == 1 and result['errors'][0].startswith('Fila 7')
+    assert finance_db.rebuild_monthly_rollups(repair=False)['mismatches'] == []
+
+
+def test_csv_import_is_all_or_nothing_on_database_errors(finance_db, monkeypatch):
+    insert_batch = finance_db._insert_transaction_batch
+    calls = []
+
+    def fail_on_second_batch(cursor, batch):
+        calls.append(len(batch))
+        if len(calls) == 2:
+            raise RuntimeError('disco lleno')
+        insert_batch(cursor, batch)
+
+    monkeypatch.setattr(finance_db, '_insert_transaction_batch', fail_on_second_batch)
+    lines = ['Fecha,Tipo,Categoría,Monto'] + ['2024-01-10,gasto,Alimentación,5'] * 20
+    result = finance_db.import_transactions_csv(USER_ID, '\n'.join(lines), batch_size=10)
+
+    assert result['success'] is False
+    assert finance_db.get_transactions_by_user(USER_ID) == []
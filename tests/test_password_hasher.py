@@ -0,0 +1,39 @@
+import time
+
+import pytest
+
+from password_hasher import PasswordHasher, HasherBusy
+
+
+@pytest.fixture
+def slow_hasher():
+    # Muchas iteraciones y un timeout corto: el cálculo no termina a tiempo
+    hasher = PasswordHasher(workers=1, max_pending=1, iterations=3000000, timeout=0.05)
+    yield hasher
+    hasher.shutdown()
+
+
+def test_timeout_is_reported_as_busy_and_keeps_the_slot(slow_hasher):
+    with pytest.raises(HasherBusy) as busy:
+        slow_hasher.hash('secreto')
+    assert busy.value.retry_after >= 1
+
+    # La plaza sigue ocupada mientras el proceso del pool termina el cálculo
+    with pytest.raises(HasherBusy):
+        slow_hasher.hash('otro')
+    assert slow_hasher.stats()['rejected'] == 1
+
+    deadline = time.monotonic() + 30
+    while slow_hasher.stats()['pending'] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert slow_hasher.stats()['pending'] == 0
+
+
+def test_pool_hash_and_verify_round_trip():
+    hasher = PasswordHasher(workers=1, iterations=1000)
+    try:
+        stored = hasher.hash('secreto')
+        assert hasher.verify(stored, 'secreto') is True
+        assert hasher.verify(stored, 'otro') is False
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,71 @@
+def _products(db, count):
+    return [db.create_product(f'Producto {i}', '', 1.0 + i, 10) for i in range(count)]
+
+
+def test_get_products_by_ids_returns_dict_keyed_by_id(db):
+    ids = _products(db, 30)
+
+    products = db.get_products_by_ids(ids + [999999])
+
+    assert set(products) == set(ids)
+    assert all(products[pid]['id'] == pid for pid in ids)
+    assert db.get_products_by_ids([]) == {}
+
+
+def test_get_products_by_ids_runs_a_single_query(db):
+    ids = _products(db, 30)
+    statements = []
+    with db.connection(readonly=True) as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            db.get_products_by_ids(ids, use_cache=False)
+        finally:
+            conn.set_trace_callback(None)
+
+    assert sum('FROM products' in sql for sql in statements) == 1
+
+
+def test_catalog_cache_sees_writes_from_other_instances(db):
+    from database import PortfolioDatabase
+
+    product_id = _products(db, 1)[0]
+    assert db.get_products_by_ids([product_id])[product_id]['price'] == 1.0
+
+    other = PortfolioDatabase(db.db_path)
+    other.update_product(product_id, price=7.5)
+
+    assert db.get_products_by_ids([product_id])[product_id]['price'] == 7.5
+    assert db.get_product_by_id(product_id)['price'] == 7.5
+
+
+def test_bulk_upsert_isolates_invalid_items(db):
+    results = db.bulk_upsert_products([
+        {'name': 'A', 'price': 1},
+        {'id': 1, 'name': None},
+        {'name': {'no': 'texto'}, 'price': 2},
+        {'name': 'B', 'price': 2},
+    ])
+
+    assert [r['status'] for r in results] == ['created', 'error', 'error', 'created']
+    assert sorted(p['name'] for p in db.get_products()) == ['A', 'B']
+
+
+def test_bulk_adjust_rejects_overdraw_without_touching_other_items(db):
+    ids = _products(db, 2)
+
+    results = db.bulk_adjust_products([{'id': ids[0], 'stock_delta': -20}, {'id': ids[1], 'stock_delta': -4}])
+
+    assert [r['status'] for r in results] == ['error', 'updated']
+    stock = {pid: p['stock'] for pid, p in db.get_products_by_ids(ids, use_cache=False).items()}
+    assert stock == {ids[0]: 10, ids[1]: 6}
+
+
+def test_bulk_update_reports_rows_without_id(db):
+    ids = _products(db, 2)
+
+    result = db.bulk_update_products([{'price': 3}, {'id': ids[0], 'price': 5}, {'id': ids[1], 'stock': 4}])
+
+    assert result['updated'] == 2
+    assert [(e['index'], e['status']) for e in result['errors']] == [(0, 'error')]
+    products = db.get_products_by_ids(ids, use_cache=False)
+    assert products[ids[0]]['price'] == 5 and products[ids[1]]['stock'] == 4